@@ -1,22 +1,159 @@
 
+import gc
+import hashlib
+import hmac
+import json
 import os
-from flask import Flask, request, jsonify, render_template
+import time
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
 from werkzeug.utils import secure_filename
-from pdfminer.high_level import extract_text  # For PDF extraction
-from fact_verification import verify_fact, detect_deepfake, evaluate_research_paper, verify_document
+import deadlines
+import llm_client
+import llm_scheduler
+import metrics
+from structured_logging import get_logger, new_request_id
+from uploads import buffer_upload
+from memory_stats import process_memory, worker_memory_report
+from pdf_extraction import PDFExtractionTimeout, extraction_stats, iter_pdf_pages, truncation_notice
+from jobs import job_queue, start_job_workers
+from frame_sequence import sequence_kind
+from resource_manager import Overloaded, admission_stats, apply_thread_budget, inference_admission
+from image_decode import decode_stats
+from fact_verification import verify_fact_detailed, claim_index_stats, claim_packing_stats, detect_deepfake, detect_deepfake_sequence, evaluate_research_paper, verify_document, extract_pdf_text, deepfake_batching_stats, deepfake_cache_stats, deepfake_backend_info, claim_cache_stats, invalidate_claim_cache, llm_configured, warmup_models, model_status, share_deepfake_weights, stream_evaluate_research_paper, stream_verify_document, verify_claims
 
 app = Flask(__name__)
+logger = get_logger("app")
 
-UPLOAD_FOLDER = 'uploads'
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Uploads are decoded straight from memory (spooled to an anonymous temp file
+# above UPLOAD_SPOOL_THRESHOLD), so nothing is written to an uploads folder.
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+# Admin endpoints require this token in the X-Admin-Token header; without it they
+# only answer requests from this host
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+# Upper bound on claims accepted by one /verify/batch request
+BATCH_VERIFY_MAX_CLAIMS = int(os.environ.get("BATCH_VERIFY_MAX_CLAIMS", "5000"))
+# A /jobs/<id>/events stream holds a web thread, so it ends after JOB_EVENTS_MAX_SECONDS
+# and the client reconnects (EventSource does so on its own, sending Last-Event-ID).
+# Updates from this process's job workers arrive at once; jobs run elsewhere are
+# re-read every JOB_EVENTS_POLL_SECONDS.
+JOB_EVENTS_MAX_SECONDS = float(os.environ.get("JOB_EVENTS_MAX_SECONDS", "25"))
+JOB_EVENTS_POLL_SECONDS = float(os.environ.get("JOB_EVENTS_POLL_SECONDS", "2"))
+# Model loading: "background" (default) warms models in a thread at startup,
+# "blocking" loads them before serving, "lazy" waits for the first request, and
+# "preload" (set by gunicorn.conf.py) loads the classifier in the gunicorn master
+# and shares its weights with the forked workers, which then warm the rest (Gemini)
+# in a background thread as in "background".
+MODEL_WARMUP = os.environ.get("MODEL_WARMUP", "background").lower()
+# Models each feature's routes need. /ready only waits for the features this process
+# serves (SERVED_FEATURES, comma-separated, default all) that are configured, so a
+# deployment without GEMINI_API_KEY can still serve /detect.
+FEATURE_MODELS = {
+    "fact_check": ("gemini",), # /verify, /verify/batch, /evaluate, /verify-document and their jobs
+    "deepfake_detection": ("deepfake", "deepfake_backend"), # /detect
+}
+SERVED_FEATURES = [name.strip() for name in os.environ.get("SERVED_FEATURES", ",".join(FEATURE_MODELS)).split(",") if name.strip()]
 
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Importing this module starts nothing: PDF extraction's spawn pool re-imports the
+# main module (app.py under "python app.py") in every child, and those children
+# must not warm models or claim jobs. Serving processes call these instead:
+# "python app.py" and the ASGI lifespan call start_serving(); gunicorn.conf.py calls
+# prepare_master() in a preloading master and start_serving() in each worker.
+
+def prepare_master():
+    """Load the classifier once in a preloading gunicorn master and share its weights with the workers."""
+    # Only the classifier: the Gemini client opens network channels, which must
+    # be created in each worker after the fork.
+    if share_deepfake_weights():
+        logger.info("Deepfake model weights loaded in master and moved to shared memory.")
+    # Keep the collector from touching (and so copying) the master's objects in workers
+    gc.freeze()
+
+
+def start_serving(workers=None):
+    """Per-process startup of a serving process: thread budget, model warmup and job worker threads."""
+    apply_thread_budget(workers=workers)
+    if MODEL_WARMUP == "blocking":
+        warmup_models()
+    elif MODEL_WARMUP in ("background", "preload"):
+        # Under preload, models the master already loaded are inherited and not loaded again
+        warmup_models(background=True)
+    start_job_workers()
+
+@app.before_request
+def start_request():
+    g.started = time.perf_counter()
+    g.request_id = new_request_id(request.headers.get("X-Request-ID"))
+    # Everything the request starts (pool threads, Gemini calls, PDF jobs) is bounded by this deadline
+    deadlines.begin(deadlines.request_budget(request.path, request.headers.get("X-Request-Timeout")))
+
+@app.after_request
+def finish_request(response):
+    response.headers["X-Request-ID"] = g.get("request_id", "")
+    started = g.get("started")
+    if started is not None:
+        # The rule, not the raw path, keeps label cardinality bounded
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        elapsed = time.perf_counter() - started
+        metrics.HTTP_REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, method=request.method)
+        metrics.HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        if endpoint != "/metrics":
+            logger.info("request", extra={"fields": {
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round(elapsed * 1000, 1),
+            }})
+    return response
+
+def _cache_metrics():
+    lookups = []
+    for name, stats in (("claims", claim_cache_stats()), ("deepfake", deepfake_cache_stats()), ("pdf_text", extraction_stats()["cache"])):
+        if not stats.get("enabled", True):
+            continue
+        for result, key in (("hit_memory", "hits_memory"), ("hit_disk", "hits_disk"), ("miss", "misses")):
+            lookups.append(({"cache": name, "result": result}, stats.get(key, 0)))
+    return [("app_cache_lookups_total", "counter", "Result cache lookups by outcome.", lookups)]
+
+def _llm_metrics():
+    stats = llm_scheduler.stats()
+    return [
+        ("app_llm_waiting", "gauge", "LLM calls waiting for rate-limit admission.", [({}, stats["waiting"])]),
+        ("app_llm_admitted_total", "counter", "LLM calls admitted by priority class.",
+         [({"priority": name}, count) for name, count in stats["admitted"].items()]),
+    ]
+
+metrics.register_collector(_cache_metrics)
+metrics.register_collector(_llm_metrics)
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/", methods=["GET", "POST", "HEAD", "OPTIONS"])
 def home():
     return render_template("index.html")
 
+def _feature_status(status):
+    """Returns: {feature: {'served', 'configured', 'ready', 'models'}}"""
+    configured = {"fact_check": llm_configured()}
+    return {
+        feature: {
+            "served": feature in SERVED_FEATURES,
+            "configured": configured.get(feature, True),
+            "ready": all(status.get(name, {}).get("state") == "ready" for name in names),
+            "models": list(names),
+        }
+        for feature, names in FEATURE_MODELS.items()
+    }
+
+@app.route("/ready", methods=["GET"])
+def readiness():
+    status = model_status()
+    features = _feature_status(status)
+    # An unconfigured feature (e.g. no GEMINI_API_KEY) is reported but never becomes ready, so it doesn't gate
+    ready = all(feature["ready"] for feature in features.values() if feature["served"] and feature["configured"])
+    return jsonify({"ready": ready, "features": features, "models": status}), 200 if ready else 503
+
 @app.route("/verify", methods=["POST"])
 def fact_check():
     try:
@@ -26,17 +163,43 @@ def fact_check():
         claim = data.get("claim", "")
         if not claim:
             return jsonify({"error": "No claim provided"}), 400
-        truth_score, explanation, sources = verify_fact(claim)
-        return jsonify({
+        result = verify_fact_detailed(claim)
+        response = {
             "type": "fact_check",
-            "truth_score": truth_score,
-            "explanation": explanation,
-            "sources": sources or []
-        })
+            "truth_score": result["truth_score"],
+            "explanation": result["explanation"],
+            "sources": result["sources"] or [],
+            "reused": result["reused_from"] is not None
+        }
+        if result["reused_from"]:
+            response["reused_from"] = result["reused_from"]
+        return jsonify(response), 504 if result["truth_score"] == "Timeout" else 200
     except Exception as e:
-        print(f"ERROR in /verify: {e}")
+        logger.exception(f"ERROR in /verify: {e}")
         return jsonify({"error": "An internal server error occurred during fact-checking."}), 500
 
+@app.route("/verify/batch", methods=["POST"])
+def fact_check_batch():
+    data = request.get_json(silent=True)
+    claims = data.get("claims") if isinstance(data, dict) else None
+    if not isinstance(claims, list) or not claims:
+        return jsonify({"error": "Request must be JSON with a non-empty 'claims' list."}), 400
+    if len(claims) > BATCH_VERIFY_MAX_CLAIMS:
+        return jsonify({"error": f"Too many claims in one request (max {BATCH_VERIFY_MAX_CLAIMS})."}), 400
+    if not all(isinstance(claim, str) and claim.strip() for claim in claims):
+        return jsonify({"error": "Every claim must be a non-empty string."}), 400
+
+    def lines():
+        try:
+            # One JSON object per line, written as soon as each claim finishes
+            for result in verify_claims(claims):
+                yield json.dumps(dict(result, type="fact_check")) + "\n"
+        except Exception as e:
+            logger.exception(f"ERROR in /verify/batch: {e}")
+            yield json.dumps({"error": "An internal server error occurred during batch fact-checking."}) + "\n"
+
+    return Response(stream_with_context(lines()), mimetype="application/x-ndjson")
+
 @app.route("/detect", methods=["POST"])
 def deepfake_detect():
     if "image" not in request.files:
@@ -46,33 +209,123 @@ def deepfake_detect():
         return jsonify({"error": "No file selected for upload"}), 400
     if file:
         filename = secure_filename(file.filename)
-        allowed_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.webp'}
+        allowed_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.zip'}
         _, ext = os.path.splitext(filename)
         if ext.lower() not in allowed_extensions:
-            return jsonify({"error": "Invalid file type. Please upload an image (png, jpg, jpeg, gif, webp)."}), 400
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            return jsonify({"error": "Invalid file type. Please upload an image (png, jpg, jpeg, gif, webp) or a zip of frames."}), 400
+        # mode=first scores only the first frame of an animation (the old behaviour)
+        mode = request.form.get("mode", "auto").lower()
+        try:
+            stride = int(request.form["stride"]) if request.form.get("stride") else None
+            max_frames = int(request.form["max_frames"]) if request.form.get("max_frames") else None
+        except ValueError:
+            return jsonify({"error": "'stride' and 'max_frames' must be integers."}), 400
+        upload = None
         try:
-            file.save(file_path)
-            result = detect_deepfake(file_path)
+            upload = buffer_upload(file)
+            kind = sequence_kind(upload)
+            if kind == "zip" and ext.lower() != ".zip" or kind != "zip" and ext.lower() == ".zip":
+                return jsonify({"error": "The file content does not match its extension."}), 400
+            clip = kind and (mode != "first" or kind == "zip")
+            # Admission covers classifier work only: cache hits are never shed or counted
+            if clip:
+                result = detect_deepfake_sequence(upload, stride=stride, max_frames=max_frames, admission=inference_admission)
+            else:
+                result = detect_deepfake(upload, admission=inference_admission)
             if result.get("error"):
-                print(f"Deepfake detection error for {filename}: {result.get('error')}")
+                logger.error(f"Deepfake detection error for {filename}: {result.get('error')}")
                 return jsonify({"error": result.get("error")}), 500
-            return jsonify({
+            response = {
                 "type": "deepfake_detection",
                 "real_score": result.get("real_score"),
-                "fake_score": result.get("fake_score")
-            })
+                "fake_score": result.get("fake_score"),
+                "cache_hit": result.get("cached", False),
+                "cache_match": result.get("cache_match")
+            }
+            if "frames" in result:
+                response["sequence"] = {
+                    key: result.get(key)
+                    for key in ("verdict", "frames_total", "frames_analyzed", "stride", "early_exit", "most_suspicious_frame", "frames")
+                }
+            return jsonify(response)
+        except Overloaded as overloaded:
+            logger.warning(f"Shedding /detect request: {overloaded}")
+            response = jsonify({"error": "The server is too busy to analyze this image in time. Please retry shortly."})
+            response.headers["Retry-After"] = str(overloaded.retry_after)
+            return response, 503
         except Exception as e:
-            print(f"Error processing image {filename}: {e}")
+            logger.error(f"Error processing image {filename}: {e}")
             return jsonify({"error": f"Could not process image: {str(e)}"}), 500
         finally:
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except OSError as remove_error:
-                    print(f"Error removing temp image file {file_path}: {remove_error}")
+            if upload is not None:
+                upload.close()
     return jsonify({"error": "Image file processing failed unexpectedly."}), 500
 
+@app.route("/detect/stats", methods=["GET"])
+def deepfake_detect_stats():
+    return jsonify({
+        "backend": deepfake_backend_info(),
+        "decode": decode_stats(),
+        "batching": deepfake_batching_stats(),
+        "cache": deepfake_cache_stats(),
+        "admission": admission_stats()
+    })
+
+def _admin_forbidden():
+    if ADMIN_TOKEN:
+        supplied = request.headers.get("X-Admin-Token", "")
+        if hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+            return None
+        return jsonify({"error": "Admin token missing or invalid."}), 403
+    if request.remote_addr in ("127.0.0.1", "::1"):
+        return None
+    return jsonify({"error": "Admin routes are restricted to localhost until ADMIN_TOKEN is set."}), 403
+
+@app.route("/admin/cache/stats", methods=["GET"])
+def admin_cache_stats():
+    forbidden = _admin_forbidden()
+    if forbidden:
+        return forbidden
+    return jsonify({
+        "claims": claim_cache_stats(),
+        "claim_index": claim_index_stats(),
+        "deepfake": deepfake_cache_stats(),
+        "pdf_extraction": extraction_stats()
+    })
+
+@app.route("/admin/cache/invalidate", methods=["POST"])
+def admin_cache_invalidate():
+    forbidden = _admin_forbidden()
+    if forbidden:
+        return forbidden
+    data = request.get_json(silent=True) or {}
+    claim = data.get("claim")
+    if claim is not None and not isinstance(claim, str):
+        return jsonify({"error": "'claim' must be a string."}), 400
+    removed = invalidate_claim_cache(claim)
+    return jsonify({
+        "cache": "claims",
+        "scope": "claim" if claim is not None else "all",
+        "removed": removed
+    })
+
+@app.route("/admin/llm/stats", methods=["GET"])
+def admin_llm_stats():
+    forbidden = _admin_forbidden()
+    if forbidden:
+        return forbidden
+    return jsonify({"scheduler": llm_scheduler.stats(), "async_client": llm_client.stats(), "claim_packing": claim_packing_stats()})
+
+@app.route("/admin/memory", methods=["GET"])
+def admin_memory():
+    forbidden = _admin_forbidden()
+    if forbidden:
+        return forbidden
+    report = {"worker": process_memory(), "preload": MODEL_WARMUP == "preload"}
+    if request.args.get("all") in ("1", "true"):
+        report["gunicorn"] = worker_memory_report()
+    return jsonify(report)
+
 @app.route("/evaluate", methods=["POST"])
 def detect_pdf():
     if "pdf" not in request.files:
@@ -82,24 +335,21 @@ def detect_pdf():
         return jsonify({"error": "No file selected for upload"}), 400
     if file and file.filename.lower().endswith('.pdf'):
         filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         extracted_text = None
         preview_text = ""
+        extraction = {}
         try:
-            file.save(file_path)
-            try:
-                extracted_text = extract_text(file_path)
-                if extracted_text:
-                    preview_text = extracted_text[:500] + ('...' if len(extracted_text) > 500 else '')
-            except Exception as extraction_error:
-                print(f"Error extracting text from PDF {filename}: {extraction_error}")
-                return jsonify({"error": "Could not extract text from PDF. It might be image-based, encrypted, or corrupted."}), 500
-            finally:
-                if os.path.exists(file_path):
-                    try:
-                        os.remove(file_path)
-                    except OSError as remove_error:
-                        print(f"Error removing temp PDF file {file_path}: {remove_error}")
+            with buffer_upload(file) as upload:
+                try:
+                    extracted_text = extract_pdf_text(upload, info=extraction)
+                    if extracted_text:
+                        preview_text = extracted_text[:500] + ('...' if len(extracted_text) > 500 else '')
+                except (PDFExtractionTimeout, deadlines.DeadlineExceeded) as timeout_error:
+                    logger.error(f"Timed out extracting text from PDF {filename}: {timeout_error}")
+                    return jsonify({"error": "Extracting text from the PDF took too long. Try a shorter document."}), 504
+                except Exception as extraction_error:
+                    logger.error(f"Error extracting text from PDF {filename}: {extraction_error}")
+                    return jsonify({"error": "Could not extract text from PDF. It might be image-based, encrypted, or corrupted."}), 500
             if not extracted_text or not extracted_text.strip():
                 return jsonify({"type": "evaluation", "preview": preview_text, "score_percent": "N/A", "justification": "No text could be extracted from the PDF."}), 200
             score_percent, justification = evaluate_research_paper(extracted_text)
@@ -107,19 +357,116 @@ def detect_pdf():
                 "type": "evaluation",
                 "preview": preview_text,
                 "score_percent": score_percent,
-                "justification": justification
-            })
+                "justification": justification,
+                **truncation_notice(extraction)
+            }), 504 if score_percent == "Timeout" else 200
         except Exception as e:
-            print(f"Unexpected error processing PDF {filename}: {e}")
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except OSError as remove_error:
-                    print(f"Error removing temp PDF file {file_path} on unexpected error: {remove_error}")
+            logger.error(f"Unexpected error processing PDF {filename}: {e}")
             return jsonify({"error": f"An unexpected error occurred processing the PDF: {str(e)}"}), 500
     else:
         return jsonify({"error": "Invalid file type. Please upload a PDF file."}), 400
 
+def _sse(event, data, event_id=None, retry_ms=None):
+    fields = f"id: {event_id}\n" if event_id is not None else ""
+    if retry_ms is not None:
+        fields += f"retry: {retry_ms}\n"
+    return f"{fields}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _sse_response(events):
+    response = Response(stream_with_context(events), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no" # Stop nginx-style proxies from buffering the stream
+    return response
+
+@app.route("/evaluate/stream", methods=["POST"])
+def detect_pdf_stream():
+    if "pdf" not in request.files:
+        return jsonify({"error": "No PDF file part in the request"}), 400
+    file = request.files["pdf"]
+    if file.filename == '':
+        return jsonify({"error": "No file selected for upload"}), 400
+    if not file.filename.lower().endswith('.pdf'):
+        return jsonify({"error": "Invalid file type. Please upload a PDF file."}), 400
+    filename = secure_filename(file.filename)
+    upload = buffer_upload(file)
+
+    def events():
+        started = time.perf_counter()
+        try:
+            # Sent before any slow work so the client gets its first byte right away
+            yield _sse("started", {"type": "evaluation"})
+            # Pages arrive in order as they are extracted; the preview goes out as
+            # soon as the first pages cover it instead of after the whole document.
+            pages = []
+            extracted_chars = 0
+            preview_sent = False
+            extraction = {}
+            try:
+                for page in iter_pdf_pages(upload, info=extraction):
+                    pages.append(page)
+                    extracted_chars += len(page)
+                    if not preview_sent and extracted_chars > 500:
+                        preview_sent = True
+                        partial = "".join(pages)
+                        yield _sse("preview", {"preview": partial[:500] + '...'})
+            except (PDFExtractionTimeout, deadlines.DeadlineExceeded) as timeout_error:
+                logger.error(f"Timed out extracting text from PDF {filename}: {timeout_error}")
+                yield _sse("error", {"error": "Extracting text from the PDF took too long. Try a shorter document."})
+                return
+            except Exception as extraction_error:
+                logger.error(f"Error extracting text from PDF {filename}: {extraction_error}")
+                yield _sse("error", {"error": "Could not extract text from PDF. It might be image-based, encrypted, or corrupted."})
+                return
+            finally:
+                upload.close()
+            extracted_text = "".join(pages)
+            extract_ms = round((time.perf_counter() - started) * 1000, 1)
+            if not preview_sent:
+                yield _sse("preview", {"preview": extracted_text})
+            if not extracted_text or not extracted_text.strip():
+                yield _sse("done", {"score_percent": "N/A", "justification": "No text could be extracted from the PDF.", "timings": {"extract_ms": extract_ms}})
+                return
+            for event, data in stream_evaluate_research_paper(extracted_text):
+                if event == "done":
+                    timings = data.setdefault("timings", {})
+                    timings["extract_ms"] = extract_ms
+                    timings["server_total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                    data.update(truncation_notice(extraction))
+                yield _sse(event, data)
+        except Exception as e:
+            logger.error(f"Unexpected error streaming PDF evaluation {filename}: {e}")
+            yield _sse("error", {"error": f"An unexpected error occurred processing the PDF: {str(e)}"})
+
+    return _sse_response(events())
+
+@app.route("/verify-document/stream", methods=["POST"])
+def document_verification_stream():
+    if "document" not in request.files:
+        return jsonify({"error": "No document uploaded"}), 400
+    file = request.files["document"]
+    if file.filename == '':
+        return jsonify({"error": "No file selected for upload"}), 400
+    if not file.filename.lower().endswith('.pdf'):
+        return jsonify({"error": "Invalid file type. Only PDF files are supported for verification."}), 400
+    filename = secure_filename(file.filename)
+    upload = buffer_upload(file)
+
+    def events():
+        started = time.perf_counter()
+        try:
+            yield _sse("started", {"type": "document_verification"})
+            for event, data in stream_verify_document(upload):
+                if event == "done":
+                    data.setdefault("timings", {})["server_total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                yield _sse(event, data)
+        except Exception as e:
+            logger.error(f"Error streaming document verification {filename}: {e}")
+            yield _sse("error", {"error": f"Error verifying document: {str(e)}"})
+        finally:
+            upload.close()
+
+    return _sse_response(events())
+
 @app.route("/verify-document", methods=["POST"])
 def document_verification():
     if "document" not in request.files:
@@ -129,20 +476,97 @@ def document_verification():
         return jsonify({"error": "No file selected for upload"}), 400
     if file and file.filename.lower().endswith('.pdf'):
         filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         try:
-            file.save(file_path)
-            result = verify_document(file_path)
-            return jsonify(result)
+            with buffer_upload(file) as upload:
+                result = verify_document(upload)
+            return jsonify(result), 504 if result.get("verification_status") == "Timeout" else 200
         except Exception as e:
-            print(f"Error verifying document {filename}: {e}")
+            logger.error(f"Error verifying document {filename}: {e}")
             return jsonify({"error": f"Error verifying document: {str(e)}"}), 500
-        finally:
-            if os.path.exists(file_path):
-                os.remove(file_path)
     else:
         return jsonify({"error": "Invalid file type. Only PDF files are supported for verification."}), 400
 
+# --- Job mode ---
+# The upload is queued and a job id returned at once; clients poll /jobs/<id> (or
+# subscribe to /jobs/<id>/events) so no web request outlives the proxy timeout.
+# The event stream ends after JOB_EVENTS_MAX_SECONDS with a "reconnect" event;
+# clients close it themselves after "done".
+JOB_UPLOAD_FIELDS = {"evaluate": "pdf", "verify-document": "document"}
+
+@app.route("/jobs/<kind>", methods=["POST"])
+def submit_job(kind):
+    field = JOB_UPLOAD_FIELDS.get(kind)
+    if field is None:
+        return jsonify({"error": f"Unknown job type '{kind}'."}), 404
+    if field not in request.files:
+        return jsonify({"error": f"No '{field}' file part in the request"}), 400
+    file = request.files[field]
+    if file.filename == '':
+        return jsonify({"error": "No file selected for upload"}), 400
+    if not file.filename.lower().endswith('.pdf'):
+        return jsonify({"error": "Invalid file type. Please upload a PDF file."}), 400
+    filename = secure_filename(file.filename)
+    try:
+        with buffer_upload(file) as upload:
+            job_id = job_queue.submit(kind, upload.read_bytes(), {"filename": filename, "request_id": g.get("request_id")})
+    except Exception as e:
+        logger.error(f"Could not queue {kind} job for {filename}: {e}")
+        return jsonify({"error": "Could not queue the job. Please try again."}), 500
+    logger.info(f"Queued {kind} job {job_id} for {filename}")
+    response = jsonify({"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}", "events_url": f"/jobs/{job_id}/events"})
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return response, 202
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found. It may have expired."}), 404
+    return jsonify(job)
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    if job_queue.get(job_id) is None:
+        return jsonify({"error": "Job not found. It may have expired."}), 404
+
+    # Event ids identify the job state sent, so a reconnect skips a state the client already has
+    last = request.headers.get("Last-Event-ID")
+
+    def events():
+        seen = last
+        stop_at = time.monotonic() + JOB_EVENTS_MAX_SECONDS
+        version = job_queue.update_version()
+        while True:
+            job = job_queue.get(job_id)
+            if job is None:
+                yield _sse("error", {"error": "Job not found. It may have expired."})
+                return
+            state = {key: job.get(key) for key in ("status", "progress", "message", "queue_position", "partial")}
+            state_id = hashlib.sha1(json.dumps(state, sort_keys=True).encode()).hexdigest()[:16]
+            if job["status"] in ("succeeded", "failed"):
+                yield _sse("done", job, event_id=state_id)
+                return
+            if state_id != seen:
+                seen = state_id
+                yield _sse("progress", state, event_id=state_id)
+            remaining = stop_at - time.monotonic()
+            if remaining <= 0:
+                yield _sse("reconnect", {"status": job["status"]}, event_id=seen, retry_ms=1000)
+                return
+            version = job_queue.wait_for_update(version, min(remaining, JOB_EVENTS_POLL_SECONDS))
+
+    return _sse_response(events())
+
+@app.route("/admin/jobs/stats", methods=["GET"])
+def admin_job_stats():
+    forbidden = _admin_forbidden()
+    if forbidden:
+        return forbidden
+    return jsonify(job_queue.stats())
+
 if __name__ == "__main__":
-    print("Starting Flask development server...")
+    # With debug=True the reloader runs this file twice; only its child serves
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_serving()
+    logger.info("Starting Flask development server...")
     app.run(debug=True, host='0.0.0.0', port=int(os.environ.get("PORT", 10000)))
@@ -0,0 +1,229 @@
+# asgi.py
+#
+# ASGI serving mode:   WEB_CONCURRENCY=2 uvicorn asgi:asgi_app --port 10000
+#
+# Set the worker count with WEB_CONCURRENCY rather than --workers: uvicorn takes
+# its default --workers from it, and each worker reads it to size its PyTorch
+# thread pools to cores // workers (a --workers flag is invisible to the app).
+#
+# The LLM-bound routes (/verify, /evaluate, /verify-document) are served natively
+# here with the async functions from fact_verification, so a worker does not sit
+# blocked on a Gemini round trip and one process can keep many calls in flight
+# (bounded by LLM_MAX_CONCURRENCY). Every other route is passed through to the
+# Flask app unchanged. The native routes get the same request id (X-Request-ID),
+# request log line and HTTP metrics as the Flask ones.
+
+import asyncio
+import io
+import json
+import os
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.formparser import parse_form_data
+from werkzeug.utils import secure_filename
+
+import deadlines
+import metrics
+from app import app, start_serving
+from pdf_extraction import PDFExtractionTimeout, truncation_notice
+from structured_logging import get_logger, new_request_id
+from uploads import buffer_upload
+from fact_verification import (
+    verify_fact_detailed_async, evaluate_research_paper_async, verify_document_async, extract_pdf_text
+)
+
+logger = get_logger("asgi")
+_wsgi_fallback = WsgiToAsgi(app)
+
+
+def _worker_count():
+    """Returns: WEB_CONCURRENCY as an int, or None (with a warning) when it is not set"""
+    if os.environ.get("WEB_CONCURRENCY"):
+        return int(os.environ["WEB_CONCURRENCY"])
+    if not os.environ.get("TORCH_INTRA_OP_THREADS"):
+        logger.warning("WEB_CONCURRENCY is not set, so this worker assumes it is the only one and sizes its "
+                       "inference threads to every core; with --workers N, set WEB_CONCURRENCY=N instead.")
+    return None
+
+
+async def _read_body(receive, limit):
+    """Read the full request body. Returns None if it exceeds limit bytes."""
+    chunks = []
+    size = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if limit and size > limit:
+            return None
+        chunks.append(chunk)
+        more_body = message.get("more_body", False)
+    return b"".join(chunks)
+
+
+async def _send_json(send, payload, status=200):
+    body = json.dumps(payload).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def _header(scope, name):
+    for key, value in scope.get("headers", []):
+        if key.decode("latin-1").lower() == name:
+            return value.decode("latin-1")
+    return ""
+
+
+def _parse_files(scope, body):
+    """Parse a multipart body with werkzeug. Returns the files MultiDict."""
+    environ = {
+        "REQUEST_METHOD": "POST",
+        "CONTENT_TYPE": _header(scope, "content-type"),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.input": io.BytesIO(body),
+    }
+    _, _, files = parse_form_data(environ)
+    return files
+
+
+async def _verify(scope, body, send):
+    try:
+        try:
+            data = json.loads(body or b"null")
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or "claim" not in data:
+            return await _send_json(send, {"error": "Request must be JSON with a 'claim' field."}, 400)
+        claim = data.get("claim", "")
+        if not claim:
+            return await _send_json(send, {"error": "No claim provided"}, 400)
+        result = await verify_fact_detailed_async(claim)
+        response = {
+            "type": "fact_check",
+            "truth_score": result["truth_score"],
+            "explanation": result["explanation"],
+            "sources": result["sources"] or [],
+            "reused": result["reused_from"] is not None
+        }
+        if result["reused_from"]:
+            response["reused_from"] = result["reused_from"]
+        await _send_json(send, response, 504 if result["truth_score"] == "Timeout" else 200)
+    except Exception as e:
+        logger.error(f"Error in async /verify: {e}")
+        await _send_json(send, {"error": "An internal server error occurred during fact-checking."}, 500)
+
+
+async def _evaluate(scope, body, send):
+    files = _parse_files(scope, body)
+    if "pdf" not in files:
+        return await _send_json(send, {"error": "No PDF file part in the request"}, 400)
+    file = files["pdf"]
+    if file.filename == '':
+        return await _send_json(send, {"error": "No file selected for upload"}, 400)
+    if not file.filename.lower().endswith('.pdf'):
+        return await _send_json(send, {"error": "Invalid file type. Please upload a PDF file."}, 400)
+    filename = secure_filename(file.filename)
+    preview_text = ""
+    extraction = {}
+    try:
+        with buffer_upload(file) as upload:
+            try:
+                extracted_text = await asyncio.to_thread(extract_pdf_text, upload, extraction)
+                if extracted_text:
+                    preview_text = extracted_text[:500] + ('...' if len(extracted_text) > 500 else '')
+            except (PDFExtractionTimeout, deadlines.DeadlineExceeded) as timeout_error:
+                logger.error(f"Timed out extracting text from PDF {filename}: {timeout_error}")
+                return await _send_json(send, {"error": "Extracting text from the PDF took too long. Try a shorter document."}, 504)
+            except Exception as extraction_error:
+                logger.error(f"Error extracting text from PDF {filename}: {extraction_error}")
+                return await _send_json(send, {"error": "Could not extract text from PDF. It might be image-based, encrypted, or corrupted."}, 500)
+        if not extracted_text or not extracted_text.strip():
+            return await _send_json(send, {"type": "evaluation", "preview": preview_text, "score_percent": "N/A", "justification": "No text could be extracted from the PDF."})
+        score_percent, justification = await evaluate_research_paper_async(extracted_text)
+        await _send_json(send, {
+            "type": "evaluation",
+            "preview": preview_text,
+            "score_percent": score_percent,
+            "justification": justification,
+            **truncation_notice(extraction)
+        }, 504 if score_percent == "Timeout" else 200)
+    except Exception as e:
+        logger.error(f"Unexpected error processing PDF {filename}: {e}")
+        await _send_json(send, {"error": f"An unexpected error occurred processing the PDF: {str(e)}"}, 500)
+
+
+async def _verify_document(scope, body, send):
+    files = _parse_files(scope, body)
+    if "document" not in files:
+        return await _send_json(send, {"error": "No document uploaded"}, 400)
+    file = files["document"]
+    if file.filename == '':
+        return await _send_json(send, {"error": "No file selected for upload"}, 400)
+    if not file.filename.lower().endswith('.pdf'):
+        return await _send_json(send, {"error": "Invalid file type. Only PDF files are supported for verification."}, 400)
+    filename = secure_filename(file.filename)
+    try:
+        with buffer_upload(file) as upload:
+            result = await verify_document_async(upload)
+        await _send_json(send, result, 504 if result.get("verification_status") == "Timeout" else 200)
+    except Exception as e:
+        logger.error(f"Error verifying document {filename}: {e}")
+        await _send_json(send, {"error": f"Error verifying document: {str(e)}"}, 500)
+
+
+ASYNC_ROUTES = {
+    "/verify": _verify,
+    "/evaluate": _evaluate,
+    "/verify-document": _verify_document,
+}
+
+
+async def asgi_app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # Per worker process; importing app starts nothing by itself
+                start_serving(workers=_worker_count())
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    handler = ASYNC_ROUTES.get(scope.get("path")) if scope["type"] == "http" else None
+    if handler is None or scope.get("method") != "POST":
+        return await _wsgi_fallback(scope, receive, send)
+
+    # Each request runs in its own task, so the request id and deadline contextvars are per request
+    started = time.perf_counter()
+    request_id = new_request_id(_header(scope, "x-request-id"))
+    status = {"code": 500}
+
+    async def send_tagged(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+            message = dict(message, headers=list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())])
+        await send(message)
+
+    try:
+        body = await _read_body(receive, app.config.get("MAX_CONTENT_LENGTH"))
+        if body is None:
+            return await _send_json(send_tagged, {"error": "Request body too large."}, 413)
+        deadlines.begin(deadlines.request_budget(scope["path"], _header(scope, "x-request-timeout")))
+        await handler(scope, body, send_tagged)
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.HTTP_REQUEST_SECONDS.observe(elapsed, endpoint=scope["path"], method="POST")
+        metrics.HTTP_REQUESTS.inc(endpoint=scope["path"], method="POST", status=status["code"])
+        logger.info("request", extra={"fields": {
+            "method": "POST",
+            "path": scope["path"],
+            "status": status["code"],
+            "duration_ms": round(elapsed * 1000, 1),
+        }})
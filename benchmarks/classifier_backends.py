@@ -0,0 +1,86 @@
+# benchmarks/classifier_backends.py
+#
+# Parity check and CPU benchmark for the deepfake classifier backends
+# (eager, int8, compile, onnx). Every backend is scored against eager FP32 on the
+# same synthetic images; a backend fails parity when any score differs by more
+# than --tolerance percentage points. Reports single-image latency and batched
+# images/sec per backend.
+#
+#   python benchmarks/classifier_backends.py [--backends eager,int8,onnx,compile] [--images 32]
+#                                            [--batch-size 16] [--tolerance 1.0] [--output backends.json]
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deepfake_backends import BACKENDS, EagerBackend, build_backend, check_parity, time_backend  # noqa: E402
+
+
+def synthetic_images(count, size=256, seed=0):
+    """Noise-plus-gradient RGB images so parity is not checked on flat inputs only."""
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    ramp = np.linspace(0, 255, size, dtype=np.float32)
+    images = []
+    for _ in range(count):
+        noise = rng.normal(0, 40, (size, size, 3))
+        base = np.stack([ramp[None, :].repeat(size, 0), ramp[:, None].repeat(size, 1), rng.uniform(0, 255) * np.ones((size, size))], axis=-1)
+        images.append(Image.fromarray(np.clip(base + noise, 0, 255).astype("uint8"), "RGB"))
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check parity and benchmark deepfake inference backends on CPU.")
+    parser.add_argument("--model", default=os.getenv("DEEPFAKE_MODEL", "Hemg/Deepfake-image"))
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="Comma-separated backends to compare")
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=1.0, help="Max score difference vs eager, in percentage points")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    from transformers import AutoModelForImageClassification, AutoProcessor
+    processor = AutoProcessor.from_pretrained(args.model)
+    model = AutoModelForImageClassification.from_pretrained(args.model).eval()
+
+    images = synthetic_images(args.images)
+    single = processor(images=images[:1], return_tensors="pt")
+    batch = processor(images=images[:args.batch_size], return_tensors="pt")
+    parity_inputs = processor(images=images, return_tensors="pt")
+    reference = EagerBackend(model)
+
+    report = {"model": args.model, "images": args.images, "batch_size": args.batch_size, "tolerance": args.tolerance, "backends": {}}
+    for name in [n.strip() for n in args.backends.split(",") if n.strip()]:
+        entry = {}
+        try:
+            started = time.perf_counter()
+            backend = build_backend(name, model, processor, args.model)
+            entry["build_seconds"] = round(time.perf_counter() - started, 2)
+            entry["parity"] = check_parity(reference, backend, parity_inputs, args.tolerance)
+            entry["latency_ms"] = round(time_backend(backend, single, repeats=args.repeats) * 1000, 2)
+            batch_seconds = time_backend(backend, batch, repeats=args.repeats)
+            entry["batch_ms"] = round(batch_seconds * 1000, 2)
+            entry["images_per_second"] = round(len(batch["pixel_values"]) / batch_seconds, 1)
+        except Exception as e:
+            entry["error"] = f"{type(e).__name__}: {e}"
+        report["backends"][name] = entry
+        print(f"{name}: {json.dumps(entry)}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    failed = [name for name, entry in report["backends"].items() if not entry.get("parity", {}).get("ok")]
+    if failed:
+        print(f"Parity check failed or errored for: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# benchmarks/decode_preprocess.py
+#
+# Per-image decode and preprocessing time and peak RSS for the full-resolution
+# path (Image.open().convert("RGB") + the Hugging Face processor) against the
+# reduced-resolution path (draft-mode decode + early thumbnail + batched NumPy
+# preprocessing). Each mode runs in a fresh Python process so its peak RSS is its
+# own. A third process checks parity: the fast path's pixel_values and the
+# model's output probabilities against the full-resolution path on the same
+# files (max absolute difference). Preprocessing and parity need numpy, torch
+# and transformers; without them only the decode step is measured.
+#
+#   python benchmarks/decode_preprocess.py [--sizes 1920x1080,6000x4000,8000x5000] [--formats JPEG,PNG]
+#                                          [--images 8] [--model Hemg/Deepfake-image] [--output decode.json]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from standins import repo_root, synthetic_image
+
+REPO_ROOT = repo_root()
+
+MODES = ("full", "fast")
+
+# Runs in the child process: decode (and preprocess) every file, report timings and memory
+CHILD = """
+import io, json, os, sys, time
+sys.path.insert(0, {repo!r})
+os.environ["DEEPFAKE_FAST_DECODE"] = "1" if {mode!r} == "fast" else "0"
+from PIL import Image
+import image_decode
+
+def status_kb(field):
+    # VmHWM rather than ru_maxrss, which Linux carries over from the parent across exec
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+processor = None
+if {model!r}:
+    try:
+        from transformers import AutoProcessor
+        processor = AutoProcessor.from_pretrained({model!r})
+    except Exception as e:
+        print(f"Preprocessing skipped: {{e}}", file=sys.stderr)
+size = image_decode.target_size(processor)
+paths = {paths!r}
+payloads = [open(path, "rb").read() for path in paths]
+baseline = status_kb("VmRSS")
+decode_s, resize_s, preprocess_s, images = [], [], [], []
+for payload in payloads:
+    started = time.perf_counter()
+    if {mode!r} == "fast":
+        image = image_decode.decode_image(io.BytesIO(payload), size)
+    else:
+        image = Image.open(io.BytesIO(payload)).convert("RGB")
+    decode_s.append(time.perf_counter() - started)
+    # The resize to model size that preprocessing does either way, timed on its own
+    started = time.perf_counter()
+    image.resize(size, Image.BILINEAR)
+    resize_s.append(time.perf_counter() - started)
+    images.append(image)
+    if processor is not None:
+        started = time.perf_counter()
+        image_decode.preprocess_batch([image], processor)
+        preprocess_s.append(time.perf_counter() - started)
+batch_s = None
+if processor is not None:
+    started = time.perf_counter()
+    image_decode.preprocess_batch(images, processor)
+    batch_s = time.perf_counter() - started
+peak = status_kb("VmHWM")
+print(json.dumps({{
+    "decode_ms": sum(decode_s) / len(decode_s) * 1000,
+    "resize_to_model_ms": sum(resize_s) / len(resize_s) * 1000,
+    "preprocess_ms": sum(preprocess_s) / len(preprocess_s) * 1000 if preprocess_s else None,
+    "batch_preprocess_ms_per_image": batch_s / len(images) * 1000 if batch_s is not None else None,
+    "decoded_size": list(images[0].size),
+    "baseline_rss_mb": baseline / 1024,
+    "peak_rss_mb": peak / 1024,
+}}))
+"""
+
+# Runs in the child process: both paths on the same files, in one process so they share the model
+PARITY_CHILD = """
+import io, json, sys
+sys.path.insert(0, {repo!r})
+import torch
+from PIL import Image
+from transformers import AutoModelForImageClassification, AutoProcessor
+import image_decode
+
+image_decode.DEEPFAKE_FAST_DECODE = True
+processor = AutoProcessor.from_pretrained({model!r})
+try:
+    model = AutoModelForImageClassification.from_pretrained({model!r}).eval()
+except Exception as e:
+    model = None
+    print(f"Probability parity skipped: {{e}}", file=sys.stderr)
+size = image_decode.target_size(processor)
+pixel_diff, probability_diff = 0.0, None
+for path in {paths!r}:
+    payload = open(path, "rb").read()
+    reference = processor(images=[Image.open(io.BytesIO(payload)).convert("RGB")], return_tensors="pt")["pixel_values"]
+    fast = image_decode.preprocess_batch([image_decode.decode_image(io.BytesIO(payload), size)], processor)["pixel_values"]
+    pixel_diff = max(pixel_diff, (reference - fast).abs().max().item())
+    if model is not None:
+        with torch.no_grad():
+            probabilities = [torch.softmax(model(pixel_values=values).logits, dim=-1) for values in (reference, fast)]
+        probability_diff = max(probability_diff or 0.0, (probabilities[0] - probabilities[1]).abs().max().item())
+print(json.dumps({{"pixel_values_max_abs_diff": pixel_diff, "probability_max_abs_diff": probability_diff}}))
+"""
+
+
+def run_child(code):
+    completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=REPO_ROOT)
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"}
+    if completed.stderr.strip():
+        print(completed.stderr.strip(), file=sys.stderr)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def check_parity(paths, model):
+    if not model:
+        return {"error": "no processor (--model '')"}
+    result = run_child(PARITY_CHILD.format(repo=REPO_ROOT, model=model, paths=paths))
+    return {key: round(value, 6) if isinstance(value, float) else value for key, value in result.items()}
+
+
+def run_mode(mode, paths, model):
+    result = run_child(CHILD.format(repo=REPO_ROOT, mode=mode, model=model, paths=paths))
+    if "error" in result:
+        return result
+    result["peak_over_baseline_mb"] = result["peak_rss_mb"] - result["baseline_rss_mb"]
+    return {key: round(value, 2) if isinstance(value, float) else value for key, value in result.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full-resolution and reduced-resolution image decode + preprocessing, and check their parity.")
+    parser.add_argument("--sizes", default="1920x1080,6000x4000,8000x5000", help="Comma-separated WIDTHxHEIGHT list")
+    parser.add_argument("--formats", default="JPEG,PNG")
+    parser.add_argument("--images", type=int, default=8, help="Images per size and format")
+    parser.add_argument("--model", default=os.getenv("DEEPFAKE_MODEL", "Hemg/Deepfake-image"), help="Processor to preprocess with ('' for decode only)")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {"images": args.images, "model": args.model, "cases": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in [f.strip().upper() for f in args.formats.split(",") if f.strip()]:
+            for size in [s.strip() for s in args.sizes.split(",") if s.strip()]:
+                width, height = (int(v) for v in size.lower().split("x"))
+                paths = []
+                for i in range(args.images):
+                    path = os.path.join(tmp, f"{fmt}_{width}x{height}_{i}.{fmt.lower()}")
+                    with open(path, "wb") as f:
+                        f.write(synthetic_image(width, height, fmt=fmt, seed=i))
+                    paths.append(path)
+                case = {"format": fmt, "size": size, "file_kb": round(sum(os.path.getsize(p) for p in paths) / len(paths) / 1024, 1)}
+                for mode in MODES:
+                    case[mode] = run_mode(mode, paths, args.model)
+                if "error" not in case["full"] and "error" not in case["fast"]:
+                    full_ms = case["full"]["decode_ms"] + case["full"]["resize_to_model_ms"]
+                    fast_ms = case["fast"]["decode_ms"] + case["fast"]["resize_to_model_ms"]
+                    case["decode_resize_speedup"] = round(full_ms / max(fast_ms, 1e-6), 1)
+                case["parity"] = check_parity(paths, args.model)
+                report["cases"].append(case)
+                print(json.dumps(case))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
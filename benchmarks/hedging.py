@@ -0,0 +1,121 @@
+# benchmarks/hedging.py
+#
+# Tail latency of /verify-style fact checks with and without hedged Gemini
+# requests. Sends --requests unique claims through verify_fact_detailed at
+# --concurrency, each under a --deadline request timeout, against a stand-in
+# Gemini where --tail-rate of the calls take --tail-factor times as long. Runs
+# once with LLM_HEDGE=0 and once with LLM_HEDGE=1, each in a fresh process (the
+# scheduler reads its configuration at import), and reports p50/p95/p99 latency,
+# requests that ended in a Timeout, Gemini calls per request, and how many hedges
+# were sent and won.
+#
+#   python benchmarks/hedging.py [--requests 400] [--concurrency 16] [--llm-latency 0.3]
+#                                [--tail-rate 0.05] [--tail-factor 10] [--deadline 2.5]
+#                                [--hedge-percentile 95] [--hedge-max-ratio 0.1] [--output hedging.json]
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+
+from standins import repo_root
+
+REPO_ROOT = repo_root()
+
+MODES = ("off", "on")
+
+CHILD = """
+import json, os, sys, time
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, {repo!r})
+sys.path.insert(0, os.path.join({repo!r}, "benchmarks"))
+os.environ.update(MODEL_WARMUP="lazy", CLAIM_CACHE="0", CLAIM_INDEX="0", LLM_RPM="0", LLM_TPM="0",
+                  LLM_HEDGE="1" if {mode!r} == "on" else "0", LLM_HEDGE_PERCENTILE=str({percentile!r}),
+                  LLM_HEDGE_MAX_RATIO=str({max_ratio!r}), LLM_HEDGE_MIN_SAMPLES="20")
+from standins import StandInLLM, install_standins
+import fact_verification
+import llm_scheduler
+
+def one(index):
+    started = time.perf_counter()
+    result = fact_verification.verify_fact_detailed(f"Benchmark claim {{index}}: sample {{index % 97}} measured {{index * 7 % 101}} units.",
+                                                    timeout={deadline!r})
+    return time.perf_counter() - started, result["truth_score"]
+
+def main():
+    llm = StandInLLM(latency={latency!r}, jitter={latency!r} * 0.2, tail_rate={tail_rate!r}, tail_factor={tail_factor!r})
+    install_standins(llm=llm)
+    started = time.perf_counter()
+    with ThreadPoolExecutor({concurrency!r}) as pool:
+        results = list(pool.map(one, range({requests!r})))
+    wall = time.perf_counter() - started
+    stats = llm_scheduler.stats()
+    print(json.dumps({{
+        "latencies": [seconds for seconds, _ in results],
+        "timeouts": sum(1 for _, score in results if score == "Timeout"),
+        "errors": sum(1 for _, score in results if score in ("Error", "N/A")),
+        "wall_seconds": wall,
+        "llm_calls": llm.calls,
+        "hedges": stats["hedging"]["hedges"],
+        "hedge_wins": stats["hedging"]["hedge_wins"],
+        "call_timeouts": stats["call_timeouts"],
+    }}))
+
+main()
+"""
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_mode(mode, args):
+    code = CHILD.format(repo=REPO_ROOT, mode=mode, requests=args.requests, concurrency=args.concurrency,
+                        latency=args.llm_latency, tail_rate=args.tail_rate, tail_factor=args.tail_factor,
+                        deadline=args.deadline, percentile=args.hedge_percentile, max_ratio=args.hedge_max_ratio)
+    with tempfile.TemporaryDirectory() as workdir:
+        completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=workdir)
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"}
+    raw = json.loads(completed.stdout.strip().splitlines()[-1])
+    latencies = raw.pop("latencies")
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1),
+        "requests_per_second": round(len(latencies) / raw["wall_seconds"], 1),
+        "llm_calls_per_request": round(raw["llm_calls"] / len(latencies), 3),
+        "hedge_rate": round(raw["hedges"] / len(latencies), 3),
+        **{key: raw[key] for key in ("timeouts", "errors", "hedges", "hedge_wins", "call_timeouts")},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fact-check tail latency with and without hedged Gemini requests.")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Stand-in Gemini latency per call (seconds)")
+    parser.add_argument("--tail-rate", type=float, default=0.05, help="Share of stand-in calls that are slow")
+    parser.add_argument("--tail-factor", type=float, default=10.0, help="How many times longer a slow call takes")
+    parser.add_argument("--deadline", type=float, default=2.5, help="Per-request timeout (seconds)")
+    parser.add_argument("--hedge-percentile", type=float, default=95)
+    parser.add_argument("--hedge-max-ratio", type=float, default=0.1)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {"config": {key: value for key, value in vars(args).items() if key != "output"}, "runs": {}}
+    for mode in MODES:
+        report["runs"][mode] = run_mode(mode, args)
+        print(f"hedging {mode}: {json.dumps(report['runs'][mode])}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+# benchmarks/load_shedding.py
+#
+# Open-loop overload test for /detect with and without the admission controller,
+# served by gunicorn with the shipped gunicorn.conf.py. Requests arrive as a
+# Poisson process at --rate per second for --duration seconds (no client
+# back-pressure, like real traffic during a spike), each a random-noise JPEG
+# posted over HTTP and scored by the stand-in classifier. Runs once with
+# LOAD_SHEDDING=0 and once with LOAD_SHEDDING=1, each against a fresh server, and
+# reports goodput (200 responses within the SLO per second), p50/p99 latency of
+# the 200s, late answers, shed requests and how fast the 503s came back.
+# --threads overrides GUNICORN_THREADS (default: whatever gunicorn.conf.py ships),
+# e.g. --threads 4 shows requests queueing in gunicorn where the controller can't see them.
+#
+#   python benchmarks/load_shedding.py [--rate 150] [--duration 20] [--slo-ms 1000] [--workers 2]
+#                                      [--threads N] [--classifier-latency 0.02] [--per-image 0.01]
+#                                      [--batch-size 16] [--output shedding.json]
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from standins import repo_root, synthetic_image
+
+REPO_ROOT = repo_root()
+
+MODES = ("off", "on")
+
+# Imported by gunicorn (in the preloading master, or in each worker) in place of app:app
+SERVER_APP = """
+from standins import StandInClassifier, install_standins
+install_standins(classifier=StandInClassifier(latency={latency!r}, per_image={per_image!r}))
+from app import app
+"""
+
+BOUNDARY = "loadshedding"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def multipart(image, filename):
+    return (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"image\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: image/jpeg\r\n\r\n".encode() + image + f"\r\n--{BOUNDARY}--\r\n".encode()
+    )
+
+
+def post_detect(port, body, timeout=60):
+    """Returns: (status, Retry-After header or None)"""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        conn.request("POST", "/detect", body=body, headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"})
+        response = conn.getresponse()
+        response.read()
+        return response.status, response.getheader("Retry-After")
+    finally:
+        conn.close()
+
+
+def wait_until_serving(port, server, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {server.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not start in time")
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000, 1)
+
+
+def run_mode(mode, args, bodies):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, "loadtest_app.py"), "w") as f:
+            f.write(SERVER_APP.format(latency=args.classifier_latency, per_image=args.per_image))
+        env = dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join(filter(None, [workdir, REPO_ROOT, os.path.join(REPO_ROOT, "benchmarks"), os.environ.get("PYTHONPATH")])),
+            PORT=str(port),
+            WEB_CONCURRENCY=str(args.workers),
+            LOAD_SHEDDING="1" if mode == "on" else "0",
+            INFERENCE_SLO_MS=str(args.slo_ms),
+            DEEPFAKE_BATCH_MAX_SIZE=str(args.batch_size),
+            DEEPFAKE_CACHE="0",
+            JOB_WORKERS="0",
+            LOG_LEVEL="ERROR",
+        )
+        if args.threads:
+            env["GUNICORN_THREADS"] = str(args.threads)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", os.path.join(REPO_ROOT, "gunicorn.conf.py"), "--log-level", "error", "loadtest_app:app"],
+            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        try:
+            wait_until_serving(port, server)
+            for index in range(4 * args.workers): # Loads the stand-ins in every worker before the clock starts
+                post_detect(port, bodies[index % len(bodies)])
+            results = []
+            lock = threading.Lock()
+
+            def one(index):
+                started = time.perf_counter()
+                try:
+                    status, retry_after = post_detect(port, bodies[index % len(bodies)])
+                except OSError:
+                    status, retry_after = None, None
+                with lock:
+                    results.append((status, time.perf_counter() - started, retry_after))
+
+            arrivals = random.Random(1)
+            with ThreadPoolExecutor(max_workers=2048) as pool:
+                started = time.perf_counter()
+                at, offered = 0.0, 0
+                while at < args.duration:
+                    delay = started + at - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    pool.submit(one, offered)
+                    offered += 1
+                    at += arrivals.expovariate(args.rate)
+        except RuntimeError as e:
+            return {"error": f"{e}: {server.stderr.read().strip().splitlines()[-1:] if server.poll() is not None else ''}"}
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    ok = [seconds for status, seconds, _ in results if status == 200]
+    shed = [seconds for status, seconds, _ in results if status == 503]
+    good = [seconds for seconds in ok if seconds * 1000 <= args.slo_ms]
+    return {
+        "offered": offered,
+        "ok": len(ok),
+        "shed": len(shed),
+        "other_errors": len(results) - len(ok) - len(shed),
+        "late": len(ok) - len(good),
+        "goodput_per_second": round(len(good) / args.duration, 1),
+        "ok_p50_ms": percentile(ok, 50),
+        "ok_p99_ms": percentile(ok, 99),
+        "shed_p99_ms": percentile(shed, 99),
+        "retry_after_seconds": sorted({int(value) for status, _, value in results if status == 503 and value}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overload /detect under gunicorn with and without admission control and compare goodput.")
+    parser.add_argument("--rate", type=float, default=150, help="Offered requests per second")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of arrivals")
+    parser.add_argument("--slo-ms", type=float, default=1000, help="Latency SLO (INFERENCE_SLO_MS) and goodput threshold")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers (WEB_CONCURRENCY)")
+    parser.add_argument("--threads", type=int, help="GUNICORN_THREADS (default: the gunicorn.conf.py setting)")
+    parser.add_argument("--classifier-latency", type=float, default=0.02, help="Stand-in classifier latency per batch (seconds)")
+    parser.add_argument("--per-image", type=float, default=0.01, help="Stand-in classifier latency per image (seconds)")
+    parser.add_argument("--batch-size", type=int, default=16, help="DEEPFAKE_BATCH_MAX_SIZE")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    bodies = [multipart(synthetic_image(640, 480, seed=i), f"load-{i}.jpg") for i in range(32)]
+    report = {"config": {key: value for key, value in vars(args).items() if key != "output"}, "runs": {}}
+    for mode in MODES:
+        report["runs"][mode] = run_mode(mode, args, bodies)
+        print(f"admission control {mode}: {json.dumps(report['runs'][mode])}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
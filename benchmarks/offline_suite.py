@@ -0,0 +1,140 @@
+# benchmarks/offline_suite.py
+#
+# Offline throughput/latency suite for /verify, /detect, /evaluate and /verify-document.
+# Gemini is replaced by a local stand-in with configurable latency that answers in
+# the production formats ("Truth Score:", "Score Percent:", "Verification Status:"),
+# so the suite runs without network access or an API key and measures only our
+# own overhead plus the simulated model time. Inputs are synthetic: unique claims,
+# random-noise images and generated multi-page PDFs. Requests go through the Flask
+# app in-process at the given concurrency. Result caches are off unless --with-caches.
+#
+#   python benchmarks/offline_suite.py [--endpoints verify,detect,evaluate,verify-document]
+#                                      [--requests 50] [--concurrency 8] [--llm-latency 0.2]
+#                                      [--pdf-pages 5] [--real-classifier] [--output suite.json]
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from standins import StandInClassifier, StandInLLM, install_standins, repo_root, synthetic_image, synthetic_pdf
+
+sys.path.insert(0, repo_root())
+
+ENDPOINTS = ("verify", "detect", "evaluate", "verify-document")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return round(sorted_values[index], 2)
+
+
+def build_request(endpoint, index, args):
+    """Returns: (path, kwargs for test_client.post)"""
+    # Separate seed ranges per endpoint, so /verify-document never hits text cached by /evaluate
+    index += ENDPOINTS.index(endpoint) * 1000000
+    if endpoint == "verify":
+        return "/verify", {"json": {"claim": f"Benchmark claim number {index}: the sample mean equals {index * 7 % 101}."}}
+    if endpoint == "detect":
+        import io
+        image = synthetic_image(args.image_width, args.image_height, seed=index)
+        return "/detect", {"data": {"image": (io.BytesIO(image), f"bench-{index}.jpg")}, "content_type": "multipart/form-data"}
+    import io
+    pdf = synthetic_pdf(pages=args.pdf_pages, lines_per_page=args.pdf_lines, seed=index)
+    field = "pdf" if endpoint == "evaluate" else "document"
+    return f"/{endpoint}", {"data": {field: (io.BytesIO(pdf), f"bench-{index}.pdf")}, "content_type": "multipart/form-data"}
+
+
+def run_endpoint(app, endpoint, args):
+    local = threading.local()
+
+    def one(index):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        path, kwargs = build_request(endpoint, index, args) # Input generation is not timed
+        started = time.perf_counter()
+        response = client.post(path, **kwargs)
+        response.get_data()
+        return (time.perf_counter() - started) * 1000, response.status_code
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        # Warm up at full concurrency so lazily started pools (PDF extraction, map-reduce) are already sized
+        list(pool.map(one, range(-args.warmup, 0)))
+        started = time.perf_counter()
+        results = list(pool.map(one, range(args.requests)))
+    wall = time.perf_counter() - started
+
+    latencies = sorted(ms for ms, _ in results)
+    statuses = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(results) / wall, 2) if wall > 0 else None,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": round(latencies[-1], 2) if latencies else None,
+        "statuses": statuses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the four main endpoints with a stand-in LLM.")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=50, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=None, help="Untimed requests per endpoint before measuring (default: --concurrency)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Stand-in Gemini latency per call (seconds)")
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument("--classifier-latency", type=float, default=0.01, help="Stand-in classifier latency per batch (seconds)")
+    parser.add_argument("--real-classifier", action="store_true", help="Use the real deepfake model instead of the stand-in")
+    parser.add_argument("--image-width", type=int, default=640)
+    parser.add_argument("--image-height", type=int, default=480)
+    parser.add_argument("--pdf-pages", type=int, default=5)
+    parser.add_argument("--pdf-lines", type=int, default=40)
+    parser.add_argument("--with-caches", action="store_true", help="Leave the claim and deepfake result caches on")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+    if args.warmup is None:
+        args.warmup = args.concurrency
+
+    # Configuration is read at import time, so set it before importing the app
+    os.environ["MODEL_WARMUP"] = "lazy"
+    if not args.with_caches:
+        os.environ["CLAIM_CACHE"] = "0"
+        os.environ["DEEPFAKE_CACHE"] = "0"
+    import app as web
+
+    llm = StandInLLM(latency=args.llm_latency, jitter=args.llm_jitter)
+    install_standins(llm=llm, classifier=None if args.real_classifier else StandInClassifier(args.classifier_latency))
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "endpoints": {},
+    }
+    for endpoint in [e.strip() for e in args.endpoints.split(",") if e.strip()]:
+        if endpoint not in ENDPOINTS:
+            parser.error(f"Unknown endpoint '{endpoint}'. Choose from: {', '.join(ENDPOINTS)}")
+        calls_before = llm.calls
+        result = run_endpoint(web.app, endpoint, args)
+        result["llm_calls"] = llm.calls - calls_before
+        report["endpoints"][endpoint] = result
+        print(f"{endpoint}: {json.dumps(result)}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
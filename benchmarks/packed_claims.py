@@ -0,0 +1,87 @@
+# benchmarks/packed_claims.py
+#
+# Bulk claim verification throughput and per-claim cost with packed prompting
+# (several claims per Gemini call, JSON array answer) against the single-claim
+# verify_fact path. Runs verify_claims over unique synthetic claims with a
+# stand-in Gemini whose latency grows with the answer length, with the claim
+# caches off, once per pack size (1 = the single-claim path). Reports claims/s,
+# Gemini calls and estimated prompt/answer tokens per claim, an estimated price
+# per 1000 claims, and how many claims fell back to single calls
+# (--packed-error-rate makes the stand-in drop or garble that share of answers).
+#
+#   python benchmarks/packed_claims.py [--claims 400] [--pack-sizes 1,5,10,20,40] [--workers 16]
+#                                      [--llm-latency 0.5] [--per-output-token 0.002] [--rpm 0]
+#                                      [--packed-error-rate 0.02] [--output packed.json]
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from standins import StandInLLM, install_standins, repo_root
+
+sys.path.insert(0, repo_root())
+
+
+def claims_for(count, offset):
+    return [f"Benchmark claim number {offset + i}: the measured value in sample {i % 97} equals {(i * 7) % 101} units."
+            for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare packed multi-claim prompting with single-claim verification.")
+    parser.add_argument("--claims", type=int, default=400, help="Unique claims per run")
+    parser.add_argument("--pack-sizes", default="1,5,10,20,40", help="CLAIM_PACK_MAX_CLAIMS values to run (1 = single-claim calls)")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Stand-in Gemini latency per call (seconds)")
+    parser.add_argument("--per-output-token", type=float, default=0.002, help="Stand-in generation time per answer token (seconds)")
+    parser.add_argument("--rpm", type=float, default=0, help="LLM_RPM for the scheduler (0 = unlimited)")
+    parser.add_argument("--packed-error-rate", type=float, default=0.0, help="Share of packed answers the stand-in drops or garbles")
+    parser.add_argument("--input-price", type=float, default=0.075, help="USD per 1M prompt tokens")
+    parser.add_argument("--output-price", type=float, default=0.30, help="USD per 1M answer tokens")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    # Configuration is read at import time, so set it before importing
+    os.environ.update(MODEL_WARMUP="lazy", CLAIM_CACHE="0", CLAIM_INDEX="0", LLM_RPM=str(args.rpm), LLM_TPM="0")
+    import fact_verification
+
+    report = {"config": {key: value for key, value in vars(args).items() if key != "output"}, "runs": []}
+    for run, size in enumerate(int(s) for s in args.pack_sizes.split(",") if s.strip()):
+        llm = StandInLLM(latency=args.llm_latency, jitter=0.05, per_output_token=args.per_output_token,
+                         packed_error_rate=args.packed_error_rate)
+        install_standins(llm=llm)
+        fact_verification.CLAIM_PACK_MAX_CLAIMS = size
+        before = fact_verification.claim_packing_stats()
+        claims = claims_for(args.claims, run * args.claims) # Fresh claims per run, so in-flight coalescing never helps
+
+        started = time.perf_counter()
+        results = list(fact_verification.verify_claims(claims, max_workers=args.workers, packed=size > 1))
+        wall = time.perf_counter() - started
+
+        after = fact_verification.claim_packing_stats()
+        entry = {
+            "pack_size": size,
+            "wall_seconds": round(wall, 2),
+            "claims_per_second": round(len(results) / wall, 1),
+            "llm_calls": llm.calls,
+            "llm_calls_per_claim": round(llm.calls / len(claims), 3),
+            "prompt_tokens_per_claim": round(llm.prompt_tokens / len(claims), 1),
+            "output_tokens_per_claim": round(llm.output_tokens / len(claims), 1),
+            "usd_per_1000_claims": round((llm.prompt_tokens * args.input_price + llm.output_tokens * args.output_price)
+                                         / 1e6 / len(claims) * 1000, 4),
+            "fallbacks": after["fallbacks"] - before["fallbacks"],
+            "errors": sum(1 for result in results if result["truth_score"] in ("Error", "N/A")),
+        }
+        report["runs"].append(entry)
+        print(json.dumps(entry))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
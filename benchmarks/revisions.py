@@ -0,0 +1,138 @@
+# benchmarks/revisions.py
+#
+# Re-analysis cost for successive revisions of the same paper. Generates a
+# sequence of PDFs where each revision changes one section (--scenario edit:
+# one sentence rewritten in place; insert: a paragraph added, reflowing every
+# later page) and runs each through PDF extraction and the map-reduce
+# evaluation and document verification with a stand-in Gemini. Runs once with
+# incremental analysis off (every section re-analyzed, every page re-extracted)
+# and once with it on, each in a fresh process with empty caches, and reports per
+# revision: latency, Gemini calls, sections reused, input tokens sent and saved,
+# and pages reused by the extractor. Revision 0 is the cold first submission.
+#
+#   python benchmarks/revisions.py [--scenario edit|insert] [--revisions 5] [--paragraphs 12]
+#                                  [--llm-latency 0.5] [--tasks evaluate,verify-document] [--output revisions.json]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from standins import paper_revisions, repo_root
+
+REPO_ROOT = repo_root()
+
+MODES = ("full", "incremental")
+
+# Runs one task in one mode in the child process (cwd is a fresh temp directory, so every cache starts empty)
+CHILD = """
+import json, os, sys, time
+sys.path.insert(0, {repo!r})
+sys.path.insert(0, os.path.join({repo!r}, "benchmarks"))
+enabled = "1" if {mode!r} == "incremental" else "0"
+os.environ.update(MODEL_WARMUP="lazy", INCREMENTAL_ANALYSIS=enabled, PDF_PAGE_CACHE=enabled, PDF_EXTRACT_WORKERS="0")
+from standins import StandInLLM, install_standins
+import fact_verification
+import pdf_extraction
+
+def main():
+    llm = StandInLLM(latency={latency!r}, jitter=0.0)
+    install_standins(llm=llm)
+    rows = []
+    for revision, path in enumerate({paths!r}):
+        with open(path, "rb") as f:
+            data = f.read()
+        calls, reused_pages = llm.calls, pdf_extraction._stats["pages_reused"]
+        started = time.perf_counter()
+        if {task!r} == "evaluate":
+            text = "".join(pdf_extraction.iter_pdf_pages(data))
+            extract_ms = (time.perf_counter() - started) * 1000
+            events = fact_verification.stream_evaluate_research_paper(text)
+        else:
+            events = fact_verification.stream_verify_document(data) # Extracts the text itself
+        done = [payload for event, payload in events if event == "done"][0]
+        if {task!r} != "evaluate":
+            extract_ms = done.get("timings", {{}}).get("extract_ms") or 0.0
+        info = done.get("map_reduce") or {{}}
+        rows.append({{
+            "revision": revision,
+            "ms": round((time.perf_counter() - started) * 1000, 1),
+            "extract_ms": round(extract_ms, 1),
+            "llm_calls": llm.calls - calls,
+            "sections": info.get("chunks"),
+            "sections_reused": info.get("reused", 0),
+            "input_tokens": info.get("input_tokens"),
+            "input_tokens_saved": info.get("input_tokens_saved", 0),
+            "pages_reused": pdf_extraction._stats["pages_reused"] - reused_pages,
+        }})
+    print(json.dumps(rows))
+
+main()
+"""
+
+
+def run_mode(mode, task, paths, args):
+    code = CHILD.format(repo=REPO_ROOT, mode=mode, task=task, paths=paths, latency=args.llm_latency)
+    with tempfile.TemporaryDirectory() as workdir:
+        completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=workdir)
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def summarize(rows):
+    """Totals over the revisions after the first (the re-submissions)."""
+    later = rows[1:]
+    if not later:
+        return {}
+    return {
+        "ms": round(sum(r["ms"] for r in later), 1),
+        "llm_calls": sum(r["llm_calls"] for r in later),
+        "input_tokens": sum(r["input_tokens"] or 0 for r in later),
+        "input_tokens_saved": sum(r["input_tokens_saved"] for r in later),
+        "pages_reused": sum(r["pages_reused"] for r in later),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full and incremental re-analysis of revised papers.")
+    parser.add_argument("--scenario", choices=("edit", "insert"), default="edit")
+    parser.add_argument("--revisions", type=int, default=5, help="Versions of the paper, including the original")
+    parser.add_argument("--paragraphs", type=int, default=12, help="Paragraphs per section (sets the paper length)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Stand-in Gemini latency per call (seconds)")
+    parser.add_argument("--tasks", default="evaluate,verify-document")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+    tasks = [t.strip() for t in args.tasks.split(",") if t.strip()]
+
+    report = {"config": {key: value for key, value in vars(args).items() if key != "output"}, "tasks": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for revision, pdf in enumerate(paper_revisions(args.revisions, args.scenario, paragraphs_per_section=args.paragraphs)):
+            path = os.path.join(tmp, f"revision_{revision}.pdf")
+            with open(path, "wb") as f:
+                f.write(pdf)
+            paths.append(path)
+        for task in tasks:
+            report["tasks"][task] = {}
+            for mode in MODES:
+                rows = run_mode(mode, task, paths, args)
+                if isinstance(rows, dict):
+                    report["tasks"][task][mode] = rows
+                    print(f"{task} {mode}: {json.dumps(rows)}")
+                    continue
+                report["tasks"][task][mode] = {"revisions": rows, "resubmissions": summarize(rows)}
+                for row in rows:
+                    print(f"{task} {mode}: {json.dumps(row)}")
+                print(f"{task} {mode} resubmission totals: {json.dumps(summarize(rows))}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# benchmarks/similar_claims.py
+#
+# Lookup latency of the near-duplicate claim index against corpus size. Fills a
+# fresh index in a temp directory with random unit vectors (written through the
+# index's memory-mapped file), then times nearest-neighbour lookups for
+# paraphrase-like queries with exact NumPy search and, when faiss is installed,
+# with the HNSW graph (including its recall against exact search). With
+# --embedder it also times embedding one claim with the sentence model, which
+# is usually the larger share of a lookup.
+#
+#   python benchmarks/similar_claims.py [--sizes 1000,10000,100000,1000000] [--dim 384]
+#                                       [--queries 200] [--embedder] [--output claim_index.json]
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from standins import repo_root
+
+sys.path.insert(0, repo_root())
+
+from claim_index import ClaimIndex  # noqa: E402
+
+
+def fill(index, rows, dim, rng, chunk=65536):
+    """Bulk-load rows random unit vectors straight into the index files. Returns: seconds"""
+    import numpy as np
+    started = time.perf_counter()
+    with index._connect() as conn:
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT INTO claims (scope, claim, normalized, verdict, created_at) VALUES ('bench', ?, ?, '[\"50\", \"\", []]', 0)",
+            ((f"claim {i}", f"claim {i}") for i in range(rows)),
+        )
+        conn.execute("COMMIT")
+    index._ensure_capacity(rows)
+    with index._lock:
+        index._map(rows)
+        for start in range(0, rows, chunk):
+            block = rng.standard_normal((min(chunk, rows - start), dim)).astype(np.float32)
+            index._vectors[start:start + len(block)] = block / np.linalg.norm(block, axis=1, keepdims=True)
+        index._vectors.flush()
+    index._refresh(force=True)
+    return time.perf_counter() - started
+
+
+def time_lookups(index, queries):
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.nearest(query, k=5)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        "max_ms": round(latencies[-1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark near-duplicate claim index lookups against corpus size.")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--single-inserts", type=int, default=200, help="Timed one-at-a-time add() calls per size")
+    parser.add_argument("--embedder", action="store_true", help="Also time the sentence embedding model")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    import numpy as np
+    rng = np.random.default_rng(0)
+    report = {"dim": args.dim, "queries": args.queries, "sizes": []}
+
+    if args.embedder:
+        from claim_index import SentenceEmbedder
+        embedder = SentenceEmbedder(os.getenv("CLAIM_INDEX_MODEL", "sentence-transformers/all-MiniLM-L6-v2"))
+        embedder.embed(["warm up"])
+        started = time.perf_counter()
+        for i in range(50):
+            embedder.embed([f"The Eiffel Tower is in Paris, claim number {i}"])
+        report["embed_ms"] = round((time.perf_counter() - started) / 50 * 1000, 2)
+        print(f"embed: {report['embed_ms']} ms per claim")
+
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        with tempfile.TemporaryDirectory() as directory:
+            # ann_min_rows above the corpus: measure exact search first
+            index = ClaimIndex(directory, args.dim, ann_min_rows=size + args.single_inserts + 1)
+            entry = {"rows": size, "fill_seconds": round(fill(index, size, args.dim, rng), 2)}
+            # Paraphrase-like queries: stored vectors plus noise, about 0.95 cosine from their source
+            sources = rng.integers(0, size, args.queries)
+            queries = np.asarray(index._vectors[sources]) + rng.standard_normal((args.queries, args.dim)).astype(np.float32) * (0.33 / args.dim ** 0.5)
+            queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+            started = time.perf_counter()
+            for _ in range(args.single_inserts):
+                vector = rng.standard_normal(args.dim).astype(np.float32)
+                index.add("bench", "inserted", "inserted", vector / np.linalg.norm(vector), ["50", "", []])
+            entry["insert_ms"] = round((time.perf_counter() - started) / max(1, args.single_inserts) * 1000, 3)
+            entry["exact"] = time_lookups(index, queries)
+
+            try:
+                import faiss  # noqa: F401
+            except ImportError:
+                entry["hnsw"] = "faiss not installed"
+            else:
+                exact_top = [index.nearest(query, k=1)[0][0] for query in queries]
+                entry["exact"]["recall_at_1"] = round(sum(top == source + 1 for top, source in zip(exact_top, sources)) / len(queries), 3)
+                index.ann_min_rows = 1
+                started = time.perf_counter()
+                index._build_ann()
+                entry["hnsw_build_seconds"] = round(time.perf_counter() - started, 2)
+                entry["hnsw"] = time_lookups(index, queries)
+                hnsw_top = [index.nearest(query, k=1)[0][0] for query in queries]
+                entry["hnsw"]["recall_at_1"] = round(sum(a == b for a, b in zip(exact_top, hnsw_top)) / len(queries), 3)
+            report["sizes"].append(entry)
+            print(json.dumps(entry))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# benchmarks/sse_ttfb.py
+#
+# Compares the buffered /evaluate (or /verify-document) response with its SSE
+# /stream variant against a running server: time to first byte, first model
+# output, first parsed score/status, and completion.
+#
+#   python benchmarks/sse_ttfb.py paper.pdf [--url http://localhost:10000] [--runs 3]
+#                                  [--route evaluate|verify-document] [--output ttfb.json]
+
+import argparse
+import http.client
+import json
+import os
+import statistics
+import time
+import uuid
+from urllib.parse import urlparse
+
+FIELD_NAMES = {"evaluate": "pdf", "verify-document": "document"}
+
+
+def _multipart(field, filename, payload):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        "Content-Type: application/pdf\r\n\r\n"
+    ).encode() + payload + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def _connect(url):
+    parsed = urlparse(url)
+    cls = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+    return cls(parsed.hostname, parsed.port or (443 if parsed.scheme == "https" else 80), timeout=600)
+
+
+def measure_buffered(url, route, filename, payload):
+    body, content_type = _multipart(FIELD_NAMES[route], filename, payload)
+    conn = _connect(url)
+    started = time.perf_counter()
+    conn.request("POST", f"/{route}", body=body, headers={"Content-Type": content_type})
+    response = conn.getresponse()
+    first = response.read(1)
+    ttfb = time.perf_counter() - started
+    response.read()
+    total = time.perf_counter() - started
+    conn.close()
+    return {"status": response.status, "ttfb_ms": ttfb * 1000, "total_ms": total * 1000, "first_result_ms": total * 1000 if first else None}
+
+
+def measure_stream(url, route, filename, payload):
+    body, content_type = _multipart(FIELD_NAMES[route], filename, payload)
+    conn = _connect(url)
+    started = time.perf_counter()
+    conn.request("POST", f"/{route}/stream", body=body, headers={"Content-Type": content_type})
+    response = conn.getresponse()
+    result = {"status": response.status}
+    marks = {"ttfb_ms": None, "first_delta_ms": None, "first_result_ms": None, "total_ms": None}
+    buffer = b""
+    while True:
+        chunk = response.read1(4096) if hasattr(response, "read1") else response.read(4096)
+        if not chunk:
+            break
+        now = (time.perf_counter() - started) * 1000
+        if marks["ttfb_ms"] is None:
+            marks["ttfb_ms"] = now
+        buffer += chunk
+        while b"\n\n" in buffer:
+            raw, buffer = buffer.split(b"\n\n", 1)
+            event = next((line[6:].strip() for line in raw.decode().splitlines() if line.startswith("event:")), "")
+            if event == "delta" and marks["first_delta_ms"] is None:
+                marks["first_delta_ms"] = now
+            if event in ("score", "status") and marks["first_result_ms"] is None:
+                marks["first_result_ms"] = now
+            if event in ("done", "error"):
+                marks["total_ms"] = now
+                if marks["first_result_ms"] is None:
+                    marks["first_result_ms"] = now
+    conn.close()
+    result.update(marks)
+    return result
+
+
+def _median(runs, key):
+    values = [r[key] for r in runs if r.get(key) is not None]
+    return round(statistics.median(values), 1) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure time-to-first-byte of buffered vs SSE endpoints.")
+    parser.add_argument("pdf", help="PDF file to upload")
+    parser.add_argument("--url", default=f"http://localhost:{os.environ.get('PORT', '10000')}")
+    parser.add_argument("--route", choices=sorted(FIELD_NAMES), default="evaluate")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    with open(args.pdf, "rb") as f:
+        payload = f.read()
+    filename = os.path.basename(args.pdf)
+
+    report = {"route": args.route, "runs": args.runs}
+    for mode, fn in (("buffered", measure_buffered), ("stream", measure_stream)):
+        runs = [fn(args.url, args.route, filename, payload) for _ in range(args.runs)]
+        report[mode] = {key: _median(runs, key) for key in ("ttfb_ms", "first_delta_ms", "first_result_ms", "total_ms")}
+        report[mode]["statuses"] = sorted({r["status"] for r in runs})
+        print(f"{mode}: {json.dumps(report[mode])}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
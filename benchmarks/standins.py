@@ -0,0 +1,285 @@
+# benchmarks/standins.py
+#
+# Local stand-ins for offline benchmarks: a Gemini-like model with configurable
+# latency that answers every prompt type in the format the parsers expect, a
+# constant-time deepfake classifier, and synthetic images and multi-page PDFs.
+# Install them with install_standins() before sending requests.
+
+import io
+import json
+import os
+import random
+import threading
+import time
+
+FACT_CHECK_RESPONSE = (
+    "Truth Score: {score}\n"
+    "Explanation: Stand-in answer generated offline for benchmarking; the claim was not actually checked.\n"
+    "Sources: https://example.org/reference"
+)
+EVALUATION_RESPONSE = (
+    "Score Percent: {score}%\n"
+    "Justification: Strengths: the stand-in paper states its purpose and method clearly. "
+    "Weaknesses: results are synthetic and conclusions cannot be validated."
+)
+DOCUMENT_RESPONSE = (
+    "Verification Status: {status}\n"
+    "Details: Stand-in analysis generated offline; headers and formatting look consistent."
+)
+MAP_NOTE_RESPONSE = "Notes: stand-in summary of this part. Purpose stated, method described, no inconsistencies found."
+PACKED_EXPLANATION = "Stand-in answer generated offline for benchmarking; the claim was not actually checked."
+DOCUMENT_STATUSES = ("Likely Genuine", "Possibly Fake", "Inconclusive")
+
+
+class StandInResponse:
+    """Quacks like a google.generativeai response: .text, .candidates, .prompt_feedback."""
+
+    def __init__(self, text):
+        self.text = text
+        self.candidates = [text]
+        self.prompt_feedback = None
+
+
+class DeadlineExceeded(Exception):
+    """Same name and code as google.api_core.exceptions.DeadlineExceeded, so the scheduler retries it."""
+    code = 504
+
+
+class StandInLLM:
+    """
+    Replaces the Gemini GenerativeModel. Every call sleeps latency seconds (plus up to
+    jitter seconds, plus per_output_token seconds per estimated token of the answer)
+    and returns a canned response matching the prompt's format. Packed fact-check
+    prompts get a JSON array; packed_error_rate of its entries are left out or
+    malformed, to exercise the single-claim fallback. tail_rate of the calls are slow
+    ones taking tail_factor times as long. A sync call given a request_options timeout
+    gives up after that long with a 504, like the Gemini client.
+    """
+
+    def __init__(self, latency=0.2, jitter=0.05, seed=0, per_output_token=0.0, packed_error_rate=0.0,
+                 tail_rate=0.0, tail_factor=10.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tail_rate = tail_rate
+        self.tail_factor = tail_factor
+        self.per_output_token = per_output_token
+        self.packed_error_rate = packed_error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def _answer(self, prompt):
+        """Returns: (seconds to wait, response text)"""
+        with self._lock:
+            self.calls += 1
+            extra = self._random.uniform(0, self.jitter) if self.jitter else 0.0
+            slow = self.tail_rate and self._random.random() < self.tail_rate
+            score = self._random.randint(0, 100)
+            text = self._packed(prompt) if '"truth_score"' in prompt else self.respond(prompt, score)
+            # Same 4-characters-per-token estimate as chunking.estimate_tokens
+            self.prompt_tokens += (len(prompt) + 3) // 4
+            self.output_tokens += (len(text) + 3) // 4
+        delay = self.latency + extra + self.per_output_token * ((len(text) + 3) // 4)
+        return delay * self.tail_factor if slow else delay, text
+
+    def _packed(self, prompt):
+        claims = json.loads(prompt.split("Claims (JSON): ", 1)[1].split("\n", 1)[0])
+        answers = []
+        for entry in claims:
+            answer = {"id": entry["id"], "truth_score": self._random.randint(0, 100),
+                      "explanation": PACKED_EXPLANATION, "sources": ["https://example.org/reference"]}
+            if self._random.random() < self.packed_error_rate:
+                if self._random.random() < 0.5:
+                    continue
+                answer["truth_score"] = "mostly true"
+            answers.append(answer)
+        return json.dumps(answers)
+
+    @staticmethod
+    def respond(prompt, score):
+        if "Truth Score:" in prompt:
+            return FACT_CHECK_RESPONSE.format(score=score)
+        if "Score Percent:" in prompt:
+            return EVALUATION_RESPONSE.format(score=score)
+        if "Verification Status:" in prompt:
+            return DOCUMENT_RESPONSE.format(status=DOCUMENT_STATUSES[score % len(DOCUMENT_STATUSES)])
+        return MAP_NOTE_RESPONSE
+
+    def generate_content(self, prompt, generation_config=None, stream=False, request_options=None, **kwargs):
+        delay, text = self._answer(prompt)
+        timeout = (request_options or {}).get("timeout")
+        if not stream:
+            if timeout is not None and delay > timeout:
+                time.sleep(timeout)
+                raise DeadlineExceeded(f"504 Deadline Exceeded after {timeout:.1f}s")
+            time.sleep(delay)
+            return StandInResponse(text)
+
+        def chunks(pieces=4):
+            step = max(1, len(text) // pieces)
+            for start in range(0, len(text), step):
+                time.sleep(delay / pieces)
+                yield StandInResponse(text[start:start + step])
+        return chunks()
+
+    async def generate_content_async(self, prompt, generation_config=None, **kwargs):
+        import asyncio
+        delay, text = self._answer(prompt)
+        await asyncio.sleep(delay)
+        return StandInResponse(text)
+
+
+class StandInProcessor:
+    def __call__(self, images, return_tensors="pt"):
+        import torch
+        return {"pixel_values": torch.zeros((len(images), 3, 8, 8))}
+
+
+class StandInClassifier:
+    """Constant-latency classifier: latency seconds per batch plus per_image seconds per image."""
+
+    def __init__(self, latency=0.01, per_image=0.002):
+        self.latency = latency
+        self.per_image = per_image
+
+    def __call__(self, pixel_values=None, **kwargs):
+        import torch
+        batch = pixel_values.shape[0]
+        time.sleep(self.latency + self.per_image * batch)
+
+        class Output:
+            logits = torch.tensor([[0.3, 0.7]] * batch)
+        return Output()
+
+    def eval(self):
+        return self
+
+    def share_memory(self):
+        return self
+
+
+def install_standins(llm=None, classifier=None):
+    """
+    Install stand-ins in the fact_verification model registry (call before any request).
+    classifier=None keeps the real deepfake model.
+    """
+    import fact_verification
+    from deepfake_backends import EagerBackend
+    if llm is not None:
+        fact_verification.models.set("gemini", llm)
+    if classifier is not None:
+        fact_verification.models.set("deepfake", (StandInProcessor(), classifier))
+        fact_verification.models.set("deepfake_backend", EagerBackend(classifier))
+
+
+def synthetic_image(width=640, height=480, fmt="JPEG", seed=None):
+    """Random-noise image encoded as fmt. Returns: bytes"""
+    from PIL import Image
+    rng = random.Random(seed)
+    pixels = bytes(rng.getrandbits(8) for _ in range(64 * 64 * 3))
+    image = Image.frombytes("RGB", (64, 64), pixels).resize((width, height))
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+_WORDS = ("model", "data", "results", "method", "analysis", "sample", "signal", "error", "study", "measure",
+          "baseline", "evidence", "variance", "survey", "protocol", "cohort", "effect", "estimate")
+_HEADINGS = ("Abstract", "1. Introduction", "2. Methods", "3. Results", "4. Discussion", "5. Conclusion", "References")
+
+
+def _sentence(rng):
+    return " ".join(rng.choice(_WORDS) for _ in range(12)).capitalize() + "."
+
+
+def _pdf_from_pages(pages):
+    """Minimal text PDF with one Helvetica text stream per page, given each page's lines. Returns: bytes"""
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>", 3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    page_ids = []
+    for page, lines in enumerate(pages):
+        content = "BT /F1 10 Tf 12 TL 50 760 Td " + " ".join(f"({_pdf_escape(line)}) '" for line in lines) + " ET"
+        content_id, page_id = 4 + 2 * page, 5 + 2 * page
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content.encode("latin-1"))
+        objects[page_id] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % content_id
+        )
+        page_ids.append(page_id)
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % i for i in page_ids), len(pages))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = out.tell()
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (object_id, objects[object_id]))
+    xref = out.tell()
+    count = max(objects) + 1
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % count)
+    for object_id in range(1, count):
+        out.write(b"%010d 00000 n \n" % offsets[object_id])
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (count, xref))
+    return out.getvalue()
+
+
+def synthetic_pdf(pages=3, lines_per_page=40, seed=0):
+    """
+    Minimal multi-page text PDF (Helvetica, one text stream per page) that pdfminer
+    can extract. Each page starts with a section heading. Returns: bytes
+    """
+    rng = random.Random(seed)
+    return _pdf_from_pages([
+        [_HEADINGS[page % len(_HEADINGS)] + f" (page {page + 1}, doc {seed})"] + [_sentence(rng) for _ in range(lines_per_page - 1)]
+        for page in range(pages)
+    ])
+
+
+def _paginate(lines, lines_per_page, seed):
+    """Lay lines out on pages with a running header and a page-number footer."""
+    body = lines_per_page - 3
+    chunks = [lines[i:i + body] for i in range(0, len(lines), body)]
+    return [[f"Stand-in paper {seed}: preprint"] + chunk + ["", f"{page + 1}"] for page, chunk in enumerate(chunks)]
+
+
+def paper_revisions(revisions=4, scenario="edit", paragraphs_per_section=6, lines_per_paragraph=6,
+                    lines_per_page=40, seed=0):
+    """
+    A sequence of revisions of one paper as PDFs, each differing from the previous
+    one in a single section. scenario "edit" rewrites one sentence in place (only
+    that page changes); "insert" adds a paragraph, reflowing every later page.
+    Returns: list of bytes (the original first)
+    """
+    rng = random.Random(seed)
+    sections = [
+        [heading] + [[_sentence(rng) for _ in range(lines_per_paragraph)] for _ in range(paragraphs_per_section)]
+        for heading in _HEADINGS
+    ]
+
+    def render():
+        lines = []
+        for heading, *paragraphs in sections:
+            lines.append(heading)
+            for paragraph in paragraphs:
+                lines.extend(paragraph + [""])
+        return _pdf_from_pages(_paginate(lines, lines_per_page, seed))
+
+    pdfs = [render()]
+    for revision in range(1, revisions):
+        section = sections[1 + (revision - 1) % (len(sections) - 2)]
+        paragraph = rng.randrange(1, len(section))
+        if scenario == "insert":
+            section.insert(paragraph, [_sentence(rng) for _ in range(lines_per_paragraph)])
+        else:
+            section[paragraph][rng.randrange(lines_per_paragraph)] = _sentence(rng)
+        pdfs.append(render())
+    return pdfs
+
+
+def repo_root():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,158 @@
+# benchmarks/startup_latency.py
+#
+# Measures import time and first-request latency for the CLI path (main.py only
+# needs verify_fact) and the Flask app. Each measurement runs in a fresh Python
+# process so nothing is already imported or loaded. gunicorn_ready starts
+# `gunicorn -c gunicorn.conf.py app:app` (preload on, as shipped) and checks that
+# /ready turns 200 on its own, without any request loading a model first, and
+# how long that takes; it needs gunicorn and the models for the features served.
+#
+#   python benchmarks/startup_latency.py [--runs 3] [--skip-llm] [--skip-gunicorn]
+#                                        [--ready-timeout 300] [--output startup.json]
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    # Just importing the module main.py uses
+    "cli_import": """
+import time
+t0 = time.perf_counter()
+import fact_verification
+result = {"import_s": time.perf_counter() - t0}
+""",
+    # Importing the Flask app without warming models
+    "app_import": """
+import os, time
+os.environ["MODEL_WARMUP"] = "lazy"
+t0 = time.perf_counter()
+import app
+result = {"import_s": time.perf_counter() - t0}
+""",
+    # First and second verify_fact call (first one includes configuring Gemini)
+    "cli_first_verify": """
+import time
+t0 = time.perf_counter()
+import fact_verification as fv
+t1 = time.perf_counter()
+fv.verify_fact("Water boils at 100 degrees Celsius at sea level.", use_cache=False)
+t2 = time.perf_counter()
+fv.verify_fact("The Moon orbits the Earth.", use_cache=False)
+t3 = time.perf_counter()
+result = {"import_s": t1 - t0, "first_call_s": t2 - t1, "second_call_s": t3 - t2}
+""",
+    # First and second /detect through the Flask test client (first one loads the classifier)
+    "app_first_detect": """
+import io, os, time
+os.environ["MODEL_WARMUP"] = "lazy"
+os.environ["DEEPFAKE_CACHE"] = "0"
+t0 = time.perf_counter()
+import app
+from PIL import Image
+t1 = time.perf_counter()
+client = app.app.test_client()
+def post():
+    buf = io.BytesIO()
+    Image.new("RGB", (256, 256), (120, 80, 40)).save(buf, format="PNG")
+    buf.seek(0)
+    return client.post("/detect", data={"image": (buf, "bench.png")}, content_type="multipart/form-data")
+status = post().status_code
+t2 = time.perf_counter()
+post()
+t3 = time.perf_counter()
+result = {"import_s": t1 - t0, "first_request_s": t2 - t1, "second_request_s": t3 - t2, "status": status}
+""",
+}
+
+LLM_SCENARIOS = {"cli_first_verify"}
+
+
+def run_scenario(code):
+    wrapper = code + "\nimport json, resource\nresult['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024\nprint('RESULT ' + json.dumps(result))\n"
+    proc = subprocess.run([sys.executable, "-c", wrapper], cwd=REPO_ROOT, capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    return {"error": (proc.stderr or proc.stdout).strip().splitlines()[-1:] or ["no output"]}
+
+
+def gunicorn_ready(timeout):
+    """Start gunicorn with the shipped config and poll /ready. Returns: dict (ready_s or the last /ready body)"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = dict(os.environ, PORT=str(port), JOB_WORKERS="0")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(REPO_ROOT, "gunicorn.conf.py"), "app:app"],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    started = time.perf_counter()
+    last = None
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                return {"error": f"gunicorn exited with code {server.returncode}"}
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=5) as response:
+                    return {"ready_s": time.perf_counter() - started, "status": response.status}
+            except urllib.error.HTTPError as e:
+                last = {"status": e.code, "body": json.loads(e.read() or b"null")}
+            except OSError:
+                pass
+            time.sleep(0.5)
+        return {"error": f"/ready not 200 after {timeout}s", "last": last}
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and first-request latency.")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh processes per scenario")
+    parser.add_argument("--skip-llm", action="store_true", help="Skip scenarios that call Gemini")
+    parser.add_argument("--skip-gunicorn", action="store_true", help="Skip the gunicorn /ready check")
+    parser.add_argument("--ready-timeout", type=float, default=300, help="Seconds to wait for /ready under gunicorn")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {}
+    for name, code in SCENARIOS.items():
+        if args.skip_llm and name in LLM_SCENARIOS:
+            continue
+        runs = [run_scenario(code) for _ in range(args.runs)]
+        ok = [r for r in runs if "error" not in r]
+        summary = {"runs": len(runs), "errors": [r["error"] for r in runs if "error" in r]}
+        if ok:
+            for key in ok[0]:
+                values = [r[key] for r in ok if isinstance(r.get(key), (int, float))]
+                if values:
+                    summary[f"{key}_median"] = round(statistics.median(values), 4)
+        report[name] = summary
+        print(f"{name}: {json.dumps(summary)}")
+
+    if not args.skip_gunicorn:
+        result = gunicorn_ready(args.ready_timeout)
+        report["gunicorn_ready"] = {key: round(value, 4) if isinstance(value, float) else value for key, value in result.items()}
+        print(f"gunicorn_ready: {json.dumps(report['gunicorn_ready'])}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+# bulk_scan.py
+#
+# Bulk media scanner: deepfake scores for every image and a verification verdict
+# for every PDF under a directory tree, without going through the web routes.
+#   - the tree is walked as a stream (one directory listing in memory at a time),
+#     so scanning starts at once and a huge tree costs no upfront pass;
+#   - images are read, hashed and decoded (at reduced resolution) in a process pool
+#     and scored by the classifier in batches via detect_deepfake_batch; animated
+#     GIF/WebP files and zips of frames go through detect_deepfake_sequence;
+#   - PDFs go through verify_document, at most --pdf-concurrency at a time;
+#   - results are written incrementally, as JSONL or as Parquet part files (needs
+#     pyarrow), and a checkpoint records which files are on disk. Re-running with
+#     the same output resumes: output past the last checkpoint is discarded and
+#     finished files are skipped. Errors that may be transient (LLM errors and
+#     timeouts, a crashed decode worker) are never checkpointed, so they are retried
+#     and the file appears again in the output: the last row for a path wins;
+#   - files/s is reported while scanning and at the end.
+#
+#   python bulk_scan.py /data/uploads --output scan.jsonl [--format jsonl|parquet] [--workers 4]
+#                       [--pdf-concurrency 4] [--batch-size 32] [--checkpoint-every 500] [--restart]
+
+import argparse
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import UnidentifiedImageError
+
+import image_decode
+from frame_sequence import sequence_kind
+from structured_logging import get_logger
+
+logger = get_logger("bulk_scan")
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+SEQUENCE_EXTENSIONS = ('.zip',)
+PDF_EXTENSIONS = ('.pdf',)
+SCAN_EXTENSIONS = IMAGE_EXTENSIONS + SEQUENCE_EXTENSIONS + PDF_EXTENSIONS
+
+# One row per file, the same columns in both output formats
+COLUMNS = {
+    "path": "string", "kind": "string", "sha256": "string", "status": "string",
+    "fake_score": "float64", "real_score": "float64", "verdict": "string", "frames_analyzed": "int64",
+    "verification_status": "string", "details": "string", "error": "string", "cached": "bool", "ms": "float64",
+}
+CHECKPOINT_VERSION = 1
+
+
+def walk(root):
+    """
+    Yield paths (relative to root) of scannable files, depth first, in name order.
+    Directory symlinks are not followed and unreadable directories are skipped.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as iterator:
+                entries = sorted(iterator, key=lambda entry: entry.name)
+        except OSError as e:
+            logger.warning(f"Skipping unreadable directory {directory}: {e}")
+            continue
+        subdirectories = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif entry.is_file() and entry.name.lower().endswith(SCAN_EXTENSIONS):
+                    yield os.path.relpath(entry.path, root)
+            except OSError:
+                continue
+        stack.extend(reversed(subdirectories))
+
+
+def _decode_file(path, size):
+    """
+    Runs in the decode pool: read, hash and decode one image.
+    Returns: (sha256, "image" and the RGB image | "sequence" and None | "error" and a message)
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    sha256 = hashlib.sha256(data).hexdigest()
+    try:
+        if sequence_kind(data) == "animated":
+            return sha256, "sequence", None
+        return sha256, "image", image_decode.decode_image(io.BytesIO(data), size)
+    except image_decode.ImageTooLarge as e:
+        return sha256, "error", str(e)
+    except UnidentifiedImageError:
+        return sha256, "error", "Cannot identify image file. It might be corrupted or not a supported format."
+    except Exception as e:
+        return sha256, "error", f"Could not decode image: {e}"
+
+
+def _row(path, kind, **values):
+    row = dict.fromkeys(COLUMNS)
+    row.update(path=path, kind=kind, **values)
+    return row
+
+
+# --- Output ---
+
+class JsonlWriter:
+    """Appends one JSON line per row; the checkpointed state is the file size."""
+
+    def __init__(self, path, resume_state=None):
+        self.file = open(path, "r+b" if resume_state is not None else "wb")
+        if resume_state is not None:
+            # Drop rows (and any torn last line) written after the last checkpoint
+            self.file.truncate(resume_state)
+            self.file.seek(resume_state)
+
+    def write(self, row):
+        self.file.write((json.dumps(row) + "\n").encode("utf-8"))
+
+    def commit(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """Writes the rows between two checkpoints as one part file; the checkpointed state is the part count."""
+
+    def __init__(self, directory, resume_state=None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("--format parquet needs pyarrow (pip install pyarrow).")
+        self.pa, self.pq = pyarrow, pyarrow.parquet
+        self.schema = pyarrow.schema([(name, getattr(pyarrow, kind)()) for name, kind in COLUMNS.items()])
+        self.directory = directory
+        self.parts = resume_state or 0
+        self.rows = []
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            # Parts written after the last checkpoint, or left half-written
+            if name.startswith("part-") and (name.endswith(".tmp") or name.endswith(".parquet") and int(name[5:-8]) >= self.parts):
+                os.remove(os.path.join(directory, name))
+
+    def write(self, row):
+        self.rows.append(row)
+
+    def commit(self):
+        if self.rows:
+            table = self.pa.Table.from_pylist(self.rows, schema=self.schema)
+            path = os.path.join(self.directory, f"part-{self.parts:05d}.parquet")
+            self.pq.write_table(table, path + ".tmp")
+            os.replace(path + ".tmp", path)
+            self.parts += 1
+            self.rows = []
+        return self.parts
+
+    def close(self):
+        pass
+
+
+class Checkpoint:
+    """
+    Append-only JSON lines: a header naming the scanned root and format, then one
+    entry per commit with the output state and the files it made durable.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.valid_bytes = 0
+
+    def load(self):
+        """Returns: (header or None, set of finished paths, output state or None)"""
+        header, done, state = None, set(), None
+        try:
+            with open(self.path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break # A crash can leave a partial last line
+                    if not line.endswith(b"\n"):
+                        break
+                    self.valid_bytes += len(line)
+                    if header is None:
+                        header = entry
+                        continue
+                    done.update(entry["done"])
+                    state = entry["output"]
+        except FileNotFoundError:
+            pass
+        return header, done, state
+
+    def open(self, header, fresh):
+        if fresh:
+            self.file = open(self.path, "w")
+            self._append(header)
+        else:
+            self.file = open(self.path, "r+")
+            self.file.truncate(self.valid_bytes) # Entries after a torn line would never be read back
+            self.file.seek(self.valid_bytes)
+
+    def record(self, state, paths):
+        self._append({"output": state, "done": paths})
+
+    def _append(self, entry):
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+# --- Scan ---
+
+class Scanner:
+    def __init__(self, root, writer, checkpoint, args):
+        # Imported here: the decode workers import this module and must not load the model stack
+        import fact_verification
+        self.fv = fact_verification
+        self.root = root
+        self.writer = writer
+        self.checkpoint = checkpoint
+        self.args = args
+        processor, _ = fact_verification.get_deepfake_model()
+        self.size = image_decode.target_size(processor)
+        self.decode_pool = self._new_decode_pool()
+        self.threads = ThreadPoolExecutor(max_workers=max(1, args.pdf_concurrency), thread_name_prefix="scan")
+        self.decoding = {} # future -> (path, started, pool)
+        self.analyzing = {} # future -> (path, kind, sha256, started)
+        self.batch = [] # (path, sha256, image, started)
+        self.uncommitted = []
+        self.counts = {"image": 0, "sequence": 0, "pdf": 0, "error": 0}
+        self.written = 0
+        self.started = time.perf_counter()
+        self.last_report = self.started
+
+    def _new_decode_pool(self):
+        # spawn: like the PDF extraction pool, workers must not inherit model or client threads
+        return ProcessPoolExecutor(max_workers=max(1, self.args.workers), mp_context=multiprocessing.get_context("spawn"))
+
+    def run(self, done):
+        skipped = 0
+        for path in walk(self.root):
+            if path in done:
+                skipped += 1
+                continue
+            lower = path.lower()
+            if lower.endswith(PDF_EXTENSIONS):
+                self._submit(path, "pdf", None, self._verify_pdf, os.path.join(self.root, path))
+            elif lower.endswith(SEQUENCE_EXTENSIONS):
+                self._submit(path, "sequence", None, self._detect_sequence, os.path.join(self.root, path), None)
+            else:
+                while len(self.decoding) >= self.args.workers * 4:
+                    self._drain()
+                future = self.decode_pool.submit(_decode_file, os.path.join(self.root, path), self.size)
+                self.decoding[future] = (path, time.perf_counter(), self.decode_pool)
+            self._report()
+        while self.decoding or self.analyzing or self.batch:
+            self._drain()
+            self._report()
+        self._commit()
+        return skipped
+
+    def _submit(self, path, kind, sha256, fn, *args):
+        # Bounded: a slow LLM never lets PDFs pile up unboundedly behind the walk
+        while len(self.analyzing) >= self.args.pdf_concurrency * 2:
+            self._drain()
+        self.analyzing[self.threads.submit(fn, *args)] = (path, kind, sha256, time.perf_counter())
+
+    def _drain(self):
+        """Wait for at least one piece of work to finish (or score a ready batch) and write its results."""
+        if self.batch and (len(self.batch) >= self.args.batch_size or not self.decoding):
+            return self._score_batch()
+        finished, _ = wait(list(self.decoding) + list(self.analyzing), timeout=1.0, return_when=FIRST_COMPLETED)
+        for future in finished:
+            if future in self.decoding:
+                self._decoded(future, *self.decoding.pop(future))
+            else:
+                self._analyzed(future, *self.analyzing.pop(future))
+
+    def _decoded(self, future, path, started, pool):
+        try:
+            sha256, kind, value = future.result()
+        except BrokenProcessPool:
+            # Every job in the pool fails with it; recreate the pool once and retry those files next run
+            logger.error(f"Decode worker crashed while decoding {path}")
+            if pool is self.decode_pool:
+                self.decode_pool = self._new_decode_pool()
+            return self._write(_row(path, "image", status="error", error="The decode worker crashed."), retry=True)
+        except Exception as e:
+            return self._write(_row(path, "image", status="error", error=f"Could not read file: {e}"))
+        if kind == "sequence":
+            self._submit(path, "sequence", sha256, self._detect_sequence, os.path.join(self.root, path), sha256)
+        elif kind == "error":
+            self._write(_row(path, "image", sha256=sha256, status="error", error=value, ms=_ms(started)))
+        else:
+            self.batch.append((path, sha256, value, started))
+
+    def _score_batch(self):
+        batch, self.batch = self.batch[:self.args.batch_size], self.batch[self.args.batch_size:]
+        results = self.fv.detect_deepfake_batch([image for _, _, image, _ in batch], [sha256 for _, sha256, _, _ in batch],
+                                                batch_size=self.args.batch_size)
+        for (path, sha256, _, started), result in zip(batch, results):
+            self._write(self._detection_row(path, "image", sha256, result, started), retry=bool(result.get("error")))
+
+    def _detect_sequence(self, path, sha256):
+        if sha256 is None:
+            with open(path, "rb") as f:
+                data = f.read()
+            return hashlib.sha256(data).hexdigest(), self.fv.detect_deepfake_sequence(data)
+        return sha256, self.fv.detect_deepfake_sequence(path, content_hash=sha256)
+
+    def _verify_pdf(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        return hashlib.sha256(data).hexdigest(), self.fv.verify_document(data)
+
+    def _analyzed(self, future, path, kind, sha256, started):
+        try:
+            result = future.result()
+        except Exception as e:
+            return self._write(_row(path, kind, sha256=sha256, status="error", error=str(e), ms=_ms(started)), retry=True)
+        sha256, result = result
+        if kind == "pdf":
+            status = result.get("verification_status")
+            failed = status in ("Error", "Timeout")
+            return self._write(_row(path, kind, sha256=sha256, status="error" if failed else "ok", verification_status=status,
+                                    details=result.get("details"), ms=_ms(started)), retry=failed)
+        self._write(self._detection_row(path, kind, sha256, result, started), retry=bool(result.get("error")))
+
+    @staticmethod
+    def _detection_row(path, kind, sha256, result, started):
+        if result.get("error"):
+            return _row(path, kind, sha256=sha256, status="error", error=result["error"], ms=_ms(started))
+        return _row(path, kind, sha256=sha256, status="ok", fake_score=result.get("fake_score"), real_score=result.get("real_score"),
+                    verdict=result.get("verdict"), frames_analyzed=result.get("frames_analyzed"),
+                    cached=result.get("cached", False), ms=_ms(started))
+
+    def _write(self, row, retry=False):
+        self.writer.write(row)
+        self.written += 1
+        self.counts["error" if row["status"] == "error" else row["kind"]] += 1
+        if not retry:
+            self.uncommitted.append(row["path"])
+        if len(self.uncommitted) >= self.args.checkpoint_every:
+            self._commit()
+
+    def _commit(self):
+        state = self.writer.commit()
+        self.checkpoint.record(state, self.uncommitted)
+        self.uncommitted = []
+
+    def _report(self, force=False):
+        now = time.perf_counter()
+        if force or now - self.last_report >= self.args.progress_seconds:
+            self.last_report = now
+            elapsed = now - self.started
+            rate = self.written / elapsed if elapsed > 0 else 0.0
+            print(f"{self.written} files in {elapsed:.0f}s ({rate:.1f} files/s): {self.counts['image']} images, "
+                  f"{self.counts['sequence']} clips, {self.counts['pdf']} PDFs, {self.counts['error']} errors.", file=sys.stderr)
+
+    def close(self):
+        self.decode_pool.shutdown(wait=False, cancel_futures=True)
+        self.threads.shutdown(wait=False, cancel_futures=True)
+
+
+def _ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def open_output(args, root):
+    """
+    Open the writer and checkpoint, resuming from the checkpoint when there is one.
+    Returns: (writer, checkpoint, finished paths)
+    """
+    checkpoint = Checkpoint(args.checkpoint or args.output.rstrip("/\\") + ".checkpoint")
+    header = {"version": CHECKPOINT_VERSION, "root": root, "format": args.format}
+    found, done, state = (None, set(), None) if args.restart else checkpoint.load()
+    if found is not None and (found.get("root"), found.get("format")) != (root, args.format):
+        raise SystemExit(f"{checkpoint.path} belongs to a scan of {found.get('root')} ({found.get('format')}); "
+                         "use another --output or pass --restart.")
+    if found is None and os.path.exists(args.output) and not args.restart:
+        raise SystemExit(f"{args.output} exists but has no checkpoint; remove it or pass --restart.")
+    resume = found is not None and os.path.exists(args.output)
+    if found is not None and not resume:
+        done, state = set(), None # The output is gone; start over
+    writer_class = ParquetWriter if args.format == "parquet" else JsonlWriter
+    writer = writer_class(args.output, (state or 0) if resume else None)
+    checkpoint.open(header, fresh=not resume)
+    return writer, checkpoint, done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan a directory tree of images and PDFs for deepfakes and document authenticity.")
+    parser.add_argument("root", help="Directory to scan")
+    parser.add_argument("--output", "-o", required=True, help="JSONL file, or a directory of part files with --format parquet")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), default="jsonl")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and overwrite the output")
+    parser.add_argument("--workers", "-w", type=int, default=min(4, os.cpu_count() or 1), help="Image decode processes")
+    parser.add_argument("--pdf-concurrency", type=int, default=4, help="PDFs and clips analyzed at once")
+    parser.add_argument("--batch-size", type=int, default=32, help="Images per classifier batch")
+    parser.add_argument("--checkpoint-every", type=int, default=500, help="Rows between checkpoints")
+    parser.add_argument("--progress-seconds", type=float, default=10.0, help="Seconds between progress lines")
+    args = parser.parse_args()
+
+    root = os.path.abspath(args.root)
+    if not os.path.isdir(root):
+        raise SystemExit(f"{args.root} is not a directory.")
+    writer, checkpoint, done = open_output(args, root)
+    print(f"Scanning {root} ({len(done)} files already finished).", file=sys.stderr)
+    scanner = Scanner(root, writer, checkpoint, args)
+    skipped = 0
+    try:
+        skipped = scanner.run(done)
+    except KeyboardInterrupt:
+        scanner._commit()
+        print("Interrupted; re-run the same command to resume.", file=sys.stderr)
+    finally:
+        scanner.close()
+        writer.close()
+        checkpoint.close()
+    elapsed = time.perf_counter() - scanner.started
+    rate = scanner.written / elapsed if elapsed > 0 else 0.0
+    print(f"Done: {scanner.written} files in {elapsed:.1f}s ({rate:.1f} files/s), {skipped} skipped as already finished; "
+          f"{scanner.counts['image']} images, {scanner.counts['sequence']} clips, {scanner.counts['pdf']} PDFs, "
+          f"{scanner.counts['error']} errors.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
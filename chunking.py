@@ -0,0 +1,183 @@
+# chunking.py
+
+import hashlib
+import re
+
+# pdfminer separates pages with form feeds
+PAGE_BREAK = "\f"
+
+# Lines that look like section headings: "Abstract", "2. Methods", "3.1 Data", "IV. RESULTS", "REFERENCES"
+SECTION_HEADING_PATTERN = re.compile(
+    r"^\s*(?:(?:\d+(?:\.\d+)*|[IVXLC]+)\.?\s+[A-Z][^\n]{0,80}"
+    r"|(?i:abstract|introduction|background|related work|methods?|methodology|materials and methods|"
+    r"results?|discussion|conclusions?|references|bibliography|acknowledg(?:e)?ments?|appendix)\b[^\n]{0,40}"
+    r"|[A-Z][A-Z \-]{3,60})\s*$",
+    re.MULTILINE,
+)
+
+
+def estimate_tokens(text):
+    """Rough token count for budgeting (about 4 characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+
+def split_sections(text):
+    """
+    Split text into segments on page breaks and section-heading lines.
+    Headings stay at the start of the segment they introduce.
+    Returns: list of non-empty str
+    """
+    segments = []
+    for page in text.split(PAGE_BREAK):
+        starts = [0] + [m.start() for m in SECTION_HEADING_PATTERN.finditer(page) if m.start() > 0]
+        for begin, end in zip(starts, starts[1:] + [len(page)]):
+            segment = page[begin:end]
+            if segment.strip():
+                segments.append(segment)
+    return segments
+
+
+def _split_oversized(segment, max_chars):
+    """Break a segment longer than max_chars on paragraph, then line, then hard boundaries."""
+    if len(segment) <= max_chars:
+        return [segment]
+    for separator in ("\n\n", "\n", " "):
+        parts = segment.split(separator)
+        if len(parts) > 1:
+            pieces, current = [], ""
+            for part in parts:
+                candidate = current + separator + part if current else part
+                if len(candidate) <= max_chars:
+                    current = candidate
+                    continue
+                if current:
+                    pieces.append(current)
+                current = part
+            if current:
+                pieces.append(current)
+            result = []
+            for piece in pieces:
+                result.extend(_split_oversized(piece, max_chars))
+            return result
+    return [segment[i:i + max_chars] for i in range(0, len(segment), max_chars)]
+
+
+def chunk_text(text, max_chars):
+    """
+    Pack section/page segments into chunks of at most max_chars, keeping
+    neighbouring short sections together.
+    Returns: list of str
+    """
+    chunks, current = [], ""
+    for segment in split_sections(text):
+        for piece in _split_oversized(segment, max_chars):
+            if current and len(current) + len(piece) > max_chars:
+                chunks.append(current)
+                current = ""
+            current += piece
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+# Top-level headings only ("2. Methods", "IV. RESULTS", "Abstract"); "3.1 Data" stays inside its section
+TOP_LEVEL_HEADING_PATTERN = re.compile(
+    r"^\s*(?:(?:\d+|[IVXLC]+)\.?\s+[A-Z][^\n]{0,80}"
+    r"|(?i:abstract|introduction|background|related work|methods?|methodology|materials and methods|"
+    r"results?|discussion|conclusions?|references|bibliography|acknowledg(?:e)?ments?|appendix)\b[^\n]{0,40})\s*$",
+    re.MULTILINE,
+)
+_PAGE_NUMBER_LINE = re.compile(r"^\s*(?:page\s+)?\d+(?:\s*(?:/|of)\s*\d+)?\s*$", re.IGNORECASE | re.MULTILINE)
+
+
+def strip_page_furniture(text):
+    """
+    Remove what pagination adds: form feeds, page-number lines, and running
+    headers/footers (lines repeated on at least half of 3+ pages).
+    Returns: str
+    """
+    pages = text.split(PAGE_BREAK)
+    if len(pages) >= 3:
+        counts = {}
+        for page in pages:
+            for line in {line.strip() for line in page.splitlines() if line.strip()}:
+                counts[line] = counts.get(line, 0) + 1
+        running = {line for line, count in counts.items() if count * 2 >= len(pages)}
+        if running:
+            pages = ["\n".join(line for line in page.splitlines() if line.strip() not in running) for page in pages]
+    return _PAGE_NUMBER_LINE.sub("", "\n".join(pages))
+
+
+def _content_defined_pack(pieces, min_chars, max_chars):
+    """
+    Pack pieces into chunks of at most max_chars. Once a chunk reaches min_chars,
+    a piece closes it when its content hash falls below a threshold proportional
+    to the piece's length, so chunks run about (max_chars - min_chars) / 2 past
+    min_chars. The cut points depend on the pieces themselves rather than on
+    everything before them, so an edit only changes the chunks around it.
+    """
+    gap = max(1, (max_chars - min_chars) // 2)
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and len(current) + len(piece) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += piece
+        if len(current) >= min_chars and int(unit_fingerprint(piece)[:8], 16) < len(piece) * (1 << 32) // gap:
+            chunks.append(current)
+            current = ""
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+def revision_units(text, max_chars, min_chars=None):
+    """
+    Split a document into units that stay stable across revisions, for caching
+    per-section analysis: page furniture is stripped so reflowed pages do not
+    matter, and top-level sections are cut into sentences (which, unlike
+    paragraphs, a page break cannot split or merge) that are packed up to
+    max_chars by content-defined boundaries.
+    Returns: list of str
+    """
+    min_chars = max_chars * 2 // 3 if min_chars is None else min_chars
+    body = strip_page_furniture(text)
+    starts = [0] + [m.start() for m in TOP_LEVEL_HEADING_PATTERN.finditer(body) if m.start() > 0]
+    sections = [body[begin:end] for begin, end in zip(starts, starts[1:] + [len(body)]) if body[begin:end].strip()]
+    sentences = [
+        piece
+        for section in sections
+        for sentence in re.split(r"(?<=[.!?])(?=\s)", section)
+        for piece in _split_oversized(sentence, max_chars)
+    ]
+    return _content_defined_pack(sentences, min_chars, max_chars)
+
+
+def unit_fingerprint(unit):
+    """Hash of a unit's text with whitespace normalized. Returns: hex str"""
+    return hashlib.sha256(" ".join(unit.split()).encode()).hexdigest()
+
+
+def select_within_budget(chunks, token_budget):
+    """
+    Pick chunks whose estimated tokens fit token_budget, spread evenly across the
+    document and always keeping the first and last chunk when possible.
+    Returns: list of indexes into chunks (sorted)
+    """
+    costs = [estimate_tokens(chunk) for chunk in chunks]
+    if not token_budget or sum(costs) <= token_budget:
+        return list(range(len(chunks)))
+    average = max(1, sum(costs) // len(costs))
+    target = max(1, min(len(chunks), token_budget // average))
+    if target == 1:
+        candidates = [0]
+    else:
+        step = (len(chunks) - 1) / (target - 1)
+        candidates = sorted({round(i * step) for i in range(target)})
+    selected, spent = [], 0
+    for index in candidates:
+        if spent + costs[index] > token_budget and selected:
+            continue
+        selected.append(index)
+        spent += costs[index]
+    return selected
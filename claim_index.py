@@ -0,0 +1,301 @@
+# claim_index.py
+#
+# Semantic near-duplicate index over previously verified claims. Each verdict is
+# stored with the sentence embedding of its claim; a new claim whose nearest
+# stored neighbour is similar enough (cosine) reuses that verdict instead of
+# calling Gemini again.
+#
+# Storage is two files in one directory per embedding model:
+#   vectors.f32  raw float32 rows, memory-mapped; row id-1 holds claim id's vector
+#   claims.db    SQLite: the verdicts, their scope (Gemini model + prompt version)
+#                and expiry, keyed by the same id
+# Inserts append (SQLite hands out the id, the vector goes into that row), so
+# gunicorn workers and CLI runs on one host share and grow the same index.
+# Search is one matrix-vector product over the mapped rows; past ann_min_rows,
+# an HNSW graph (faiss, optional) is built in the background and used instead.
+
+import fcntl
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+_NEGATION_PATTERN = re.compile(r"\b(not|no|never|none|nobody|nothing|neither|nor|cannot|false)\b|n't\b")
+_NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def claims_compatible(a, b):
+    """
+    Guard against the classic embedding near-misses: a claim and its negation, or
+    the same sentence with different numbers, embed almost identically but have
+    opposite verdicts. Both must agree on negation parity and on every number.
+    """
+    a, b = a.casefold(), b.casefold()
+    if len(_NEGATION_PATTERN.findall(a)) % 2 != len(_NEGATION_PATTERN.findall(b)) % 2:
+        return False
+    return sorted(_NUMBER_PATTERN.findall(a)) == sorted(_NUMBER_PATTERN.findall(b))
+
+
+class SentenceEmbedder:
+    """
+    Mean-pooled, L2-normalized sentence embeddings from a small transformer
+    (all-MiniLM-L6-v2 by default: 384 dimensions, a few milliseconds per claim on CPU).
+    """
+
+    def __init__(self, model_name, max_length=128):
+        from transformers import AutoModel, AutoTokenizer
+        self.model_name = model_name
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name).eval()
+        self.dim = self.model.config.hidden_size
+
+    def embed(self, texts):
+        """Returns: float32 array (len(texts), dim) of unit vectors"""
+        import torch
+        encoded = self.tokenizer(list(texts), padding=True, truncation=True, max_length=self.max_length, return_tensors="pt")
+        with torch.inference_mode():
+            hidden = self.model(**encoded).last_hidden_state
+        mask = encoded["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        return torch.nn.functional.normalize(pooled, dim=-1).numpy().astype("float32")
+
+
+class ClaimIndex:
+    """
+    Append-only vector index plus verdict store; see the module comment for the layout.
+    Vectors passed in must be unit length (cosine similarity = dot product).
+    """
+
+    def __init__(self, directory, dim, grow_rows=16384, ann_min_rows=200000, refresh_seconds=1.0):
+        import numpy as np
+        self.np = np
+        self.directory = directory
+        self.dim = int(dim)
+        self.grow_rows = grow_rows
+        self.ann_min_rows = ann_min_rows
+        self.refresh_seconds = refresh_seconds
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.db_path = os.path.join(directory, "claims.db")
+        self._lock = threading.Lock()
+        self._vectors = None # np.memmap over the whole file, remapped when the file grows
+        self._mapped_rows = 0
+        self._rows = 0 # Highest claim id known to this process
+        self._last_refresh = 0.0
+        self._ann = None
+        self._ann_rows = 0
+        self._ann_building = False
+        self._stats = {"lookups": 0, "hits": 0, "rejected_guard": 0, "inserts": 0}
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS claims ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, scope TEXT NOT NULL, claim TEXT NOT NULL, normalized TEXT NOT NULL, "
+                "verdict TEXT NOT NULL, created_at REAL NOT NULL, expires_at REAL, deleted INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS claims_normalized ON claims (normalized)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            stored = conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+            if stored is None:
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('dim', ?)", (str(self.dim),))
+            elif int(stored[0]) != self.dim:
+                raise ValueError(f"Claim index at {directory} holds {stored[0]}-d vectors, not {self.dim}-d")
+        if not os.path.exists(self.vectors_path):
+            open(self.vectors_path, "ab").close()
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per call keeps this safe across threads and forks.
+        conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # --- Vector file ---
+
+    def _row_bytes(self):
+        return self.dim * 4
+
+    def _ensure_capacity(self, rows):
+        """Grow the vector file (in grow_rows steps) to hold rows rows; never shrinks it."""
+        needed = rows * self._row_bytes()
+        with open(self.vectors_path, "r+b") as f:
+            if os.fstat(f.fileno()).st_size >= needed:
+                return
+            fcntl.flock(f, fcntl.LOCK_EX) # Another process may be growing it too
+            try:
+                size = os.fstat(f.fileno()).st_size
+                if size < needed:
+                    step = self.grow_rows * self._row_bytes()
+                    os.ftruncate(f.fileno(), -(-needed // step) * step)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _map(self, rows):
+        """Make sure the mapping covers at least rows rows (caller holds _lock)."""
+        if self._vectors is not None and self._mapped_rows >= rows:
+            return
+        file_rows = os.path.getsize(self.vectors_path) // self._row_bytes()
+        if file_rows == 0:
+            return
+        self._vectors = self.np.memmap(self.vectors_path, dtype="float32", mode="r+", shape=(file_rows, self.dim))
+        self._mapped_rows = file_rows
+
+    def _refresh(self, force=False):
+        """Pick up rows other processes appended since the last look (at most once per refresh_seconds)."""
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.refresh_seconds:
+            return
+        self._last_refresh = now
+        with self._connect() as conn:
+            rows = conn.execute("SELECT COALESCE(MAX(id), 0) FROM claims").fetchone()[0]
+        with self._lock:
+            if rows > self._rows:
+                self._map(rows)
+                self._rows = min(rows, self._mapped_rows)
+
+    # --- Writes ---
+
+    def add(self, scope, claim, normalized, vector, verdict, ttl=None):
+        """Store a verdict with its claim vector. Returns: claim id"""
+        now = time.time()
+        with self._connect() as conn:
+            claim_id = conn.execute(
+                "INSERT INTO claims (scope, claim, normalized, verdict, created_at, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (scope, claim, normalized, json.dumps(verdict), now, now + ttl if ttl else None),
+            ).lastrowid
+        self._ensure_capacity(claim_id)
+        with self._lock:
+            self._map(claim_id)
+            self._vectors[claim_id - 1] = vector
+            self._rows = max(self._rows, claim_id)
+            self._stats["inserts"] += 1
+        return claim_id
+
+    def delete(self, normalized):
+        """Forget every stored verdict for a normalized claim. Returns: number removed"""
+        with self._connect() as conn:
+            ids = [row[0] for row in conn.execute("SELECT id FROM claims WHERE normalized = ? AND deleted = 0", (normalized,))]
+            conn.execute("UPDATE claims SET deleted = 1 WHERE normalized = ?", (normalized,))
+        with self._lock:
+            if ids:
+                self._map(max(ids))
+            for claim_id in ids:
+                if claim_id <= self._mapped_rows:
+                    self._vectors[claim_id - 1] = 0 # Zero vectors never pass the threshold
+        return len(ids)
+
+    def clear(self):
+        """Drop every verdict. Ids keep counting up, so other processes' views stay valid."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM claims")
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors[:] = 0
+            self._ann = None
+            self._ann_rows = 0
+
+    # --- Search ---
+
+    def _ann_search(self, vector, k):
+        """Top-k through the HNSW graph, adding rows inserted since it was built. None if unavailable."""
+        if self._ann is None:
+            if self._rows >= self.ann_min_rows and not self._ann_building:
+                self._ann_building = True
+                threading.Thread(target=self._build_ann, name="claim-index-ann", daemon=True).start()
+            return None
+        with self._lock:
+            if self._rows > self._ann_rows:
+                self._ann.add(self.np.ascontiguousarray(self._vectors[self._ann_rows:self._rows]))
+                self._ann_rows = self._rows
+        scores, rows = self._ann.search(vector.reshape(1, -1), k)
+        return [(int(row) + 1, float(score)) for row, score in zip(rows[0], scores[0]) if row >= 0]
+
+    def _build_ann(self):
+        try:
+            import faiss
+        except ImportError:
+            logger.info("faiss is not installed; the claim index keeps using exact search.")
+            return
+        started = time.perf_counter()
+        with self._lock:
+            vectors, rows = self._vectors, self._rows
+        ann = faiss.IndexHNSWFlat(self.dim, 32, faiss.METRIC_INNER_PRODUCT)
+        ann.hnsw.efSearch = 64
+        for start in range(0, rows, 65536):
+            ann.add(self.np.ascontiguousarray(vectors[start:min(rows, start + 65536)]))
+        with self._lock:
+            self._ann, self._ann_rows = ann, rows
+        logger.info("Claim index HNSW graph built", extra={"fields": {"rows": rows, "seconds": round(time.perf_counter() - started, 1)}})
+
+    def nearest(self, vector, k=5):
+        """Top-k (claim id, cosine similarity) by similarity, best first."""
+        self._refresh()
+        np = self.np
+        vector = np.asarray(vector, dtype="float32")
+        with self._lock:
+            vectors, rows = self._vectors, self._rows
+        if rows == 0:
+            return []
+        found = self._ann_search(vector, k) if rows >= self.ann_min_rows else None
+        if found is not None:
+            return found
+        similarities = vectors[:rows] @ vector
+        k = min(k, rows)
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return [(int(row) + 1, float(similarities[row])) for row in top]
+
+    def lookup(self, scope, claim, vector, threshold, k=5):
+        """
+        Best stored verdict for a claim: same scope, not expired or deleted, cosine
+        similarity >= threshold, and compatible negation/numbers.
+        Returns: dict with 'verdict', 'claim' (the stored one), 'similarity', or None
+        """
+        self._stats["lookups"] += 1
+        candidates = [(claim_id, similarity) for claim_id, similarity in self.nearest(vector, k) if similarity >= threshold]
+        if not candidates:
+            return None
+        with self._connect() as conn:
+            placeholders = ",".join("?" * len(candidates))
+            rows = {
+                row[0]: row[1:]
+                for row in conn.execute(
+                    f"SELECT id, scope, claim, verdict, expires_at, deleted FROM claims WHERE id IN ({placeholders})",
+                    [claim_id for claim_id, _ in candidates],
+                )
+            }
+        now = time.time()
+        for claim_id, similarity in candidates:
+            row = rows.get(claim_id)
+            if row is None:
+                continue
+            stored_scope, stored_claim, verdict, expires_at, deleted = row
+            if deleted or stored_scope != scope or (expires_at is not None and expires_at <= now):
+                continue
+            if not claims_compatible(claim, stored_claim):
+                self._stats["rejected_guard"] += 1
+                continue
+            self._stats["hits"] += 1
+            return {"verdict": json.loads(verdict), "claim": stored_claim, "similarity": round(similarity, 4)}
+        return None
+
+    def stats(self):
+        self._refresh(force=True)
+        stats = dict(self._stats)
+        stats.update(
+            rows=self._rows,
+            dim=self.dim,
+            search="hnsw" if self._ann is not None else "exact",
+            file_mb=round(os.path.getsize(self.vectors_path) / 2**20, 1),
+        )
+        return stats
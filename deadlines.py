@@ -0,0 +1,100 @@
+# deadlines.py
+#
+# Per-request deadlines. The web layer opens one when a request arrives (the
+# endpoint's REQUEST_TIMEOUT_* budget, shortened by an X-Request-Timeout header)
+# and the analysis functions accept a timeout that can only shorten it. The
+# absolute deadline lives in a contextvar, like the request id, so it follows
+# the request into helpers, pool threads started with copy_context() and the LLM
+# scheduler, which bounds queueing, retries and each Gemini call by the time left.
+# Work that runs out of time raises DeadlineExceeded; callers turn that into a
+# "Timeout" result instead of hanging.
+
+import contextlib
+import contextvars
+import os
+import time
+
+# Default budgets per route; analysis stays under gunicorn's 120s worker timeout
+REQUEST_TIMEOUT_VERIFY = float(os.getenv("REQUEST_TIMEOUT_VERIFY", "30"))
+REQUEST_TIMEOUT_ANALYSIS = float(os.getenv("REQUEST_TIMEOUT_ANALYSIS", "110"))
+REQUEST_TIMEOUT_MAX = float(os.getenv("REQUEST_TIMEOUT_MAX", "600")) # Cap on X-Request-Timeout for routes without a budget
+ROUTE_TIMEOUTS = {
+    "/verify": REQUEST_TIMEOUT_VERIFY,
+    "/evaluate": REQUEST_TIMEOUT_ANALYSIS,
+    "/evaluate/stream": REQUEST_TIMEOUT_ANALYSIS,
+    "/verify-document": REQUEST_TIMEOUT_ANALYSIS,
+    "/verify-document/stream": REQUEST_TIMEOUT_ANALYSIS,
+}
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def current():
+    """Absolute deadline (time.monotonic() seconds) for the current context, or None."""
+    return _deadline.get()
+
+
+def remaining():
+    """Seconds left before the current deadline (negative once passed), or None without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check(what="The request"):
+    """Raise DeadlineExceeded if the current deadline has passed."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"{what} ran past its deadline.")
+
+
+def request_budget(path, requested=None):
+    """
+    Seconds a request to path may take: the route's budget, lowered (never raised)
+    by the client's X-Request-Timeout value. Routes without a budget (batch, jobs,
+    admin) only get one when the client asks, capped at REQUEST_TIMEOUT_MAX.
+    Returns: float or None
+    """
+    budget = ROUTE_TIMEOUTS.get(path)
+    try:
+        asked = float(requested) if requested else None
+    except ValueError:
+        asked = None
+    if asked is None or asked <= 0:
+        return budget
+    return min(asked, budget if budget is not None else REQUEST_TIMEOUT_MAX)
+
+
+def begin(seconds):
+    """Start a new request's deadline, replacing any left on this thread by an earlier request (None = no deadline)."""
+    _deadline.set(None if seconds is None else time.monotonic() + max(0.0, seconds))
+
+
+def start(seconds):
+    """
+    Set a deadline seconds from now (or keep an earlier one already in effect).
+    seconds=None leaves the current deadline unchanged.
+    Returns: token for reset()
+    """
+    deadline = _deadline.get()
+    if seconds is not None:
+        candidate = time.monotonic() + max(0.0, seconds)
+        deadline = candidate if deadline is None else min(deadline, candidate)
+    return _deadline.set(deadline)
+
+
+def reset(token):
+    _deadline.reset(token)
+
+
+@contextlib.contextmanager
+def scope(seconds):
+    """Run the block under start(seconds), restoring the previous deadline afterwards."""
+    token = start(seconds)
+    try:
+        yield _deadline.get()
+    finally:
+        reset(token)
@@ -0,0 +1,159 @@
+# deepfake_backends.py
+#
+# Interchangeable CPU inference backends for the deepfake classifier. Every backend
+# is a callable taking the processor's output dict and returning logits as a torch
+# tensor, so _score_images does not care which one is active.
+#
+#   eager    stock PyTorch FP32 (default)
+#   int8     dynamic INT8 quantization of the Linear layers (torch.ao.quantization)
+#   compile  torch.compile of the eager model (slow first call, faster steady state)
+#   onnx     exported ONNX graph run by onnxruntime (needs the onnx and onnxruntime packages)
+
+import os
+import time
+
+from resource_manager import thread_budget
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+BACKENDS = ("eager", "int8", "compile", "onnx")
+DEEPFAKE_ONNX_DIR = os.getenv("DEEPFAKE_ONNX_DIR", os.path.join("cache", "onnx"))
+
+
+class EagerBackend:
+    name = "eager"
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, inputs):
+        import torch
+        with torch.inference_mode():
+            return self.model(**inputs).logits
+
+
+class Int8Backend(EagerBackend):
+    name = "int8"
+
+    def __init__(self, model):
+        import copy
+        import torch
+        # Quantize a copy so the FP32 model stays available (and shared) for the eager path
+        super().__init__(torch.ao.quantization.quantize_dynamic(copy.deepcopy(model), {torch.nn.Linear}, dtype=torch.qint8))
+
+
+class CompileBackend(EagerBackend):
+    name = "compile"
+
+    def __init__(self, model):
+        import torch
+        super().__init__(torch.compile(model))
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, model, processor, model_name):
+        import onnxruntime
+        path = _export_onnx(model, processor, model_name)
+        options = onnxruntime.SessionOptions()
+        # 0 = this worker's share of the cores, like the PyTorch pools
+        threads = int(os.getenv("DEEPFAKE_ONNX_THREADS", "0")) or thread_budget()["intra_op"]
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.path = path
+
+    def __call__(self, inputs):
+        import torch
+        pixel_values = inputs["pixel_values"].cpu().numpy()
+        logits = self.session.run(None, {self.input_name: pixel_values})[0]
+        return torch.from_numpy(logits)
+
+
+def _export_onnx(model, processor, model_name):
+    """Export the classifier to ONNX once (dynamic batch axis) and reuse the file afterwards."""
+    import torch
+    from PIL import Image
+
+    os.makedirs(DEEPFAKE_ONNX_DIR, exist_ok=True)
+    path = os.path.join(DEEPFAKE_ONNX_DIR, model_name.replace("/", "__") + ".onnx")
+    if os.path.exists(path):
+        return path
+    sample = processor(images=[Image.new("RGB", (224, 224))], return_tensors="pt")["pixel_values"]
+    logger.info(f"Exporting deepfake model to ONNX at {path}...")
+    tmp_path = path + ".tmp"
+    torch.onnx.export(
+        _logits_only(model),
+        (sample,),
+        tmp_path,
+        input_names=["pixel_values"],
+        output_names=["logits"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=17,
+    )
+    os.replace(tmp_path, path) # Atomic, so concurrent workers never load a half-written file
+    return path
+
+
+def _logits_only(model):
+    import torch
+
+    class Wrapper(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model(pixel_values=pixel_values).logits
+
+    return Wrapper().eval()
+
+
+def build_backend(name, model, processor, model_name):
+    """
+    Build the named backend around a loaded classifier.
+    Raises ValueError for unknown names; import/export errors propagate to the caller.
+    """
+    name = (name or "eager").lower()
+    if name == "eager":
+        return EagerBackend(model)
+    if name == "int8":
+        return Int8Backend(model)
+    if name == "compile":
+        return CompileBackend(model)
+    if name == "onnx":
+        return OnnxBackend(model, processor, model_name)
+    raise ValueError(f"Unknown deepfake backend '{name}'. Choose one of: {', '.join(BACKENDS)}")
+
+
+def scores_from_logits(logits):
+    """Softmax percentages per image as a list of lists (same math as _score_images)."""
+    import torch
+    return (torch.nn.functional.softmax(logits.float(), dim=-1) * 100).tolist()
+
+
+def check_parity(reference, candidate, inputs, tolerance=1.0):
+    """
+    Compare two backends on the same preprocessed batch.
+    tolerance is the largest allowed difference in score percentage points.
+    Returns: dict with 'max_abs_diff', 'tolerance' and 'ok'
+    """
+    expected = scores_from_logits(reference(inputs))
+    actual = scores_from_logits(candidate(inputs))
+    max_diff = max(abs(a - b) for row_a, row_b in zip(expected, actual) for a, b in zip(row_a, row_b))
+    return {"max_abs_diff": round(max_diff, 4), "tolerance": tolerance, "ok": max_diff <= tolerance}
+
+
+def time_backend(backend, inputs, repeats=5, warmup=1):
+    """Median seconds per call of backend(inputs) after warmup calls."""
+    for _ in range(warmup):
+        backend(inputs)
+    durations = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        backend(inputs)
+        durations.append(time.perf_counter() - started)
+    durations.sort()
+    return durations[len(durations) // 2]
@@ -1,72 +1,710 @@
 # fact_verification.py
 
+import asyncio
+import contextlib
+import contextvars
 import os
 import re
+import threading
+import time
+import hashlib
+import json
+import warnings
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from dotenv import load_dotenv
-import google.generativeai as genai # Main import
-# Note: genai.types will be used directly below, no separate import needed if genai is imported
-import torch
-from transformers import AutoModelForImageClassification, AutoProcessor
+# Heavy dependencies (google.generativeai, torch, transformers, pdfminer) are imported
+# lazily by the model loaders, helpers and pdf_extraction workers, so importing this module stays fast.
 from PIL import Image, UnidentifiedImageError
-
-# --- Add Warning Suppression ---
-import warnings
-try:
-    # Suppress the specific FutureWarning from huggingface_hub if possible
-    from huggingface_hub.file_download import CCompletionProgress # Check if class exists
-    warnings.filterwarnings("ignore", category=FutureWarning, module='huggingface_hub.file_download')
-    print("Suppressed specific huggingface_hub FutureWarning.")
-except ImportError:
-    # Fallback to suppressing all FutureWarnings if specific import fails
-    warnings.filterwarnings("ignore", category=FutureWarning)
-    print("Suppressed general FutureWarning (huggingface_hub specific import failed).")
-# -----------------------------
+import deadlines
+import llm_scheduler
+import metrics
+import frame_sequence
+import image_decode
+import pdf_extraction
+from chunking import chunk_text, estimate_tokens, revision_units, select_within_budget, unit_fingerprint
+from inference_batcher import MicroBatcher
+from model_registry import ModelRegistry
+from resource_manager import Overloaded
+from result_cache import TieredCache
+from structured_logging import get_logger
+from uploads import BufferedUpload, describe_source, is_path, open_source
 
 # --- Environment Setup ---
 load_dotenv()
+logger = get_logger(__name__)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-llm_model = None # Initialize
+# Use latest Flash model - potentially make this configurable
+MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-1.5-flash-latest")
+# Use environment variable for model name or default
+DEEPFAKE_MODEL_NAME = os.getenv("DEEPFAKE_MODEL", "Hemg/Deepfake-image")
+# CPU inference backend for the classifier: eager, int8, compile or onnx (see deepfake_backends.py)
+DEEPFAKE_BACKEND = os.getenv("DEEPFAKE_BACKEND", "eager").lower()
+
+# --- Model Registry ---
+# Models are loaded on first use, or up front via warmup_models().
+models = ModelRegistry(retry_seconds=int(os.getenv("MODEL_RETRY_SECONDS", "60")))
+
+
+def _load_llm():
+    """Configure Gemini and build the GenerativeModel (registry loader)."""
+    if not GEMINI_API_KEY:
+        raise RuntimeError("GEMINI_API_KEY environment variable not set. AI features will be unavailable.")
+    import google.generativeai as genai
+    genai.configure(api_key=GEMINI_API_KEY)
+    logger.info(f"Configuring Gemini AI Model: {MODEL_NAME}...")
+    return genai.GenerativeModel(MODEL_NAME)
+
 
-if not GEMINI_API_KEY:
-    print("CRITICAL: GEMINI_API_KEY environment variable not set. AI features will be unavailable.")
-else:
+def _load_deepfake():
+    """Load the HuggingFace processor and classifier (registry loader). Returns (processor, model)."""
+    # huggingface_hub emits FutureWarnings on download that are not actionable for us
+    warnings.filterwarnings("ignore", category=FutureWarning, module="huggingface_hub")
+    from transformers import AutoModelForImageClassification, AutoProcessor
+    logger.info(f"Loading Deepfake model: {DEEPFAKE_MODEL_NAME}...")
+    processor = AutoProcessor.from_pretrained(DEEPFAKE_MODEL_NAME)
+    model = AutoModelForImageClassification.from_pretrained(DEEPFAKE_MODEL_NAME)
+    model.eval()
+    return processor, model
+
+
+def _load_deepfake_backend():
+    """
+    Wrap the loaded classifier in the configured DEEPFAKE_BACKEND (registry loader).
+    Falls back to eager PyTorch if the backend cannot be built (e.g. onnxruntime missing).
+    """
+    from deepfake_backends import EagerBackend, build_backend
+    deepfake_processor, deepfake_model = get_deepfake_model()
+    if deepfake_model is None:
+        raise RuntimeError("Deepfake model is not available.")
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        # Use latest Flash model - potentially make this configurable
-        MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-1.5-flash-latest")
-        print(f"Configuring Gemini AI Model: {MODEL_NAME}...")
-        llm_model = genai.GenerativeModel(MODEL_NAME)
-        # Consider a quick test call here to ensure the API key is valid if needed
-        print(f"Gemini AI Model configured successfully.")
+        backend = build_backend(DEEPFAKE_BACKEND, deepfake_model, deepfake_processor, DEEPFAKE_MODEL_NAME)
     except Exception as e:
-        print(f"FATAL: Error configuring Gemini AI with key: {e}")
-        # Exiting or raising might be appropriate if LLM is critical
-        # raise RuntimeError(f"Failed to configure Gemini AI: {e}") from e
-
-# --- Deepfake Detection Model Setup ---
-deepfake_processor = None
-deepfake_model = None
-try:
-    # Use environment variable for model name or default
-    DEEPFAKE_MODEL_NAME = os.getenv("DEEPFAKE_MODEL", "Hemg/Deepfake-image")
-    print(f"Loading Deepfake model: {DEEPFAKE_MODEL_NAME}...")
-    deepfake_processor = AutoProcessor.from_pretrained(DEEPFAKE_MODEL_NAME)
-    deepfake_model = AutoModelForImageClassification.from_pretrained(DEEPFAKE_MODEL_NAME)
-    print("Deepfake Detection Model loaded successfully.")
-except Exception as e:
-    print(f"Warning: Could not load Deepfake model '{DEEPFAKE_MODEL_NAME}'. Deepfake detection will be unavailable. Error: {e}")
+        logger.warning(f"Could not build '{DEEPFAKE_BACKEND}' deepfake backend ({e}); falling back to eager.")
+        metrics.count("deepfake_backend_fallback", backend=DEEPFAKE_BACKEND)
+        backend = EagerBackend(deepfake_model)
+    logger.info(f"Deepfake inference backend: {backend.name}")
+    return backend
+
+
+def _load_claim_embedder():
+    """Load the sentence embedding model for the near-duplicate claim index (registry loader)."""
+    from claim_index import SentenceEmbedder
+    logger.info(f"Loading claim embedding model: {CLAIM_INDEX_MODEL}...")
+    return SentenceEmbedder(CLAIM_INDEX_MODEL)
+
+
+models.register("gemini", _load_llm)
+models.register("deepfake", _load_deepfake)
+models.register("deepfake_backend", _load_deepfake_backend)
+
+
+def llm_configured():
+    """Returns: bool (a Gemini API key is set, or a model was installed directly)"""
+    return bool(GEMINI_API_KEY) or models.is_ready("gemini")
+
+
+def get_llm_model():
+    """Return the Gemini model, configuring it on first use. None if unavailable."""
+    return models.get("gemini")
+
+
+def get_deepfake_model():
+    """Return (processor, model) for deepfake detection, loading on first use. (None, None) if unavailable."""
+    loaded = models.get("deepfake")
+    return loaded if loaded is not None else (None, None)
+
+
+def warmup_models(names=None, background=False):
+    """
+    Load models now instead of on the first request.
+    Returns: {name: bool} when blocking, or the warmup thread when background=True.
+    """
+    if background:
+        return models.warmup_in_background(names)
+    return models.warmup(names)
+
+
+def share_deepfake_weights():
+    """
+    Load the deepfake classifier and move its weights into shared memory.
+    Call this in a gunicorn master before forking (preload mode) so workers reuse
+    the parent's weight pages instead of copying them on first touch. The int8
+    backend's quantized copy is built here too, so workers inherit one copy
+    instead of each quantizing its own.
+    Returns: bool (True if the model is loaded and shared)
+    """
+    deepfake_processor, deepfake_model = get_deepfake_model()
+    if deepfake_model is None:
+        return False
+    deepfake_model.share_memory()
+    if DEEPFAKE_BACKEND == "int8":
+        models.get("deepfake_backend")
+    return True
+
+
+def model_status():
+    """
+    Per-model load state and load time, for the readiness endpoint.
+    Returns: dict (JSON serializable)
+    """
+    return models.status()
+
+
+# --- Deepfake Micro-Batching Setup ---
+# Concurrent /detect requests are grouped into one batched forward pass.
+# Set DEEPFAKE_BATCHING=0 to run every image on its own.
+DEEPFAKE_BATCHING = os.getenv("DEEPFAKE_BATCHING", "1").lower() not in ("0", "false", "no")
+DEEPFAKE_BATCH_MAX_SIZE = int(os.getenv("DEEPFAKE_BATCH_MAX_SIZE", "16"))
+DEEPFAKE_BATCH_MAX_WAIT_MS = float(os.getenv("DEEPFAKE_BATCH_MAX_WAIT_MS", "10"))
+deepfake_batcher = None # Created on first use, see _get_deepfake_batcher()
+
+# --- Deepfake Result Cache Setup ---
+# Scores are cached by decoded pixel content. DEEPFAKE_CACHE_PERCEPTUAL=1 also keys
+# them by a perceptual hash, so re-encoded or resized copies hit too; it is off by
+# default because a near-identical image is not necessarily the same image, and
+# results report which kind of match they came from. Set DEEPFAKE_CACHE_DB to a file
+# path to add a SQLite tier that survives restarts and is shared by gunicorn workers.
+DEEPFAKE_CACHE_ENABLED = os.getenv("DEEPFAKE_CACHE", "1").lower() not in ("0", "false", "no")
+DEEPFAKE_CACHE_PERCEPTUAL = os.getenv("DEEPFAKE_CACHE_PERCEPTUAL", "0").lower() not in ("0", "false", "no")
+deepfake_cache = None
+if DEEPFAKE_CACHE_ENABLED:
+    deepfake_cache = TieredCache(
+        "deepfake_results",
+        max_entries=int(os.getenv("DEEPFAKE_CACHE_MAX_ENTRIES", "4096")),
+        ttl=int(os.getenv("DEEPFAKE_CACHE_TTL", str(7 * 24 * 3600))),
+        db_path=os.getenv("DEEPFAKE_CACHE_DB") or None
+    )
+
+# --- Claim Verdict Cache Setup ---
+# verify_fact results are cached by normalized claim + Gemini model + prompt version.
+# Bump FACT_CHECK_PROMPT_VERSION whenever the fact-check prompt or parsing changes.
+# The SQLite tier (CLAIM_CACHE_DB, empty to disable) is shared by workers and CLI runs.
+FACT_CHECK_PROMPT_VERSION = "factcheck-v1"
+CLAIM_CACHE_ENABLED = os.getenv("CLAIM_CACHE", "1").lower() not in ("0", "false", "no")
+CLAIM_CACHE_TTL = int(os.getenv("CLAIM_CACHE_TTL", str(24 * 3600)))
+CLAIM_CACHE_TTL_TIME_SENSITIVE = int(os.getenv("CLAIM_CACHE_TTL_TIME_SENSITIVE", "3600"))
+UNCACHEABLE_SCORES = ("Error", "Blocked", "N/A", "Timeout")
+TIME_SENSITIVE_PATTERN = re.compile(
+    r"\b(today|tonight|yesterday|tomorrow|now|currently|current|latest|recent|recently|breaking|"
+    r"this (week|month|year)|right now|live|ongoing|price|stock|weather|score|election)\b"
+)
+claim_cache = None
+if CLAIM_CACHE_ENABLED:
+    claim_cache = TieredCache(
+        "claim_verdicts",
+        max_entries=int(os.getenv("CLAIM_CACHE_MAX_ENTRIES", "10000")),
+        ttl=CLAIM_CACHE_TTL,
+        db_path=os.getenv("CLAIM_CACHE_DB", os.path.join("cache", "claim_cache.db")) or None
+    )
+
+# --- Near-Duplicate Claim Index Setup ---
+# Paraphrases of an already verified claim ("Eiffel tower located in Paris?") reuse
+# its verdict when their sentence embeddings are at least CLAIM_INDEX_THRESHOLD
+# cosine-similar. Vectors are memory-mapped under CLAIM_INDEX_DIR and shared by
+# workers. Time-sensitive claims are never matched semantically.
+CLAIM_INDEX_ENABLED = os.getenv("CLAIM_INDEX", "1").lower() not in ("0", "false", "no")
+CLAIM_INDEX_MODEL = os.getenv("CLAIM_INDEX_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+CLAIM_INDEX_THRESHOLD = float(os.getenv("CLAIM_INDEX_THRESHOLD", "0.9"))
+CLAIM_INDEX_DIR = os.getenv("CLAIM_INDEX_DIR", os.path.join("cache", "claim_index"))
+CLAIM_INDEX_ANN_MIN_ROWS = int(os.getenv("CLAIM_INDEX_ANN_MIN_ROWS", "200000")) # Exact search below, HNSW (faiss) above
+claim_index = None # Opened on first use, see _get_claim_index()
+if CLAIM_INDEX_ENABLED:
+    # Optional: without it verdicts are only reused for exact repeats, so it never gates readiness
+    models.register("claim_embedder", _load_claim_embedder, required=False)
+_claim_index_lock = threading.Lock()
 
 # --- Function Definitions ---
 
-def verify_fact(claim):
+def normalize_claim(claim):
+    """
+    Normalize a claim for cache lookups: case-folded, punctuation removed, whitespace collapsed.
+    Returns: str
+    """
+    text = (claim or "").casefold()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def _claim_cache_key(claim):
+    normalized = normalize_claim(claim)
+    digest = hashlib.sha256(f"{MODEL_NAME}|{FACT_CHECK_PROMPT_VERSION}|{normalized}".encode()).hexdigest()
+    return f"{MODEL_NAME}:{FACT_CHECK_PROMPT_VERSION}:{digest}"
+
+
+def _claim_cache_ttl(claim):
+    """Time-sensitive claims (mentioning 'today', 'latest', prices, ...) expire sooner."""
+    if TIME_SENSITIVE_PATTERN.search(normalize_claim(claim)):
+        return CLAIM_CACHE_TTL_TIME_SENSITIVE
+    return CLAIM_CACHE_TTL
+
+
+def claim_cache_stats():
+    """
+    Report hit-rate counters for the claim verdict cache.
+    Returns: dict (JSON serializable)
+    """
+    if claim_cache is None:
+        return {"enabled": False}
+    stats = claim_cache.stats()
+    stats["enabled"] = True
+    stats["model"] = MODEL_NAME
+    stats["prompt_version"] = FACT_CHECK_PROMPT_VERSION
+    return stats
+
+
+def invalidate_claim_cache(claim=None):
+    """
+    Drop one claim's cached verdict (exact cache and near-duplicate index), or every
+    cached verdict when claim is None.
+    Returns: bool (True if something was removed; always True for a full clear)
+    """
+    removed = False
+    if claim_index is not None:
+        if claim is None:
+            claim_index.clear()
+            removed = True
+        else:
+            removed = claim_index.delete(normalize_claim(claim)) > 0
+    if claim_cache is None:
+        return removed
+    if claim is None:
+        claim_cache.clear()
+        return True
+    return claim_cache.delete(_claim_cache_key(claim)) or removed
+
+
+def _get_claim_index():
+    """Return (embedder, index) for near-duplicate lookups, or (None, None) if disabled or unavailable."""
+    global claim_index
+    if not CLAIM_INDEX_ENABLED:
+        return None, None
+    embedder = models.get("claim_embedder")
+    if embedder is None:
+        return None, None
+    if claim_index is None:
+        with _claim_index_lock:
+            if claim_index is None:
+                from claim_index import ClaimIndex
+                directory = os.path.join(CLAIM_INDEX_DIR, re.sub(r"[^\w.-]", "_", CLAIM_INDEX_MODEL))
+                claim_index = ClaimIndex(directory, embedder.dim, ann_min_rows=CLAIM_INDEX_ANN_MIN_ROWS)
+    return embedder, claim_index
+
+
+def _claim_index_scope():
+    return f"{MODEL_NAME}:{FACT_CHECK_PROMPT_VERSION}"
+
+
+def _embed_claim(claim):
+    """Returns: (index, unit vector) or (None, None) when the claim should not be matched semantically."""
+    if TIME_SENSITIVE_PATTERN.search(normalize_claim(claim)):
+        return None, None
+    embedder, index = _get_claim_index()
+    if index is None:
+        return None, None
+    with metrics.timed("claim_embed"):
+        return index, embedder.embed([claim])[0]
+
+
+def find_similar_claim(claim):
+    """
+    Look up a stored verdict for a near-duplicate of claim in the semantic claim index.
+    The claim's embedding comes back too, so a miss can be indexed without embedding again.
+    Returns: (match, vector), where match is a dict with 'verdict' [truth_score, explanation,
+             sources], 'claim' (the matched stored claim) and 'similarity', or None, and
+             vector is the claim's embedding or None when it was not computed
+    """
+    vector = None
+    try:
+        index, vector = _embed_claim(claim)
+        if index is None:
+            return None, None
+        with metrics.timed("claim_index_lookup"):
+            match = index.lookup(_claim_index_scope(), claim, vector, CLAIM_INDEX_THRESHOLD)
+    except Exception as e:
+        logger.warning(f"Claim index lookup failed: {e}")
+        return None, vector
+    metrics.count("claim_index_hit" if match else "claim_index_miss")
+    return match, vector
+
+
+def _index_claim(claim, verdict, vector=None):
+    """Add a fresh verdict to the semantic claim index (best effort), embedding the claim unless vector is given."""
+    try:
+        if vector is None:
+            index, vector = _embed_claim(claim)
+        else:
+            _, index = _get_claim_index()
+        if index is not None:
+            index.add(_claim_index_scope(), claim, normalize_claim(claim), vector, verdict, ttl=_claim_cache_ttl(claim))
+    except Exception as e:
+        logger.warning(f"Could not add claim to the claim index: {e}")
+
+
+def claim_index_stats():
+    """
+    Report size and hit counters for the near-duplicate claim index.
+    Returns: dict (JSON serializable)
+    """
+    if not CLAIM_INDEX_ENABLED:
+        return {"enabled": False}
+    if claim_index is None:
+        return {"enabled": True, "loaded": False, "model": CLAIM_INDEX_MODEL}
+    stats = claim_index.stats()
+    stats.update(enabled=True, loaded=True, model=CLAIM_INDEX_MODEL, threshold=CLAIM_INDEX_THRESHOLD)
+    return stats
+
+
+def _lookup_verdict(claim, cache_key):
+    """
+    Exact cache, then near-duplicate index.
+    Returns: (result dict (see verify_fact_detailed) or None, the claim's embedding or None),
+             the embedding to pass on to _store_verdict after a miss
+    """
+    if cache_key is not None:
+        cached = claim_cache.get(cache_key)
+        if cached is not None:
+            truth_score, explanation, sources = cached
+            return {"truth_score": truth_score, "explanation": explanation, "sources": list(sources), "cached": True, "reused_from": None}, None
+    match, vector = find_similar_claim(claim)
+    if match is not None:
+        # Not copied into the exact cache: the index stays the only copy, so every reuse
+        # reports its source and invalidating the source claim drops it for paraphrases too
+        truth_score, explanation, sources = match["verdict"]
+        return {
+            "truth_score": truth_score,
+            "explanation": explanation,
+            "sources": list(sources),
+            "cached": True,
+            "reused_from": {"claim": match["claim"], "similarity": match["similarity"]},
+        }, vector
+    return None, vector
+
+
+def _store_verdict(claim, cache_key, truth_score, explanation, sources, vector=None):
+    if truth_score in UNCACHEABLE_SCORES:
+        return
+    if cache_key is not None:
+        claim_cache.set(cache_key, [truth_score, explanation, sources], ttl=_claim_cache_ttl(claim))
+    _index_claim(claim, [truth_score, explanation, sources], vector)
+
+
+def verify_fact_detailed(claim, use_cache=True, priority=llm_scheduler.INTERACTIVE, timeout=None):
+    """
+    verify_fact, also reporting where the verdict came from.
+    timeout (seconds) shortens the current request deadline; past it the result is a Timeout.
+    Returns: dict with 'truth_score', 'explanation', 'sources', 'cached' (bool) and
+             'reused_from' ({'claim', 'similarity'} when a near-duplicate's verdict was reused, else None)
     """
-    Verify a simple text claim using the configured LLM.
+    with deadlines.scope(timeout):
+        cache_key = _claim_cache_key(claim) if use_cache and claim_cache is not None else None
+        vector = None
+        if use_cache:
+            found, vector = _lookup_verdict(claim, cache_key)
+            if found is not None:
+                return found
+
+        truth_score, explanation, sources = _verify_fact_uncached(claim, priority)
+
+        if use_cache:
+            _store_verdict(claim, cache_key, truth_score, explanation, sources, vector)
+        return {"truth_score": truth_score, "explanation": explanation, "sources": sources, "cached": False, "reused_from": None}
+
+
+def verify_fact(claim, use_cache=True, priority=llm_scheduler.INTERACTIVE, timeout=None):
+    """
+    Verify a simple text claim using the configured LLM, reusing cached verdicts for
+    claims that normalize to the same text or are near-duplicates of a verified one.
+    Error/Blocked/N/A/Timeout results are never cached.
+    priority is the LLM scheduler class (batch callers pass llm_scheduler.BULK); timeout
+    (seconds) shortens the current request deadline, past which truth_score is "Timeout".
     Returns: truth_score (str), explanation (str), sources (list)
     """
+    result = verify_fact_detailed(claim, use_cache, priority, timeout)
+    return result["truth_score"], result["explanation"], result["sources"]
+
+
+async def verify_fact_detailed_async(claim, use_cache=True, priority=llm_scheduler.INTERACTIVE, timeout=None):
+    """
+    Async version of verify_fact_detailed: same caches, prompt and parsing, but the Gemini
+    call goes through the shared async client and its global concurrency limit.
+    timeout (seconds) shortens the current request deadline; past it the result is a Timeout.
+    Returns: dict (see verify_fact_detailed)
+    """
+    with deadlines.scope(timeout):
+        cache_key = _claim_cache_key(claim) if use_cache and claim_cache is not None else None
+        vector = None
+        if use_cache:
+            # Embedding is CPU work; keep it off the event loop
+            found, vector = await asyncio.to_thread(_lookup_verdict, claim, cache_key)
+            if found is not None:
+                return found
+
+        llm_model = get_llm_model()
+        if not llm_model:
+            return {"truth_score": "N/A", "explanation": "LLM model is not configured or failed to load.", "sources": [], "cached": False, "reused_from": None}
+        try:
+            with metrics.timed("llm", task="fact_check"):
+                response = await llm_scheduler.generate_async(
+                    llm_model, _build_fact_check_prompt(claim), FACT_CHECK_GENERATION_CONFIG, priority=priority
+                )
+            with metrics.timed("parse", task="fact_check"):
+                truth_score, explanation, sources = _parse_fact_check_response(response)
+        except deadlines.DeadlineExceeded as e:
+            logger.warning(f"Fact check timed out: {e}")
+            metrics.count("request_timeout", task="fact_check")
+            return {"truth_score": "Timeout", "explanation": "The fact check did not finish within the request deadline.", "sources": [], "cached": False, "reused_from": None}
+        except Exception as e:
+            logger.error(f"Error during Gemini API call in verify_fact_async: {e}")
+            return {"truth_score": "Error", "explanation": f"An API error occurred: {str(e)}", "sources": [], "cached": False, "reused_from": None}
+
+        if use_cache:
+            await asyncio.to_thread(_store_verdict, claim, cache_key, truth_score, explanation, sources, vector)
+        return {"truth_score": truth_score, "explanation": explanation, "sources": sources, "cached": False, "reused_from": None}
+
+
+async def verify_fact_async(claim, use_cache=True, priority=llm_scheduler.INTERACTIVE, timeout=None):
+    """
+    Async version of verify_fact.
+    Returns: truth_score (str), explanation (str), sources (list)
+    """
+    result = await verify_fact_detailed_async(claim, use_cache, priority, timeout)
+    return result["truth_score"], result["explanation"], result["sources"]
+
+
+# --- Batch Claim Verification ---
+BATCH_VERIFY_MAX_WORKERS = int(os.getenv("BATCH_VERIFY_MAX_WORKERS", "16"))
+
+# Packed prompting: verify_claims sends cache misses to Gemini several per prompt,
+# asking for a JSON array of per-claim verdicts, so N claims cost about N / pack
+# size round trips and one copy of the instructions per pack. A pack holds up to
+# CLAIM_PACK_MAX_CLAIMS claims and CLAIM_PACK_TOKEN_BUDGET estimated prompt tokens,
+# and no more claims than fit CLAIM_PACK_MAX_OUTPUT_TOKENS at the answer length
+# observed so far. Claims whose answer is missing or malformed fall back to a
+# single-claim call.
+CLAIM_PACKING = os.getenv("CLAIM_PACKING", "1").lower() not in ("0", "false", "no")
+CLAIM_PACK_MAX_CLAIMS = int(os.getenv("CLAIM_PACK_MAX_CLAIMS", "20"))
+CLAIM_PACK_TOKEN_BUDGET = int(os.getenv("CLAIM_PACK_TOKEN_BUDGET", "4000"))
+CLAIM_PACK_MAX_OUTPUT_TOKENS = int(os.getenv("CLAIM_PACK_MAX_OUTPUT_TOKENS", "8192"))
+CLAIM_PACK_OUTPUT_HEADROOM = 1.5 # Output limit per pack, relative to the expected answer length
+_pack_lock = threading.Lock()
+_pack_stats = {"packs": 0, "claims_packed": 0, "answered": 0, "fallbacks": 0, "truncated": 0, "output_tokens_per_claim": 150.0}
+
+
+def _pack_size_limit():
+    """Claims per pack allowed by CLAIM_PACK_MAX_CLAIMS and the output budget at the observed answer length."""
+    with _pack_lock:
+        per_claim = _pack_stats["output_tokens_per_claim"]
+    return max(1, min(CLAIM_PACK_MAX_CLAIMS, int(CLAIM_PACK_MAX_OUTPUT_TOKENS / (per_claim * CLAIM_PACK_OUTPUT_HEADROOM))))
+
+
+def _plan_packs(items):
+    """
+    Split (claim, indexes) items into packs within the claim, prompt-token and
+    output budgets, in input order.
+    Returns: list of lists of items
+    """
+    limit = _pack_size_limit()
+    overhead = estimate_tokens(_build_packed_fact_check_prompt([]))
+    packs, current, spent = [], [], overhead
+    for item in items:
+        cost = estimate_tokens(json.dumps({"id": len(current) + 1, "claim": item[0]}))
+        if current and (len(current) >= limit or spent + cost > CLAIM_PACK_TOKEN_BUDGET):
+            packs.append(current)
+            current, spent = [], overhead
+        current.append(item)
+        spent += cost
+    if current:
+        packs.append(current)
+    return packs
+
+
+def _verify_pack(claims, priority=llm_scheduler.BULK, vectors=None):
+    """
+    Verify several claims with one packed Gemini call and cache the answered ones
+    (vectors: the claims' embeddings from the lookup, aligned with claims, or None).
+    Returns: list aligned with claims of (truth_score, explanation, sources), or None
+             where the answer was missing or malformed
+    """
+    llm_model = get_llm_model()
     if not llm_model:
-        return "N/A", "LLM model is not configured or failed to load.", []
+        return [None] * len(claims)
+    with _pack_lock:
+        per_claim = _pack_stats["output_tokens_per_claim"]
+    generation_config = dict(
+        PACKED_FACT_CHECK_GENERATION_CONFIG,
+        max_output_tokens=min(CLAIM_PACK_MAX_OUTPUT_TOKENS, int(len(claims) * per_claim * CLAIM_PACK_OUTPUT_HEADROOM) + 64)
+    )
+    answers, truncated, output_tokens = {}, False, 0
+    try:
+        with metrics.timed("llm", task="fact_check_packed"):
+            response = llm_scheduler.generate(llm_model, _build_packed_fact_check_prompt(claims), generation_config, priority=priority)
+        with metrics.timed("parse", task="fact_check_packed"):
+            answers, truncated = _parse_packed_fact_check_response(response, len(claims))
+        output_tokens = estimate_tokens(response.text or "") if response.candidates else 0
+    except Exception as e:
+        logger.warning(f"Packed fact-check of {len(claims)} claims failed: {e}")
 
-    prompt = f"""
+    verdicts = [answers.get(number) for number in range(1, len(claims) + 1)]
+    for claim, verdict, vector in zip(claims, verdicts, vectors or [None] * len(claims)):
+        if verdict is not None:
+            _store_verdict(claim, _claim_cache_key(claim) if claim_cache is not None else None, *verdict, vector)
+    with _pack_lock:
+        _pack_stats["packs"] += 1
+        _pack_stats["claims_packed"] += len(claims)
+        _pack_stats["answered"] += len(answers)
+        _pack_stats["fallbacks"] += len(claims) - len(answers)
+        if answers:
+            # Moving average of answer length; a cut-off answer means packs were too big for the output limit
+            observed = output_tokens / len(answers)
+            _pack_stats["output_tokens_per_claim"] += 0.3 * (observed - _pack_stats["output_tokens_per_claim"])
+        if truncated:
+            _pack_stats["truncated"] += 1
+            _pack_stats["output_tokens_per_claim"] *= 1.25
+    metrics.count("claims_packed", len(claims))
+    if len(answers) < len(claims):
+        metrics.count("pack_fallback", len(claims) - len(answers))
+    return verdicts
+
+
+def _verify_single(claim, vector=None):
+    """Single-claim Gemini call for a claim known to miss the caches, storing the verdict. Returns: verdict tuple"""
+    verdict = _verify_fact_uncached(claim, llm_scheduler.BULK)
+    _store_verdict(claim, _claim_cache_key(claim) if claim_cache is not None else None, *verdict, vector)
+    return verdict
+
+
+def claim_packing_stats():
+    """
+    Report packing counters, limits and the current pack size for batch fact-checks.
+    Returns: dict (JSON serializable)
+    """
+    with _pack_lock:
+        stats = dict(_pack_stats)
+    stats["output_tokens_per_claim"] = round(stats["output_tokens_per_claim"], 1)
+    stats.update({
+        "enabled": CLAIM_PACKING,
+        "max_claims": CLAIM_PACK_MAX_CLAIMS,
+        "token_budget": CLAIM_PACK_TOKEN_BUDGET,
+        "max_output_tokens": CLAIM_PACK_MAX_OUTPUT_TOKENS,
+        "current_pack_limit": _pack_size_limit(),
+    })
+    return stats
+
+
+def _batch_result(claim, indexes, verdict):
+    truth_score, explanation, sources = verdict
+    return {
+        "claim": claim,
+        "indexes": indexes,
+        "truth_score": truth_score,
+        "explanation": explanation,
+        "sources": sources or []
+    }
+
+
+def _verify_claims_packed(items, executor):
+    """
+    verify_claims in packed mode: cache lookups first (hits are yielded right away),
+    then packed calls for the misses, then single-claim calls for unanswered claims.
+    """
+    misses, vectors = [], {}
+    lookups = {
+        executor.submit(contextvars.copy_context().run, _lookup_verdict, claim, _claim_cache_key(claim) if claim_cache is not None else None): (claim, indexes)
+        for claim, indexes in items
+    }
+    for future in as_completed(lookups):
+        claim, indexes = lookups[future]
+        try:
+            found, vectors[claim] = future.result()
+        except Exception as e:
+            logger.warning(f"Claim cache lookup failed in batch: {e}")
+            found = None
+        if found is None:
+            misses.append((claim, indexes))
+        else:
+            yield _batch_result(claim, indexes, (found["truth_score"], found["explanation"], found["sources"]))
+
+    misses.sort(key=lambda item: item[1][0]) # Back to input order, so packs are stable across runs
+    futures = {}
+    for pack in _plan_packs(misses):
+        if len(pack) == 1:
+            futures[executor.submit(contextvars.copy_context().run, _verify_single, pack[0][0], vectors.get(pack[0][0]))] = (pack, False)
+        else:
+            claims = [claim for claim, _ in pack]
+            futures[executor.submit(contextvars.copy_context().run, _verify_pack, claims, llm_scheduler.BULK, [vectors.get(claim) for claim in claims])] = (pack, True)
+    while futures:
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            pack, packed = futures.pop(future)
+            try:
+                verdicts = future.result() if packed else [future.result()]
+            except Exception as e:
+                logger.error(f"Error verifying claim in batch: {e}")
+                verdicts = [("Error", f"An unexpected error occurred: {str(e)}", [])] * len(pack)
+            for (claim, indexes), verdict in zip(pack, verdicts):
+                if verdict is None:
+                    futures[executor.submit(contextvars.copy_context().run, _verify_single, claim, vectors.get(claim))] = ([(claim, indexes)], False)
+                else:
+                    yield _batch_result(claim, indexes, verdict)
+
+
+def verify_claims(claims, max_workers=None, packed=None):
+    """
+    Verify many claims concurrently through the claim caches, de-duplicating claims
+    that normalize to the same text. Cache misses are verified several per Gemini
+    call when packed (default CLAIM_PACKING), otherwise one verify_fact call each.
+    Yields one dict per unique claim, in completion order:
+    {'claim', 'indexes' (input positions it covers), 'truth_score', 'explanation', 'sources'}
+    """
+    groups = {}
+    for index, claim in enumerate(claims):
+        key = normalize_claim(claim)
+        if key in groups:
+            groups[key][1].append(index)
+        else:
+            groups[key] = (claim, [index])
+    if not groups:
+        return
+
+    workers = max(1, min(max_workers or BATCH_VERIFY_MAX_WORKERS, len(groups)))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="verify-batch")
+    try:
+        if (CLAIM_PACKING if packed is None else packed) and len(groups) > 1:
+            yield from _verify_claims_packed(list(groups.values()), executor)
+            return
+        futures = {
+            executor.submit(verify_fact, claim, priority=llm_scheduler.BULK): (claim, indexes)
+            for claim, indexes in groups.values()
+        }
+        for future in as_completed(futures):
+            claim, indexes = futures[future]
+            try:
+                verdict = future.result()
+            except Exception as e:
+                logger.error(f"Error verifying claim in batch: {e}")
+                verdict = ("Error", f"An unexpected error occurred: {str(e)}", [])
+            yield _batch_result(claim, indexes, verdict)
+    finally:
+        # If the consumer stops early (e.g. client disconnected), drop queued claims
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# >>> CHANGE: Apply low temperature for potentially more consistent fact-checking too (optional) <<<
+# Plain dict form of GenerationConfig, so genai need not be imported here
+FACT_CHECK_GENERATION_CONFIG = {
+    "temperature": 0.2 # Slightly higher than eval, but still low-ish
+}
+
+# Define safety settings to block harmful content if necessary
+# safety_settings = [
+#     {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+#     {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+#     # Add other categories as needed
+# ]
+
+
+def _build_fact_check_prompt(claim):
+    return f"""
     Analyze the following claim and determine if it is true, false, or uncertain based on current, verifiable knowledge up to your last update.
     Claim: "{claim}"
 
@@ -75,100 +713,187 @@ def verify_fact(claim):
     Explanation: [Provide a concise explanation for the score, mentioning key evidence or lack thereof. State if it's opinion-based.]
     Sources: [List up to 2 relevant, highly credible source URLs (like primary sources or reputable encyclopedias) if verifiable and applicable. If none, write "None".]
     """
-    try:
-        # Define safety settings to block harmful content if necessary
-        # safety_settings = [
-        #     {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        #     {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        #     # Add other categories as needed
-        # ]
-
-        # >>> CHANGE: Apply low temperature for potentially more consistent fact-checking too (optional) <<<
-        generation_config_factcheck = genai.types.GenerationConfig(
-            temperature=0.2 # Slightly higher than eval, but still low-ish
-        )
 
-        response = llm_model.generate_content(
-            prompt,
-            generation_config=generation_config_factcheck
-            #, safety_settings=safety_settings # Uncomment safety_settings if using them
-        )
 
-        # Enhanced response checking
-        if not response.candidates:
-            try:
-                block_reason = response.prompt_feedback.block_reason
-                print(f"Fact-check prompt blocked. Reason: {block_reason}")
-                # Return specific "Blocked" status
-                return "Blocked", f"Content blocked by safety filter ({block_reason})", []
-            except (AttributeError, ValueError, Exception):
-                # Handle cases where feedback isn't available or structured as expected
-                print("Fact-check response empty or invalid, no candidates.")
-                return "N/A", "No valid response generated by the AI model.", []
-        if not response.text:
-                print("Fact-check response text is empty.")
-                return "N/A", "Empty response text from the AI model.", []
-
-        # Parsing the response (more robustly)
-        result_text = response.text.strip()
-        truth_score = "50" # Default to uncertain
-        explanation = "Could not parse explanation from AI response."
-        sources = []
-
-        # Use MULTILINE flag for patterns starting lines
-        score_match = re.search(r"^Truth Score:\s*(\d+)", result_text, re.IGNORECASE | re.MULTILINE)
-        if score_match:
-            truth_score = score_match.group(1)
-
-        exp_match = re.search(r"^Explanation:\s*(.*?)(?=^\s*Sources:|$)", result_text, re.IGNORECASE | re.DOTALL | re.MULTILINE)
-        if exp_match:
-            explanation = exp_match.group(1).strip()
-
-        src_match = re.search(r"^Sources:\s*(.*)", result_text, re.IGNORECASE | re.DOTALL | re.MULTILINE)
-        if src_match:
-            src_line = src_match.group(1).strip()
-            if src_line.lower() not in ['none', 'n/a', '']:
-                # Extract URLs, attempt to handle variations
-                potential_urls = re.findall(r'https?://[^\s,"\'<>]+', src_line)
-                sources = [url.strip().rstrip('.,') for url in potential_urls if url.strip()] # Clean trailing chars
-
-        return truth_score, explanation, sources
+def _parse_fact_check_response(response):
+    """
+    Turn a Gemini response to the fact-check prompt into the verify_fact result.
+    Returns: truth_score (str), explanation (str), sources (list)
+    """
+    # Enhanced response checking
+    if not response.candidates:
+        try:
+            block_reason = response.prompt_feedback.block_reason
+            logger.warning(f"Fact-check prompt blocked. Reason: {block_reason}")
+            metrics.count("prompt_blocked", task="fact_check")
+            # Return specific "Blocked" status
+            return "Blocked", f"Content blocked by safety filter ({block_reason})", []
+        except (AttributeError, ValueError, Exception):
+            # Handle cases where feedback isn't available or structured as expected
+            logger.warning("Fact-check response empty or invalid, no candidates.")
+            return "N/A", "No valid response generated by the AI model.", []
+    if not response.text:
+            logger.warning("Fact-check response text is empty.")
+            return "N/A", "Empty response text from the AI model.", []
+
+    # Parsing the response (more robustly)
+    result_text = response.text.strip()
+    truth_score = "50" # Default to uncertain
+    explanation = "Could not parse explanation from AI response."
+    sources = []
+
+    # Use MULTILINE flag for patterns starting lines
+    score_match = re.search(r"^Truth Score:\s*(\d+)", result_text, re.IGNORECASE | re.MULTILINE)
+    if score_match:
+        truth_score = score_match.group(1)
+
+    exp_match = re.search(r"^Explanation:\s*(.*?)(?=^\s*Sources:|$)", result_text, re.IGNORECASE | re.DOTALL | re.MULTILINE)
+    if exp_match:
+        explanation = exp_match.group(1).strip()
+
+    src_match = re.search(r"^Sources:\s*(.*)", result_text, re.IGNORECASE | re.DOTALL | re.MULTILINE)
+    if src_match:
+        src_line = src_match.group(1).strip()
+        if src_line.lower() not in ['none', 'n/a', '']:
+            # Extract URLs, attempt to handle variations
+            potential_urls = re.findall(r'https?://[^\s,"\'<>]+', src_line)
+            sources = [url.strip().rstrip('.,') for url in potential_urls if url.strip()] # Clean trailing chars
+
+    return truth_score, explanation, sources
+
+
+PACKED_FACT_CHECK_GENERATION_CONFIG = dict(FACT_CHECK_GENERATION_CONFIG, response_mime_type="application/json")
+_URL_PATTERN = re.compile(r'https?://[^\s,"\'<>]+')
+
+
+def _build_packed_fact_check_prompt(claims):
+    numbered = json.dumps([{"id": number, "claim": claim} for number, claim in enumerate(claims, 1)], ensure_ascii=False)
+    return f"""
+    Analyze each of the following claims independently and determine if it is true, false, or uncertain based on current, verifiable knowledge up to your last update.
+    Claims (JSON): {numbered}
+
+    Respond with only a JSON array holding one object per claim, in the same order, each with exactly these fields:
+    "id": [The claim's id.]
+    "truth_score": [An integer from 0 (Definitely False) to 100 (Definitely True). Use 50 for Uncertain/Cannot Verify/Opinion.]
+    "explanation": [A concise explanation for the score, mentioning key evidence or lack thereof. State if it's opinion-based.]
+    "sources": [A list of up to 2 relevant, highly credible source URLs (like primary sources or reputable encyclopedias) if verifiable and applicable, else an empty list.]
+    """
+
+
+def _parse_packed_fact_check_response(response, count):
+    """
+    Map a JSON-array answer to a packed prompt back to claims by id. Complete objects
+    before a cut-off are kept; entries with an unknown or repeated id, a score outside
+    0-100 or no explanation are dropped (their claims fall back to single calls).
+    Returns: (dict id -> (truth_score, explanation, sources), truncated bool)
+    """
+    if not response.candidates or not response.text:
+        return {}, False
+    text = response.text
+    position = text.find("[")
+    if position < 0:
+        return {}, False
+    decoder = json.JSONDecoder()
+    items, truncated = [], True
+    position += 1
+    while position < len(text):
+        while position < len(text) and text[position] in " \t\r\n,":
+            position += 1
+        if position >= len(text):
+            break
+        if text[position] == "]":
+            truncated = False
+            break
+        try:
+            item, position = decoder.raw_decode(text, position)
+        except ValueError:
+            break
+        items.append(item)
+
+    answers, repeated = {}, set()
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        number, score, explanation = item.get("id"), item.get("truth_score"), item.get("explanation")
+        if isinstance(number, str) and number.strip().isdigit():
+            number = int(number)
+        if isinstance(score, str) and score.strip().isdigit():
+            score = int(score)
+        if (isinstance(number, bool) or not isinstance(number, int) or not 1 <= number <= count
+                or isinstance(score, bool) or not isinstance(score, (int, float)) or not 0 <= score <= 100
+                or not isinstance(explanation, str) or not explanation.strip()):
+            continue
+        if number in answers:
+            repeated.add(number) # Two answers for one id: trust neither
+            continue
+        sources = item.get("sources") or []
+        if isinstance(sources, str):
+            sources = [sources]
+        urls = [url.strip().rstrip('.,') for source in sources if isinstance(source, str) for url in _URL_PATTERN.findall(source)]
+        answers[number] = (str(int(round(score))), explanation.strip(), urls)
+    for number in repeated:
+        answers.pop(number, None)
+    return answers, truncated
 
+
+def _verify_fact_uncached(claim, priority=llm_scheduler.INTERACTIVE):
+    """
+    Verify a simple text claim using the configured LLM (one Gemini round trip).
+    Returns: truth_score (str), explanation (str), sources (list)
+    """
+    llm_model = get_llm_model()
+    if not llm_model:
+        return "N/A", "LLM model is not configured or failed to load.", []
+
+    try:
+        with metrics.timed("llm", task="fact_check"):
+            response = llm_scheduler.generate(
+                llm_model,
+                _build_fact_check_prompt(claim),
+                FACT_CHECK_GENERATION_CONFIG,
+                priority=priority
+                #, safety_settings=safety_settings # Uncomment safety_settings if using them
+            )
+        with metrics.timed("parse", task="fact_check"):
+            return _parse_fact_check_response(response)
+
+    except deadlines.DeadlineExceeded as e:
+        logger.warning(f"Fact check timed out: {e}")
+        metrics.count("request_timeout", task="fact_check")
+        return "Timeout", "The fact check did not finish within the request deadline.", []
     except Exception as e:
-        print(f"Error during Gemini API call in verify_fact: {e}")
+        logger.error(f"Error during Gemini API call in verify_fact: {e}")
         error_details = str(e)
         # Check for specific API errors if the library provides them (e.g., API key issues, quota)
         # Example: if 'API key not valid' in error_details: ...
         return "Error", f"An API error occurred: {error_details}", []
 
 
-def detect_deepfake(image_path):
+def _score_images(images):
     """
-    Detect if an image is a deepfake using the loaded model.
-    Returns: dict with 'real_score' and 'fake_score' (float percentages) or 'error'.
+    Run one batched preprocessing + forward pass over a list of RGB PIL images.
+    Returns: list of dicts with 'real_score' and 'fake_score' (or 'error'), one per image.
     """
-    if not deepfake_model or not deepfake_processor:
-        print("Deepfake model not loaded, cannot perform detection.")
-        return {"error": "Deepfake model is not available."}
+    import torch
+    deepfake_processor, deepfake_model = get_deepfake_model()
+    backend = models.get("deepfake_backend")
+    with metrics.timed("preprocess"):
+        inputs = image_decode.preprocess_batch(images, deepfake_processor)
 
-    try:
-        # Ensure image path exists before opening
-        if not os.path.exists(image_path):
-                print(f"Error: Image file not found at path: {image_path}")
-                return {"error": "Image file not found on server."}
-
-        image = Image.open(image_path).convert("RGB")
-        inputs = deepfake_processor(images=image, return_tensors="pt")
-
-        with torch.no_grad():
-            outputs = deepfake_model(**inputs)
-
-        predictions = torch.nn.functional.softmax(outputs.logits, dim=-1)
-        scores = predictions[0].tolist() # Assumes model output: [fake, real] - MUST BE CONFIRMED
+    with metrics.timed("forward"):
+        if backend is not None:
+            logits = backend(inputs)
+        else:
+            with torch.no_grad():
+                logits = deepfake_model(**inputs).logits
 
+    predictions = torch.nn.functional.softmax(logits.float(), dim=-1)
+    results = []
+    for scores in predictions.tolist(): # Assumes model output: [fake, real] - MUST BE CONFIRMED
         if len(scores) < 2:
-                print(f"Error: Unexpected model output scores for {image_path}: {scores}")
-                return {"error": "Invalid model output format for deepfake scores."}
+            logger.error(f"Unexpected model output scores: {scores}")
+            results.append({"error": "Invalid model output format for deepfake scores."})
+            continue
 
         # Ensure scores are non-negative before division
         safe_scores = [max(0, s) for s in scores]
@@ -177,41 +902,559 @@ def detect_deepfake(image_path):
         fake_score = (safe_scores[0] / total) * 100 if total > 0 else 0
         real_score = (safe_scores[1] / total) * 100 if total > 0 else 0
 
-        return {
+        results.append({
             "fake_score": round(fake_score, 2),
             "real_score": round(real_score, 2)
-        }
+        })
+    return results
+
+
+def _get_deepfake_batcher():
+    """Return the shared micro-batcher for deepfake inference, creating it on first use."""
+    global deepfake_batcher
+    if deepfake_batcher is None:
+        deepfake_batcher = MicroBatcher(
+            _score_images,
+            max_batch_size=DEEPFAKE_BATCH_MAX_SIZE,
+            max_wait_ms=DEEPFAKE_BATCH_MAX_WAIT_MS,
+            name="deepfake"
+        )
+    return deepfake_batcher
+
+
+def deepfake_batching_stats():
+    """
+    Report micro-batching knobs and counters for tuning throughput against latency.
+    Returns: dict (JSON serializable)
+    """
+    if not DEEPFAKE_BATCHING:
+        return {"enabled": False}
+    stats = _get_deepfake_batcher().stats()
+    stats["enabled"] = True
+    return stats
+
+
+def deepfake_backend_info():
+    """
+    Configured vs. active inference backend (they differ after a fallback to eager).
+    Returns: dict (JSON serializable)
+    """
+    entry = models.status().get("deepfake_backend", {})
+    backend = models.get("deepfake_backend") if entry.get("state") == "ready" else None
+    return {"configured": DEEPFAKE_BACKEND, "active": backend.name if backend is not None else None}
+
+
+def _deepfake_cache_scope():
+    """
+    Cache key prefix for the backend actually serving (after any fallback to eager);
+    non-eager backends and fast decode get their own key space since their scores
+    differ slightly from FP32 on full-resolution pixels.
+    Returns: str
+    """
+    backend = models.get("deepfake_backend")
+    name = backend.name if backend is not None else "eager"
+    scope = DEEPFAKE_MODEL_NAME if name == "eager" else f"{DEEPFAKE_MODEL_NAME}@{name}"
+    return f"{scope}+fastdecode" if image_decode.DEEPFAKE_FAST_DECODE else scope
+
+
+def _image_cache_keys(image):
+    """
+    Build cache keys for a decoded RGB image, scoped to the current deepfake model.
+    Returns: (content_key, perceptual_key or None)
+    """
+    scope = _deepfake_cache_scope()
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    digest.update(image.tobytes())
+    content_key = f"{scope}:sha256:{digest.hexdigest()}"
+
+    perceptual_key = None
+    if DEEPFAKE_CACHE_PERCEPTUAL:
+        # 64-bit difference hash: compare neighbouring pixels of a 9x8 grayscale thumbnail.
+        small = image.convert("L").resize((9, 8), Image.BILINEAR)
+        pixels = list(small.getdata())
+        bits = 0
+        for row in range(8):
+            for col in range(8):
+                left = pixels[row * 9 + col]
+                right = pixels[row * 9 + col + 1]
+                bits = (bits << 1) | (1 if left > right else 0)
+        perceptual_key = f"{scope}:dhash:{bits:016x}"
+    return content_key, perceptual_key
+
+
+def _lookup_image_cache(image, file_key=None):
+    """
+    Look a decoded image up by its pixel and (if enabled) perceptual keys, counted as
+    one cache lookup. An exact hit is also stored under file_key (the encoded file's
+    key) when given; a perceptual one is not, so the file keeps being re-checked
+    against its own pixels.
+    Returns: (cached result marked with 'cache_match' ("exact" or "perceptual") or None,
+              keys to store a fresh result under)
+    """
+    if deepfake_cache is None:
+        return None, []
+    content_key, perceptual_key = _image_cache_keys(image)
+    cache_keys = [key for key in (content_key, perceptual_key) if key]
+    key, cached = deepfake_cache.get_any(cache_keys)
+    if cached is not None:
+        if key == content_key and file_key:
+            deepfake_cache.set(file_key, cached)
+        return dict(cached, cache_match="exact" if key == content_key else "perceptual"), []
+    if file_key:
+        cache_keys.append(file_key)
+    return None, cache_keys
+
+
+def _probe_file_cache(file_key):
+    """
+    Check the encoded file's key before decoding. A miss is left to _lookup_image_cache to count.
+    Returns: cached result marked as an exact match, or None
+    """
+    cached = deepfake_cache.get(file_key, count_miss=False) if file_key else None
+    return dict(cached, cache_match="exact") if cached is not None else None
+
+
+def deepfake_cache_stats():
+    """
+    Report hit/miss counters for the deepfake result cache.
+    Returns: dict (JSON serializable)
+    """
+    if deepfake_cache is None:
+        return {"enabled": False}
+    stats = deepfake_cache.stats()
+    stats["enabled"] = True
+    stats["perceptual"] = DEEPFAKE_CACHE_PERCEPTUAL
+    return stats
+
+
+def extract_pdf_text(source, info=None):
+    """
+    Extract text from a PDF given as a path, bytes, BufferedUpload or binary file object,
+    through the shared process-pooled, cached extraction service. info (a dict, if given)
+    receives the page count and whether the PDF_MAX_PAGES limit cut the document short.
+    Returns: str
+    """
+    return pdf_extraction.extract_pdf_text(source, info=info)
+
+
+def _admitted(admission, cost, force=False):
+    """Admission slot for classifier work, or a no-op without a controller (CLI, bulk scans)."""
+    return admission.slot(cost, force=force) if admission is not None else contextlib.nullcontext()
+
+
+def detect_deepfake(image_source, content_hash=None, admission=None):
+    """
+    Detect if an image is a deepfake using the loaded model.
+    image_source may be a file path, raw bytes, a BufferedUpload or a binary file object.
+    content_hash (hex SHA-256 of the encoded file) lets byte-identical uploads hit the
+    cache before decoding; it is taken from a BufferedUpload automatically.
+    Concurrent calls are grouped into batched forward passes when DEEPFAKE_BATCHING is on.
+    admission (an AdmissionController) admits the forward pass after a cache miss;
+    Overloaded propagates to the caller.
+    Returns: dict with 'real_score' and 'fake_score' (float percentages), 'cached' (bool) and
+             'cache_match' ("exact", "perceptual" or None), or 'error'.
+    """
+    deepfake_processor, deepfake_model = get_deepfake_model()
+    if not deepfake_model or not deepfake_processor:
+        logger.error("Deepfake model not loaded, cannot perform detection.")
+        return {"error": "Deepfake model is not available."}
+
+    label = describe_source(image_source)
+    if content_hash is None and isinstance(image_source, BufferedUpload):
+        content_hash = image_source.sha256
+
+    try:
+        # Ensure image path exists before opening
+        if is_path(image_source) and not os.path.exists(image_source):
+                logger.error(f"Image file not found at path: {label}")
+                return {"error": "Image file not found on server."}
+
+        file_key = None
+        if deepfake_cache is not None and content_hash:
+            file_key = f"{_deepfake_cache_scope()}:file:{content_hash}"
+            cached = _probe_file_cache(file_key)
+            if cached is not None:
+                return dict(cached, cached=True)
+
+        with metrics.timed("image_decode"), open_source(image_source) as handle:
+            image = image_decode.decode_image(handle, image_decode.target_size(deepfake_processor))
+
+        cached, cache_keys = _lookup_image_cache(image, file_key)
+        if cached is not None:
+            return dict(cached, cached=True)
+
+        with _admitted(admission, 1):
+            if DEEPFAKE_BATCHING:
+                result = _get_deepfake_batcher().submit(image).result()
+            else:
+                result = _score_images([image])[0]
+
+        if not result.get("error"):
+            for key in cache_keys:
+                deepfake_cache.set(key, result)
+        return dict(result, cached=False, cache_match=None)
+    except Overloaded:
+        raise
+    except image_decode.ImageTooLarge as e:
+        logger.error(f"Image too large for {label}: {e}")
+        return {"error": str(e)}
     except UnidentifiedImageError:
-        print(f"Error: Cannot identify image file: {image_path}")
+        logger.error(f"Cannot identify image file: {label}")
         return {"error": "Cannot identify image file. It might be corrupted or not a supported format."}
     except FileNotFoundError: # Should be caught by os.path.exists, but as fallback
-         print(f"Error: Image file not found at path: {image_path}")
+         logger.error(f"Image file not found at path: {label}")
          return {"error": "Image file could not be accessed on server."}
     except Exception as e:
-        print(f"Error during deepfake detection for {image_path}: {e}")
+        logger.error(f"Error during deepfake detection for {label}: {e}")
         return {"error": f"An unexpected error occurred during deepfake detection: {str(e)}"}
 
 
-def evaluate_research_paper(text):
+def detect_deepfake_batch(images, content_hashes=None, batch_size=None):
     """
-    Evaluate a research paper's text using the configured LLM.
-    Returns: score_percent (str/int), justification (str)
+    Score already decoded RGB images (e.g. from the bulk scanner's decode pool) in
+    forward passes of up to batch_size (default DEEPFAKE_BATCH_MAX_SIZE) images, using the same cache as
+    detect_deepfake. content_hashes (hex SHA-256 of each encoded file, or None per
+    image) let byte-identical files hit the cache.
+    Returns: list of dicts like detect_deepfake's, in input order.
     """
-    if not llm_model:
-        return "N/A", "LLM model is not configured or failed to load."
+    deepfake_processor, deepfake_model = get_deepfake_model()
+    if not deepfake_model or not deepfake_processor:
+        logger.error("Deepfake model not loaded, cannot perform detection.")
+        return [{"error": "Deepfake model is not available."} for _ in images]
+
+    content_hashes = content_hashes or [None] * len(images)
+    results = [None] * len(images)
+    misses = []
+    for index, (image, content_hash) in enumerate(zip(images, content_hashes)):
+        file_key = f"{_deepfake_cache_scope()}:file:{content_hash}" if deepfake_cache is not None and content_hash else None
+        cached = _probe_file_cache(file_key)
+        if cached is None:
+            cached, cache_keys = _lookup_image_cache(image, file_key)
+        if cached is not None:
+            results[index] = dict(cached, cached=True)
+        else:
+            misses.append((index, cache_keys))
+
+    batch_size = max(1, batch_size or DEEPFAKE_BATCH_MAX_SIZE)
+    for start in range(0, len(misses), batch_size):
+        group = misses[start:start + batch_size]
+        try:
+            scored = _score_images([images[index] for index, _ in group])
+        except Exception as e:
+            logger.error(f"Error during batched deepfake detection: {e}")
+            scored = [{"error": f"An unexpected error occurred during deepfake detection: {str(e)}"}] * len(group)
+        for (index, cache_keys), result in zip(group, scored):
+            if not result.get("error"):
+                for key in cache_keys:
+                    deepfake_cache.set(key, result)
+            results[index] = result if result.get("error") else dict(result, cached=False, cache_match=None)
+    return results
+
+
+def _score_frame_batch(frames):
+    """Score a list of RGB frames; through the shared micro-batcher when batching is on."""
+    if DEEPFAKE_BATCHING:
+        futures = [_get_deepfake_batcher().submit(frame) for frame in frames]
+        return [future.result() for future in futures]
+    return _score_images(frames)
+
+
+def detect_deepfake_sequence(source, stride=None, max_frames=None, content_hash=None, admission=None):
+    """
+    Clip-level deepfake detection for an animated GIF/WebP or a zip of frames.
+    Every stride-th frame (up to max_frames) is decoded lazily and scored in batches of
+    SEQUENCE_BATCH_SIZE; analysis stops early once the running verdict is confident.
+    admission (an AdmissionController) admits each frame batch, charged its frame count;
+    only the first can be shed (Overloaded propagates), later ones finish the clip.
+    Returns: dict with clip-level 'real_score', 'fake_score', 'verdict', per-frame scores,
+             'frames_total', 'frames_analyzed', 'early_exit' and 'cached', or 'error'.
+    """
+    deepfake_processor, deepfake_model = get_deepfake_model()
+    if not deepfake_model or not deepfake_processor:
+        logger.error("Deepfake model not loaded, cannot perform detection.")
+        return {"error": "Deepfake model is not available."}
+
+    label = describe_source(source)
+    if content_hash is None and isinstance(source, BufferedUpload):
+        content_hash = source.sha256
+    stride, max_frames = frame_sequence.sampling(stride, max_frames)
+
+    clip_key = None
+    if deepfake_cache is not None and content_hash:
+        clip_key = f"{_deepfake_cache_scope()}:clip:{stride}:{max_frames}:{content_hash}"
+        cached = deepfake_cache.get(clip_key)
+        if cached is not None:
+            return dict(cached, cached=True)
+
+    try:
+        total = frame_sequence.frame_count(source)
+        sampled = min(max_frames, -(-total // stride))
+        aggregator = frame_sequence.ClipAggregator()
+        frames = frame_sequence.iter_frames(source, stride=stride, max_frames=max_frames, size=image_decode.target_size(deepfake_processor))
+        analyzed = 0
+        try:
+            while True:
+                with metrics.timed("image_decode", mode="sequence"):
+                    batch = [item for _, item in zip(range(frame_sequence.SEQUENCE_BATCH_SIZE), frames)]
+                if not batch:
+                    break
+                with _admitted(admission, len(batch), force=analyzed > 0):
+                    scores = _score_frame_batch([image for _, image in batch])
+                for (index, _), frame_scores in zip(batch, scores):
+                    aggregator.add(index, frame_scores)
+                analyzed += len(batch)
+                if aggregator.confident():
+                    break
+        finally:
+            frames.close() # Releases the archive / image handle when we stop early
+
+        early_exit = analyzed < sampled
+        result = aggregator.result()
+        if result.get("error"):
+            return result
+        result.update(frames_total=total, frames_analyzed=analyzed, stride=stride, early_exit=early_exit)
+        if early_exit:
+            metrics.count("sequence_early_exit")
+        if clip_key:
+            deepfake_cache.set(clip_key, result)
+        return dict(result, cached=False)
+    except Overloaded:
+        raise
+    except UnidentifiedImageError:
+        logger.error(f"Cannot identify a frame in: {label}")
+        return {"error": "Cannot identify a frame of the sequence. It might be corrupted or not a supported format."}
+    except Exception as e:
+        logger.error(f"Error during sequence deepfake detection for {label}: {e}")
+        return {"error": f"An unexpected error occurred during sequence deepfake detection: {str(e)}"}
+
+
+# --- Long Document Map-Reduce ---
+# Inputs longer than the single-call limits are split on section/page boundaries,
+# each chunk is analyzed concurrently (map), and one final call combines the chunk
+# notes into the usual Score Percent / Verification Status answer (reduce).
+# Set LONG_DOCUMENT_MODE=truncate to go back to one call on the truncated text.
+LONG_DOCUMENT_MODE = os.getenv("LONG_DOCUMENT_MODE", "mapreduce").lower()
+MAP_REDUCE_CHUNK_CHARS = int(os.getenv("MAP_REDUCE_CHUNK_CHARS", "12000"))
+MAP_REDUCE_MAX_WORKERS = int(os.getenv("MAP_REDUCE_MAX_WORKERS", "8"))
+MAP_REDUCE_TOKEN_BUDGET = int(os.getenv("MAP_REDUCE_TOKEN_BUDGET", "250000")) # Estimated input tokens across all map calls
+MAP_REDUCE_STAGE_TIMEOUT = float(os.getenv("MAP_REDUCE_STAGE_TIMEOUT", "180"))
+MAP_GENERATION_CONFIG = {
+    "temperature": 0.1
+}
+_map_executor = None # Shared bounded pool, created on first use
+
+# --- Incremental Re-Analysis ---
+# Revisions of the same paper or document mostly repeat earlier sections. With
+# INCREMENTAL_ANALYSIS on, the map stage splits text into revision-stable units
+# (sentences packed up to the chunk size at content-defined cuts, page furniture
+# ignored) and caches each unit's notes by its content hash, so a resubmission
+# only sends the units around a change to Gemini; the reduce call then combines
+# fresh and cached notes as usual.
+# Bump MAP_PROMPT_VERSION whenever MAP_PROMPTS change.
+MAP_PROMPT_VERSION = "map-v1"
+INCREMENTAL_ANALYSIS = os.getenv("INCREMENTAL_ANALYSIS", "1").lower() not in ("0", "false", "no")
+section_notes_cache = None
+if INCREMENTAL_ANALYSIS:
+    section_notes_cache = TieredCache(
+        "section_notes",
+        max_entries=int(os.getenv("SECTION_NOTES_CACHE_MAX_ENTRIES", "20000")),
+        ttl=int(os.getenv("SECTION_NOTES_CACHE_TTL", str(30 * 24 * 3600))),
+        db_path=os.getenv("SECTION_NOTES_CACHE_DB", os.path.join("cache", "section_notes.db")) or None
+    )
+
+MAP_PROMPTS = {
+    "evaluation": (
+        "Act as an impartial academic reviewer. You are reading part {index} of {total} of a research paper. "
+        "Take concise notes (at most 150 words) on this part only: the research question or purpose, the methodology, "
+        "the findings and whether the conclusions are supported, and the clarity of the writing. "
+        "List notable strengths and weaknesses. Do not assign a score."
+    ),
+    "document": (
+        "Act as a document authenticity analyst. You are reading part {index} of {total} of a document. "
+        "Note concisely (at most 120 words) any signs in this part that the document is genuine (official headers and "
+        "formatting, consistent language, plausible names, dates and data) or fabricated (suspicious claims, "
+        "inconsistencies). Do not give an overall verdict."
+    ),
+}
+
+
+def _use_map_reduce(text, single_call_limit):
+    return LONG_DOCUMENT_MODE == "mapreduce" and len(text) > single_call_limit
+
+
+def _get_map_executor():
+    global _map_executor
+    if _map_executor is None:
+        _map_executor = ThreadPoolExecutor(max_workers=MAP_REDUCE_MAX_WORKERS, thread_name_prefix="map-reduce")
+    return _map_executor
+
+
+def _map_chunks(llm_model, task, text):
+    """
+    Map stage: chunk the text, keep chunks within MAP_REDUCE_TOKEN_BUDGET, and analyze
+    them concurrently on the shared bounded pool.
+    Returns: notes (list of (part number, str)), info (dict with counts and timings)
+    """
+    started = time.perf_counter()
+    if section_notes_cache is not None:
+        chunks = revision_units(text, MAP_REDUCE_CHUNK_CHARS)
+    else:
+        chunks = chunk_text(text, MAP_REDUCE_CHUNK_CHARS)
+    selected = select_within_budget(chunks, MAP_REDUCE_TOKEN_BUDGET)
+    split_ms = _elapsed_ms(started)
+
+    # Notes for units seen in an earlier revision (same model, prompt and text)
+    note_keys, reused = {}, {}
+    if section_notes_cache is not None:
+        for index in selected:
+            note_keys[index] = f"{task}:{MODEL_NAME}:{MAP_PROMPT_VERSION}:{unit_fingerprint(chunks[index])}"
+            cached = section_notes_cache.get(note_keys[index])
+            if cached is not None:
+                reused[index] = cached
+
+    def analyze(index):
+        prompt = (
+            MAP_PROMPTS[task].format(index=index + 1, total=len(chunks))
+            + f"\n\n--- START PART {index + 1} ---\n{chunks[index]}\n--- END PART {index + 1} ---\n"
+        )
+        with metrics.timed("llm", task="map"):
+            response = llm_scheduler.generate(llm_model, prompt, MAP_GENERATION_CONFIG, priority=llm_scheduler.BULK)
+        if not response.candidates or not response.text:
+            return ""
+        note = response.text.strip()
+        if index in note_keys:
+            section_notes_cache.set(note_keys[index], note)
+        return note
+
+    map_started = time.perf_counter()
+    # copy_context() carries the request id into the pool threads' log lines
+    futures = {
+        index: _get_map_executor().submit(contextvars.copy_context().run, analyze, index)
+        for index in selected if index not in reused
+    }
+    # The stage ends at MAP_REDUCE_STAGE_TIMEOUT or the request deadline, whichever is sooner
+    stage_timeout = MAP_REDUCE_STAGE_TIMEOUT
+    left = deadlines.remaining()
+    if left is not None:
+        stage_timeout = min(stage_timeout, max(0.0, left))
+    deadline = map_started + stage_timeout
+    notes, failed = [], 0
+    for index in selected:
+        if index in reused:
+            notes.append((index + 1, reused[index]))
+            continue
+        future = futures[index]
+        try:
+            note = future.result(timeout=max(0.0, deadline - time.perf_counter()))
+        except Exception as e:
+            logger.warning(f"Map-reduce {task} chunk {index + 1}/{len(chunks)} failed: {e}")
+            future.cancel()
+            failed += 1
+            continue
+        if note:
+            notes.append((index + 1, note))
+        else:
+            failed += 1
+    # No time left for the reduce call either
+    deadlines.check("The map stage")
+
+    if reused:
+        metrics.count("section_notes_reused", len(reused), task=task)
+    info = {
+        "chunks": len(chunks),
+        "analyzed": len(notes),
+        "skipped": len(chunks) - len(notes),
+        "failed": failed,
+        "reused": len(reused),
+        "input_tokens": sum(estimate_tokens(chunks[index]) for index in selected if index not in reused),
+        "input_tokens_saved": sum(estimate_tokens(chunks[index]) for index in reused),
+        "timings": {"split_ms": split_ms, "map_ms": _elapsed_ms(map_started)},
+    }
+    return notes, info
+
+
+def _format_notes(notes):
+    return "\n\n".join(f"Part {number}:\n{note}" for number, note in notes)
+
+
+def _build_evaluation_reduce_prompt(notes, info):
+    coverage = ""
+    if info["skipped"]:
+        coverage = f" Note: notes cover {info['analyzed']} of {info['chunks']} parts of the paper."
+    return f"""
+    Act as an impartial academic reviewer. Below are section-by-section reviewer notes covering a full research paper. Evaluate the quality of the paper based *only* on these notes and these criteria:
+    1. Clarity of Research Question/Purpose: Is the main goal clearly stated and understandable?
+    2. Soundness of Methodology: Are the methods described adequately and appropriate for the question?
+    3. Significance & Validity of Findings/Conclusions: Are results clearly presented? Do they address the question? Are conclusions justified by the results? Is the significance discussed?
+    4. Overall Structure & Clarity of Writing: Is the paper well-organized, logical, and easy to read?
+
+    Provide your response STRICTLY in the following format:
+
+    Score Percent: [Assign an overall quality score percentage from 0% to 100% based on the criteria. Be consistent.]
+    Justification: [Provide a detailed justification explaining the score. Clearly separate strengths and weaknesses. Start with 'Strengths:' list positive aspects related to the criteria. Then start with 'Weaknesses:' list negative aspects or limitations related to the criteria. Explain how these factors combine to justify the specific percentage score assigned.]{coverage}
+
+    --- START SECTION NOTES ---
+    {_format_notes(notes)}
+    --- END SECTION NOTES ---
+    """
+
+
+def _build_document_reduce_prompt(notes, info):
+    coverage = ""
+    if info["skipped"]:
+        coverage = f"Note: the notes cover {info['analyzed']} of {info['chunks']} parts of the document."
+    return f"""
+        Act as a document authenticity analyst. Below are part-by-part analyst notes covering a full document. Based on these notes, decide if the document appears to be legitimate or potentially fake.
+
+        Respond in this format:
+        Verification Status: [Likely Genuine / Possibly Fake / Inconclusive]
+        Details: [Brief explanation of why you think the document is genuine or fake]
+
+        {coverage}
 
-    # --- Simplified Text Handling - Truncation ---
-    # WARNING: This is suboptimal for long papers. Production needs better chunking/summarization.
-    MAX_INPUT_CHARS = 30000 # Adjust based on model token limits and API performance
+        --- START PART NOTES ---
+        {_format_notes(notes)}
+        --- END PART NOTES ---
+        """
+
+
+def _log_map_reduce(task, info):
+    timings = info["timings"]
+    logger.info(f"Map-reduce {task} finished", extra={"fields": {
+        "task": task,
+        "chunks": info["chunks"],
+        "analyzed": info["analyzed"],
+        "reused": info["reused"],
+        "input_tokens": info["input_tokens"],
+        "input_tokens_saved": info["input_tokens_saved"],
+        **timings,
+    }})
+
+
+# --- Research Paper Evaluation ---
+# Papers up to this length go to Gemini in one call; longer ones use map-reduce
+# (or are truncated when LONG_DOCUMENT_MODE=truncate).
+EVALUATION_MAX_INPUT_CHARS = 30000 # Adjust based on model token limits and API performance
+# >>> CHANGE: Define generation configuration with low temperature <<<
+EVALUATION_GENERATION_CONFIG = {
+    "temperature": 0.1 # Set low temperature (e.g., 0.1 or 0.0) for reduced randomness
+}
+
+
+def _build_evaluation_prompt(text):
+    """
+    Build the paper evaluation prompt, truncating text past EVALUATION_MAX_INPUT_CHARS.
+    Returns: prompt (str), truncated (bool)
+    """
     truncated = False
-    if len(text) > MAX_INPUT_CHARS:
-        print(f"Warning: Input text length ({len(text)}) > {MAX_INPUT_CHARS}. Truncating for evaluation.")
-        text_to_process = text[:MAX_INPUT_CHARS] # Simple truncation
+    if len(text) > EVALUATION_MAX_INPUT_CHARS:
+        logger.warning(f"Input text length ({len(text)}) > {EVALUATION_MAX_INPUT_CHARS}. Truncating for evaluation.")
+        text_to_process = text[:EVALUATION_MAX_INPUT_CHARS] # Simple truncation
         truncated = True
     else:
         text_to_process = text
 
-    # --- Evaluation Prompt ---
     prompt = f"""
     Act as an impartial academic reviewer. Evaluate the quality of the following research paper text based *only* on the provided text and these criteria:
     1. Clarity of Research Question/Purpose: Is the main goal clearly stated and understandable?
@@ -228,97 +1471,158 @@ def evaluate_research_paper(text):
     {text_to_process}
     --- END RESEARCH PAPER TEXT ---
     """
+    return prompt, truncated
 
-    try:
-        # >>> CHANGE: Define generation configuration with low temperature <<<
-        generation_config = genai.types.GenerationConfig(
-            temperature=0.1 # Set low temperature (e.g., 0.1 or 0.0) for reduced randomness
-        )
 
-        # >>> CHANGE: Pass generation_config to the API call <<<
-        response = llm_model.generate_content(
-            prompt,
-            generation_config=generation_config # Apply the configuration
-            # Add safety_settings if needed, separated by comma
-            # , safety_settings=safety_settings
-            )
+def _parse_evaluation_response(response, truncated=False):
+    """
+    Turn a Gemini response to the evaluation prompt into the evaluate_research_paper result.
+    Returns: score_percent (str/int), justification (str)
+    """
+    # Check response validity and safety feedback
+    if not response.candidates:
+        try:
+            block_reason = response.prompt_feedback.block_reason
+            logger.warning(f"Evaluation prompt blocked. Reason: {block_reason}")
+            metrics.count("prompt_blocked", task="evaluation")
+            return "Blocked", f"Content blocked by safety filter ({block_reason})"
+        except (AttributeError, ValueError, Exception):
+            logger.warning("Evaluation response empty or invalid, no candidates.")
+            return "N/A", "No valid response generated by the AI model for evaluation."
+    if not response.text:
+            logger.warning("Evaluation response text is empty.")
+            return "N/A", "Empty response text from the AI model for evaluation."
 
-        # Check response validity and safety feedback
-        if not response.candidates:
-            try:
-                block_reason = response.prompt_feedback.block_reason
-                print(f"Evaluation prompt blocked. Reason: {block_reason}")
-                return "Blocked", f"Content blocked by safety filter ({block_reason})"
-            except (AttributeError, ValueError, Exception):
-                print("Evaluation response empty or invalid, no candidates.")
-                return "N/A", "No valid response generated by the AI model for evaluation."
-        if not response.text:
-                print("Evaluation response text is empty.")
-                return "N/A", "Empty response text from the AI model for evaluation."
-
-        # Parsing the response
-        result_text = response.text.strip()
-        score_percent = "N/A"
-        justification = "Could not parse justification from AI response."
-
-        # Use MULTILINE flag for patterns starting lines
-        score_match = re.search(r"^Score Percent:\s*(\d{1,3})\s*%?", result_text, re.IGNORECASE | re.MULTILINE)
-        if score_match:
-            score_value = int(score_match.group(1))
-            score_percent = max(0, min(100, score_value)) # Clamp score 0-100
-
-        # Capture justification more robustly
-        just_match = re.search(r"^Justification:\s*(.*)", result_text, re.IGNORECASE | re.DOTALL | re.MULTILINE)
-        if just_match:
-            justification = just_match.group(1).strip()
-            # Add truncation note if applicable and not already added by LLM
-            if truncated and "[Text Truncated]" not in justification and "truncated text" not in justification.lower():
-                    justification += "\n\n(Note: This evaluation was based on truncated text due to length limitations.)"
-
-        return score_percent, justification
+    return _parse_evaluation_text(response.text, truncated)
 
-    except Exception as e:
-        print(f"Error during Gemini API call in evaluate_research_paper: {e}")
-        return "Error", f"An API error occurred during paper evaluation: {str(e)}"
-        import io
-from pdfminer.high_level import extract_text
 
-def verify_document(file_path):
+def _parse_evaluation_text(result_text, truncated=False):
+    """Extract Score Percent / Justification from evaluation output text."""
+    result_text = result_text.strip()
+    score_percent = "N/A"
+    justification = "Could not parse justification from AI response."
+
+    # Use MULTILINE flag for patterns starting lines
+    score_match = re.search(r"^Score Percent:\s*(\d{1,3})\s*%?", result_text, re.IGNORECASE | re.MULTILINE)
+    if score_match:
+        score_value = int(score_match.group(1))
+        score_percent = max(0, min(100, score_value)) # Clamp score 0-100
+
+    # Capture justification more robustly
+    just_match = re.search(r"^Justification:\s*(.*)", result_text, re.IGNORECASE | re.DOTALL | re.MULTILINE)
+    if just_match:
+        justification = just_match.group(1).strip()
+        # Add truncation note if applicable and not already added by LLM
+        if truncated and "[Text Truncated]" not in justification and "truncated text" not in justification.lower():
+                justification += "\n\n(Note: This evaluation was based on truncated text due to length limitations.)"
+
+    return score_percent, justification
+
+
+def _prepare_evaluation(llm_model, text):
     """
-    Verify the authenticity of a document by analyzing its content using Gemini AI.
-    Returns a dict with 'verification_status' and 'details'.
+    Build the final evaluation prompt: the whole text for short papers, or the reduce
+    prompt over concurrently analyzed chunks for long ones (runs the map stage).
+    Returns: prompt (str), truncated (bool), map_info (dict or None)
     """
-    if not llm_model:
-        return {
-            "verification_status": "Error",
-            "details": "LLM model is not configured or failed to load."
-        }
+    if _use_map_reduce(text, EVALUATION_MAX_INPUT_CHARS):
+        notes, info = _map_chunks(llm_model, "evaluation", text)
+        if not notes:
+            raise RuntimeError("No part of the paper could be analyzed.")
+        return _build_evaluation_reduce_prompt(notes, info), info["skipped"] > 0, info
+    prompt, truncated = _build_evaluation_prompt(text)
+    return prompt, truncated, None
 
-    try:
-        # Step 1: Extract text from the PDF
-        if not os.path.exists(file_path):
-            return {
-                "verification_status": "Error",
-                "details": "Document file not found on server."
-            }
 
-        document_text = extract_text(file_path)
+def evaluate_research_paper(text, timeout=None):
+    """
+    Evaluate a research paper's text using the configured LLM.
+    Papers longer than EVALUATION_MAX_INPUT_CHARS are evaluated by map-reduce over chunks.
+    timeout (seconds) shortens the current request deadline; past it the result is a Timeout.
+    Returns: score_percent (str/int), justification (str)
+    """
+    with deadlines.scope(timeout):
+        llm_model = get_llm_model()
+        if not llm_model:
+            return "N/A", "LLM model is not configured or failed to load."
+
+        try:
+            prompt, truncated, map_info = _prepare_evaluation(llm_model, text)
+            reduce_started = time.perf_counter()
+            # >>> CHANGE: Pass generation_config to the API call <<<
+            with metrics.timed("llm", task="evaluation"):
+                response = llm_scheduler.generate(
+                    llm_model,
+                    prompt,
+                    EVALUATION_GENERATION_CONFIG # Apply the configuration
+                    # Add safety_settings if needed, separated by comma
+                    # , safety_settings=safety_settings
+                    )
+            if map_info:
+                map_info["timings"]["reduce_ms"] = _elapsed_ms(reduce_started)
+                _log_map_reduce("evaluation", map_info)
+            with metrics.timed("parse", task="evaluation"):
+                return _parse_evaluation_response(response, truncated)
+
+        except deadlines.DeadlineExceeded as e:
+            logger.warning(f"Paper evaluation timed out: {e}")
+            metrics.count("request_timeout", task="evaluation")
+            return "Timeout", "The paper evaluation did not finish within the request deadline."
+        except Exception as e:
+            logger.error(f"Error during Gemini API call in evaluate_research_paper: {e}")
+            return "Error", f"An API error occurred during paper evaluation: {str(e)}"
 
-        if not document_text.strip():
-            return {
-                "verification_status": "Error",
-                "details": "No extractable text found in the document."
-            }
 
-        # Truncate if the document is too long
-        MAX_INPUT_CHARS = 25000
-        truncated = False
-        if len(document_text) > MAX_INPUT_CHARS:
-            document_text = document_text[:MAX_INPUT_CHARS]
-            truncated = True
+async def evaluate_research_paper_async(text, timeout=None):
+    """
+    Async version of evaluate_research_paper using the shared async Gemini client.
+    timeout (seconds) shortens the current request deadline; past it the result is a Timeout.
+    Returns: score_percent (str/int), justification (str)
+    """
+    with deadlines.scope(timeout):
+        llm_model = get_llm_model()
+        if not llm_model:
+            return "N/A", "LLM model is not configured or failed to load."
+
+        try:
+            # The map stage (if any) runs on its own bounded thread pool
+            prompt, truncated, map_info = await asyncio.to_thread(_prepare_evaluation, llm_model, text)
+            reduce_started = time.perf_counter()
+            with metrics.timed("llm", task="evaluation"):
+                response = await llm_scheduler.generate_async(llm_model, prompt, EVALUATION_GENERATION_CONFIG)
+            if map_info:
+                map_info["timings"]["reduce_ms"] = _elapsed_ms(reduce_started)
+                _log_map_reduce("evaluation", map_info)
+            with metrics.timed("parse", task="evaluation"):
+                return _parse_evaluation_response(response, truncated)
+        except deadlines.DeadlineExceeded as e:
+            logger.warning(f"Paper evaluation timed out: {e}")
+            metrics.count("request_timeout", task="evaluation")
+            return "Timeout", "The paper evaluation did not finish within the request deadline."
+        except Exception as e:
+            logger.error(f"Error during Gemini API call in evaluate_research_paper_async: {e}")
+            return "Error", f"An API error occurred during paper evaluation: {str(e)}"
+
+
+# --- Document Verification ---
+DOCUMENT_MAX_INPUT_CHARS = 25000
+DOCUMENT_GENERATION_CONFIG = {
+    "temperature": 0.2
+}
+
 
-        # Step 2: Prompt Gemini AI for analysis
-        prompt = f"""
+def _build_document_prompt(document_text):
+    """
+    Build the document authenticity prompt, truncating past DOCUMENT_MAX_INPUT_CHARS.
+    Returns: str
+    """
+    # Truncate if the document is too long
+    truncated = False
+    if len(document_text) > DOCUMENT_MAX_INPUT_CHARS:
+        document_text = document_text[:DOCUMENT_MAX_INPUT_CHARS]
+        truncated = True
+
+    return f"""
         Act as a document authenticity analyst. Given the text of a document below, analyze if it appears to be legitimate or potentially fake.
 
         Look for signs like:
@@ -338,34 +1642,323 @@ def verify_document(file_path):
         --- END DOCUMENT TEXT ---
         """
 
-        generation_config = genai.types.GenerationConfig(
-            temperature=0.2
-        )
 
-        response = llm_model.generate_content(prompt, generation_config=generation_config)
+def _parse_document_response(response):
+    """
+    Turn a Gemini response to the document prompt into the verify_document result.
+    Returns: dict with 'verification_status' and 'details'
+    """
+    if not response.candidates or not response.text:
+        return {
+            "verification_status": "Inconclusive",
+            "details": "The AI model could not analyze the document content."
+        }
+    return _parse_document_text(response.text)
 
-        if not response.candidates or not response.text:
+
+def _parse_document_text(result_text):
+    """Extract Verification Status / Details from document analysis output text."""
+    result_text = result_text.strip()
+
+    status_match = re.search(r"^Verification Status:\s*(.*)", result_text, re.IGNORECASE | re.MULTILINE)
+    details_match = re.search(r"^Details:\s*(.*)", result_text, re.IGNORECASE | re.DOTALL | re.MULTILINE)
+
+    status = status_match.group(1).strip() if status_match else "Inconclusive"
+    details = details_match.group(1).strip() if details_match else "No explanation provided."
+
+    return {
+        "verification_status": status,
+        "details": details
+    }
+
+
+def _prepare_document_prompt(llm_model, document_text):
+    """
+    Build the final document prompt, running the map stage for long documents.
+    Returns: prompt (str), map_info (dict or None)
+    """
+    if _use_map_reduce(document_text, DOCUMENT_MAX_INPUT_CHARS):
+        notes, info = _map_chunks(llm_model, "document", document_text)
+        if not notes:
+            raise RuntimeError("No part of the document could be analyzed.")
+        return _build_document_reduce_prompt(notes, info), info
+    return _build_document_prompt(document_text), None
+
+
+def _load_document_text(document_source, info=None):
+    """
+    Step 1 of document verification: extract the PDF text (info: see extract_pdf_text).
+    Returns: (document_text, None) or (None, error result dict)
+    """
+    if is_path(document_source) and not os.path.exists(document_source):
+        return None, {
+            "verification_status": "Error",
+            "details": "Document file not found on server."
+        }
+
+    document_text = extract_pdf_text(document_source, info=info)
+
+    if not document_text.strip():
+        return None, {
+            "verification_status": "Error",
+            "details": "No extractable text found in the document."
+        }
+    return document_text, None
+
+
+def verify_document(document_source, timeout=None):
+    """
+    Verify the authenticity of a document by analyzing its content using Gemini AI.
+    document_source may be a file path, raw bytes, a BufferedUpload or a binary file object.
+    timeout (seconds) shortens the current request deadline; past it the result is a Timeout.
+    Returns a dict with 'verification_status' and 'details', plus 'truncated', 'pages_extracted'
+    and 'max_pages' when the document was longer than PDF_MAX_PAGES.
+    """
+    with deadlines.scope(timeout):
+        llm_model = get_llm_model()
+        if not llm_model:
             return {
-                "verification_status": "Inconclusive",
-                "details": "The AI model could not analyze the document content."
+                "verification_status": "Error",
+                "details": "LLM model is not configured or failed to load."
             }
 
-        result_text = response.text.strip()
+        try:
+            # Step 1: Extract text from the PDF
+            extraction = {}
+            document_text, error = _load_document_text(document_source, extraction)
+            if error:
+                return error
 
-        status_match = re.search(r"^Verification Status:\s*(.*)", result_text, re.IGNORECASE | re.MULTILINE)
-        details_match = re.search(r"^Details:\s*(.*)", result_text, re.IGNORECASE | re.DOTALL | re.MULTILINE)
+            # Step 2: Prompt Gemini AI for analysis (map-reduce over chunks for long documents)
+            prompt, map_info = _prepare_document_prompt(llm_model, document_text)
+            reduce_started = time.perf_counter()
+            with metrics.timed("llm", task="document"):
+                response = llm_scheduler.generate(llm_model, prompt, DOCUMENT_GENERATION_CONFIG)
+            if map_info:
+                map_info["timings"]["reduce_ms"] = _elapsed_ms(reduce_started)
+                _log_map_reduce("document", map_info)
+            with metrics.timed("parse", task="document"):
+                return dict(_parse_document_response(response), **pdf_extraction.truncation_notice(extraction))
 
-        status = status_match.group(1).strip() if status_match else "Inconclusive"
-        details = details_match.group(1).strip() if details_match else "No explanation provided."
+        except deadlines.DeadlineExceeded as e:
+            logger.warning(f"Document verification timed out: {e}")
+            metrics.count("request_timeout", task="document")
+            return {
+                "verification_status": "Timeout",
+                "details": "The document verification did not finish within the request deadline."
+            }
+        except Exception as e:
+            logger.error(f"Error in verify_document: {e}")
+            return {
+                "verification_status": "Error",
+                "details": f"An unexpected error occurred: {str(e)}"
+            }
+
+
+async def verify_document_async(document_source, timeout=None):
+    """
+    Async version of verify_document. PDF extraction runs in a worker thread and the
+    Gemini call goes through the shared async client.
+    timeout (seconds) shortens the current request deadline; past it the result is a Timeout.
+    Returns a dict with 'verification_status' and 'details'.
+    """
+    with deadlines.scope(timeout):
+        llm_model = get_llm_model()
+        if not llm_model:
+            return {
+                "verification_status": "Error",
+                "details": "LLM model is not configured or failed to load."
+            }
+
+        try:
+            extraction = {}
+            document_text, error = await asyncio.to_thread(_load_document_text, document_source, extraction)
+            if error:
+                return error
+
+            prompt, map_info = await asyncio.to_thread(_prepare_document_prompt, llm_model, document_text)
+            reduce_started = time.perf_counter()
+            with metrics.timed("llm", task="document"):
+                response = await llm_scheduler.generate_async(llm_model, prompt, DOCUMENT_GENERATION_CONFIG)
+            if map_info:
+                map_info["timings"]["reduce_ms"] = _elapsed_ms(reduce_started)
+                _log_map_reduce("document", map_info)
+            with metrics.timed("parse", task="document"):
+                return dict(_parse_document_response(response), **pdf_extraction.truncation_notice(extraction))
+
+        except deadlines.DeadlineExceeded as e:
+            logger.warning(f"Document verification timed out: {e}")
+            metrics.count("request_timeout", task="document")
+            return {
+                "verification_status": "Timeout",
+                "details": "The document verification did not finish within the request deadline."
+            }
+        except Exception as e:
+            logger.error(f"Error in verify_document_async: {e}")
+            return {
+                "verification_status": "Error",
+                "details": f"An unexpected error occurred: {str(e)}"
+            }
+
+
+# --- Streaming Variants ---
+# Generators yielding (event, data) pairs for server-sent events. "delta" events carry
+# partial model output as it arrives; the parsed score/status is sent as its own event
+# as soon as its line is complete, and "done" carries the final result plus timings.
+
+_STREAM_SCORE_PATTERN = re.compile(r"^Score Percent:\s*(\d{1,3})\s*%?[^\n]*\n", re.IGNORECASE | re.MULTILINE)
+_STREAM_STATUS_PATTERN = re.compile(r"^Verification Status:\s*(.*?)\s*\n", re.IGNORECASE | re.MULTILINE)
 
-        return {
-            "verification_status": status,
-            "details": details
-        }
 
+def _stream_chunks(llm_model, prompt, generation_config, task):
+    """Yield text pieces from a streaming Gemini call, skipping chunks without text."""
+    with metrics.timed("llm", task=task, stream="true"):
+        started = time.perf_counter()
+        first = True
+        response = llm_scheduler.generate(llm_model, prompt, generation_config, stream=True)
+        for chunk in response:
+            try:
+                text = chunk.text
+            except (AttributeError, ValueError):
+                # Chunks without text parts (e.g. safety feedback) raise on .text
+                continue
+            if text:
+                if first:
+                    metrics.observe_stage("llm_first_chunk", time.perf_counter() - started, task=task)
+                    first = False
+                yield text
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def stream_evaluate_research_paper(text):
+    """
+    Streaming version of evaluate_research_paper.
+    Yields: ('delta', {'text'}), ('score', {'score_percent'}) once parsed, then
+            ('done', {'score_percent', 'justification', 'timings'}).
+    """
+    started = time.perf_counter()
+    llm_model = get_llm_model()
+    if not llm_model:
+        yield "done", {"score_percent": "N/A", "justification": "LLM model is not configured or failed to load."}
+        return
+
+    result_text = ""
+    score_sent = False
+    first_token_ms = None
+    map_info = None
+    try:
+        if _use_map_reduce(text, EVALUATION_MAX_INPUT_CHARS):
+            yield "progress", {"stage": "map", "message": "Analyzing the paper section by section..."}
+        prompt, truncated, map_info = _prepare_evaluation(llm_model, text)
+        if map_info:
+            yield "progress", {"stage": "reduce", "chunks": map_info["chunks"], "analyzed": map_info["analyzed"], "reused": map_info["reused"]}
+        for piece in _stream_chunks(llm_model, prompt, EVALUATION_GENERATION_CONFIG, "evaluation"):
+            if first_token_ms is None:
+                first_token_ms = _elapsed_ms(started)
+            result_text += piece
+            yield "delta", {"text": piece}
+            if not score_sent:
+                score_match = _STREAM_SCORE_PATTERN.search(result_text)
+                if score_match:
+                    score_sent = True
+                    yield "score", {"score_percent": max(0, min(100, int(score_match.group(1))))}
+    except deadlines.DeadlineExceeded as e:
+        logger.warning(f"Paper evaluation timed out: {e}")
+        metrics.count("request_timeout", task="evaluation")
+        yield "done", {"score_percent": "Timeout", "justification": "The paper evaluation did not finish within the request deadline."}
+        return
     except Exception as e:
-        print(f"Error in verify_document: {e}")
-        return {
-            "verification_status": "Error",
-            "details": f"An unexpected error occurred: {str(e)}"
+        logger.error(f"Error during streaming Gemini call in stream_evaluate_research_paper: {e}")
+        yield "done", {"score_percent": "Error", "justification": f"An API error occurred during paper evaluation: {str(e)}"}
+        return
+
+    if not result_text.strip():
+        score_percent, justification = "N/A", "Empty response text from the AI model for evaluation."
+    else:
+        with metrics.timed("parse", task="evaluation"):
+            score_percent, justification = _parse_evaluation_text(result_text, truncated)
+    done = {
+        "score_percent": score_percent,
+        "justification": justification,
+        "timings": {"first_token_ms": first_token_ms, "total_ms": _elapsed_ms(started)}
+    }
+    if map_info:
+        done["map_reduce"] = map_info
+    yield "done", done
+
+
+def stream_verify_document(document_source):
+    """
+    Streaming version of verify_document.
+    Yields: ('delta', {'text'}), ('status', {'verification_status'}) once parsed, then
+            ('done', {'verification_status', 'details', 'timings'}).
+    """
+    started = time.perf_counter()
+    llm_model = get_llm_model()
+    if not llm_model:
+        yield "done", {"verification_status": "Error", "details": "LLM model is not configured or failed to load."}
+        return
+
+    extraction = {}
+    try:
+        document_text, error = _load_document_text(document_source, extraction)
+    except deadlines.DeadlineExceeded as e:
+        logger.warning(f"Document verification timed out: {e}")
+        metrics.count("request_timeout", task="document")
+        yield "done", {"verification_status": "Timeout", "details": "The document verification did not finish within the request deadline."}
+        return
+    except Exception as e:
+        logger.error(f"Error in stream_verify_document: {e}")
+        yield "done", {"verification_status": "Error", "details": f"An unexpected error occurred: {str(e)}"}
+        return
+    if error:
+        yield "done", error
+        return
+    extract_ms = _elapsed_ms(started)
+
+    result_text = ""
+    status_sent = False
+    first_token_ms = None
+    map_info = None
+    try:
+        if _use_map_reduce(document_text, DOCUMENT_MAX_INPUT_CHARS):
+            yield "progress", {"stage": "map", "message": "Analyzing the document part by part..."}
+        prompt, map_info = _prepare_document_prompt(llm_model, document_text)
+        if map_info:
+            yield "progress", {"stage": "reduce", "chunks": map_info["chunks"], "analyzed": map_info["analyzed"], "reused": map_info["reused"]}
+        for piece in _stream_chunks(llm_model, prompt, DOCUMENT_GENERATION_CONFIG, "document"):
+            if first_token_ms is None:
+                first_token_ms = _elapsed_ms(started)
+            result_text += piece
+            yield "delta", {"text": piece}
+            if not status_sent:
+                status_match = _STREAM_STATUS_PATTERN.search(result_text)
+                if status_match:
+                    status_sent = True
+                    yield "status", {"verification_status": status_match.group(1)}
+    except deadlines.DeadlineExceeded as e:
+        logger.warning(f"Document verification timed out: {e}")
+        metrics.count("request_timeout", task="document")
+        yield "done", {"verification_status": "Timeout", "details": "The document verification did not finish within the request deadline."}
+        return
+    except Exception as e:
+        logger.error(f"Error in stream_verify_document: {e}")
+        yield "done", {"verification_status": "Error", "details": f"An unexpected error occurred: {str(e)}"}
+        return
+
+    if not result_text.strip():
+        result = {
+            "verification_status": "Inconclusive",
+            "details": "The AI model could not analyze the document content."
         }
+    else:
+        with metrics.timed("parse", task="document"):
+            result = _parse_document_text(result_text)
+    result["timings"] = {"extract_ms": extract_ms, "first_token_ms": first_token_ms, "total_ms": _elapsed_ms(started)}
+    if map_info:
+        result["map_reduce"] = map_info
+    result.update(pdf_extraction.truncation_notice(extraction))
+    yield "done", result
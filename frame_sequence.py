@@ -0,0 +1,151 @@
+# frame_sequence.py
+#
+# Frame sampling for clip-level deepfake analysis. Animated GIF/WebP files and
+# zip archives of still frames are read as a lazy stream: only every
+# SEQUENCE_FRAME_STRIDE-th frame is converted to RGB, at most SEQUENCE_MAX_FRAMES
+# are sampled, and nothing past the point where the caller stops iterating is
+# decoded. GIF frames are delta-coded, so seeking still walks the skipped frames,
+# but without the RGB conversion and without holding them in memory.
+
+import os
+import zipfile
+
+from PIL import Image
+
+from image_decode import decode_image, fit_to_target
+from uploads import open_source
+
+SEQUENCE_FRAME_STRIDE = int(os.getenv("SEQUENCE_FRAME_STRIDE", "5"))
+SEQUENCE_MAX_FRAMES = int(os.getenv("SEQUENCE_MAX_FRAMES", "64"))
+SEQUENCE_BATCH_SIZE = int(os.getenv("SEQUENCE_BATCH_SIZE", "8"))
+# Stop once the running clip verdict is at least this confident (percent) ...
+SEQUENCE_EARLY_EXIT_CONFIDENCE = float(os.getenv("SEQUENCE_EARLY_EXIT_CONFIDENCE", "90"))
+# ... and at least this many frames agree with it; 0 disables early exit
+SEQUENCE_EARLY_EXIT_MIN_FRAMES = int(os.getenv("SEQUENCE_EARLY_EXIT_MIN_FRAMES", "8"))
+# Zip members larger than this are skipped rather than decompressed
+SEQUENCE_MAX_MEMBER_BYTES = int(os.getenv("SEQUENCE_MAX_MEMBER_BYTES", str(20 * 1024 * 1024)))
+FRAME_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp')
+
+
+def sequence_kind(source):
+    """
+    Classify an upload without decoding any pixels.
+    Returns: "zip", "animated" (more than one frame) or None for a still image.
+    """
+    with open_source(source) as handle:
+        if zipfile.is_zipfile(handle):
+            return "zip"
+        handle.seek(0)
+        try:
+            with Image.open(handle) as image:
+                return "animated" if getattr(image, "n_frames", 1) > 1 else None
+        except Exception:
+            return None # Left for the still-image path to report
+
+
+def _zip_members(archive):
+    # Sorted by name so frame_0001.png, frame_0002.png ... come out in clip order
+    names = sorted(
+        info.filename for info in archive.infolist()
+        if not info.is_dir()
+        and info.filename.lower().endswith(FRAME_EXTENSIONS)
+        and not os.path.basename(info.filename).startswith(".")
+        and info.file_size <= SEQUENCE_MAX_MEMBER_BYTES
+    )
+    return names
+
+
+def sampling(stride=None, max_frames=None):
+    """
+    Defaults for a requested stride and frame cap, both clamped to 1..SEQUENCE_MAX_FRAMES
+    so a client can't ask for an unbounded walk through a clip.
+    Returns: (stride, max_frames)
+    """
+    stride = min(max(1, stride or SEQUENCE_FRAME_STRIDE), SEQUENCE_MAX_FRAMES)
+    max_frames = min(max(1, max_frames or SEQUENCE_MAX_FRAMES), SEQUENCE_MAX_FRAMES)
+    return stride, max_frames
+
+
+def iter_frames(source, stride=None, max_frames=None, size=None):
+    """
+    Lazily yield sampled frames of an animated image or a zip of frames, each
+    shrunk to just cover size (width, height) when given.
+    Yields: (frame index in the clip, RGB PIL image)
+    """
+    stride, max_frames = sampling(stride, max_frames)
+    with open_source(source) as handle:
+        if zipfile.is_zipfile(handle):
+            handle.seek(0)
+            with zipfile.ZipFile(handle) as archive:
+                names = _zip_members(archive)
+                for sampled, index in enumerate(range(0, len(names), stride)):
+                    if sampled >= max_frames:
+                        return
+                    with archive.open(names[index]) as member:
+                        yield index, decode_image(member, size)
+            return
+
+        handle.seek(0)
+        with Image.open(handle) as image:
+            total = getattr(image, "n_frames", 1)
+            for sampled, index in enumerate(range(0, total, stride)):
+                if sampled >= max_frames:
+                    return
+                image.seek(index)
+                frame = image.convert("RGB")
+                yield index, fit_to_target(frame, size) if size else frame
+
+
+def frame_count(source):
+    """Total frames in the clip (before sampling). Returns: int"""
+    with open_source(source) as handle:
+        if zipfile.is_zipfile(handle):
+            handle.seek(0)
+            with zipfile.ZipFile(handle) as archive:
+                return len(_zip_members(archive))
+        handle.seek(0)
+        with Image.open(handle) as image:
+            return getattr(image, "n_frames", 1)
+
+
+class ClipAggregator:
+    """
+    Running clip-level verdict over per-frame scores: the mean fake/real score,
+    plus the most suspicious frame so a short manipulated segment is still visible.
+    """
+
+    def __init__(self, early_exit_confidence=None, early_exit_min_frames=None):
+        self.early_exit_confidence = SEQUENCE_EARLY_EXIT_CONFIDENCE if early_exit_confidence is None else early_exit_confidence
+        self.early_exit_min_frames = SEQUENCE_EARLY_EXIT_MIN_FRAMES if early_exit_min_frames is None else early_exit_min_frames
+        self.frames = []
+
+    def add(self, index, scores):
+        if not scores.get("error"):
+            self.frames.append({"index": index, "fake_score": scores["fake_score"], "real_score": scores["real_score"]})
+
+    def _mean(self, key):
+        return sum(frame[key] for frame in self.frames) / len(self.frames) if self.frames else 0.0
+
+    def confident(self):
+        """True once enough frames agree that the verdict can no longer plausibly flip."""
+        if self.early_exit_min_frames <= 0 or len(self.frames) < self.early_exit_min_frames:
+            return False
+        mean_fake, mean_real = self._mean("fake_score"), self._mean("real_score")
+        if max(mean_fake, mean_real) < self.early_exit_confidence:
+            return False
+        fake = mean_fake >= mean_real
+        return all((frame["fake_score"] >= frame["real_score"]) == fake for frame in self.frames)
+
+    def result(self):
+        """Returns: dict with clip-level 'fake_score', 'real_score', 'verdict', 'most_suspicious_frame' and 'frames'."""
+        if not self.frames:
+            return {"error": "No frames could be analyzed."}
+        mean_fake, mean_real = self._mean("fake_score"), self._mean("real_score")
+        worst = max(self.frames, key=lambda frame: frame["fake_score"])
+        return {
+            "fake_score": round(mean_fake, 2),
+            "real_score": round(mean_real, 2),
+            "verdict": "fake" if mean_fake >= mean_real else "real",
+            "most_suspicious_frame": worst,
+            "frames": self.frames,
+        }
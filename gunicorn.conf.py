@@ -0,0 +1,50 @@
+# gunicorn.conf.py
+#
+#   gunicorn app:app            (picks this file up automatically)
+#
+# With GUNICORN_PRELOAD on (the default), the master imports the app and loads the
+# deepfake classifier once before forking. The weights are moved into shared memory
+# and the master's heap is frozen out of the garbage collector, so workers map the
+# same pages instead of each loading its own copy. Check the savings with
+#   python memory_stats.py <master pid>     or     GET /admin/memory
+# Every worker sizes its PyTorch thread pools to cores // workers after the fork
+# (see resource_manager.py).
+#
+# /detect load shedding only sees requests that already hold a gunicorn thread:
+# with too few threads the backlog waits in gunicorn's own queue, every request
+# the app sees is admitted, and latency grows without a single 503. Threads here
+# are mostly blocked on the inference batcher or on Gemini, so GUNICORN_THREADS
+# defaults to 128, comfortably above the images a worker finishes within
+# INFERENCE_SLO_MS. Keep it above that if you raise the SLO or speed up the
+# backend; check with benchmarks/load_shedding.py, which runs this file.
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "128"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1").lower() not in ("0", "false", "no")
+
+if preload_app:
+    # The classifier is loaded once in the master and shared; workers only warm what it did not load (Gemini)
+    os.environ.setdefault("MODEL_WARMUP", "preload")
+
+
+def when_ready(server):
+    # Runs in the master after the preloaded app is imported and before any fork
+    if preload_app:
+        import app
+        app.prepare_master()
+
+
+def post_fork(server, worker):
+    server.log.info(f"Worker {worker.pid} forked (preload_app={preload_app})")
+
+
+def post_worker_init(worker):
+    # After the app is loaded in the worker: threads started in the master would not survive the fork
+    import app
+    app.start_serving(workers=worker.cfg.workers)
@@ -0,0 +1,171 @@
+# image_decode.py
+#
+# Reduced-resolution decode and batched preprocessing for the deepfake classifier.
+# The model only ever sees ~224x224 pixels, so a 40-megapixel upload is decoded
+# straight to a size just above that: JPEGs use libjpeg's DCT scaling (draft mode,
+# 1/2 to 1/8 of full size, never materialized at full resolution), and everything
+# is thumbnailed to the model's input size before it is held or batched.
+# Pixels being decoded at once are bounded by DEEPFAKE_DECODE_MEMORY_MB across
+# threads, and a single image larger than DEEPFAKE_DECODE_MAX_PIXELS after draft
+# scaling is refused instead of decoded.
+# preprocess_batch() replaces the per-image processor loop with one NumPy pass
+# over the whole batch when the processor config is the plain resize/rescale/
+# normalize kind; anything else goes through the Hugging Face processor as before.
+
+import os
+import threading
+
+from PIL import Image
+
+import metrics
+
+DEEPFAKE_FAST_DECODE = os.getenv("DEEPFAKE_FAST_DECODE", "1").lower() not in ("0", "false", "no")
+DEEPFAKE_DECODE_MEMORY_MB = int(os.getenv("DEEPFAKE_DECODE_MEMORY_MB", "256"))
+DEEPFAKE_DECODE_MAX_PIXELS = int(os.getenv("DEEPFAKE_DECODE_MAX_PIXELS", str(50_000_000)))
+DEFAULT_TARGET_SIZE = (224, 224)
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class DecodeBudget:
+    """
+    Byte budget shared by decoding threads. A decode reserves its estimated
+    pixel buffer size first and waits while the budget is exhausted; one image is
+    always admitted when nothing else is decoding, so a single large image (up to
+    DEEPFAKE_DECODE_MAX_PIXELS) cannot deadlock.
+    """
+
+    def __init__(self, limit_bytes):
+        self.limit = max(1, limit_bytes)
+        self.in_use = 0
+        self.peak = 0
+        self.waits = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, size):
+        with self._cond:
+            if self.in_use and self.in_use + size > self.limit:
+                self.waits += 1
+                self._cond.wait_for(lambda: not self.in_use or self.in_use + size <= self.limit)
+            self.in_use += size
+            self.peak = max(self.peak, self.in_use)
+
+    def release(self, size):
+        with self._cond:
+            self.in_use -= size
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {"limit_mb": round(self.limit / 2**20, 1), "in_use_mb": round(self.in_use / 2**20, 1),
+                    "peak_mb": round(self.peak / 2**20, 1), "waits": self.waits}
+
+
+decode_budget = DecodeBudget(DEEPFAKE_DECODE_MEMORY_MB * 2**20)
+
+
+def target_size(processor):
+    """
+    The (width, height) the processor resizes to, or DEFAULT_TARGET_SIZE when it
+    cannot be read from its config. Returns: tuple
+    """
+    size = getattr(processor, "size", None)
+    if isinstance(size, dict):
+        if "height" in size and "width" in size:
+            return int(size["width"]), int(size["height"])
+        if "shortest_edge" in size:
+            return int(size["shortest_edge"]), int(size["shortest_edge"])
+    elif isinstance(size, int):
+        return size, size
+    return DEFAULT_TARGET_SIZE
+
+
+def fit_to_target(image, size):
+    """
+    Shrink an RGB image so it still covers size on both axes; the final resize to
+    the exact model size happens in preprocessing. Returns: PIL image
+    """
+    width, height = image.size
+    scale = max(size[0] / width, size[1] / height)
+    if scale >= 1:
+        return image
+    reduced = (max(size[0], round(width * scale)), max(size[1], round(height * scale)))
+    # reducing_gap does most of the work with a cheap box reduce; the processor resamples again
+    return image.resize(reduced, Image.BILINEAR, reducing_gap=2.0)
+
+
+def decode_image(handle, size=None):
+    """
+    Decode an image file object to RGB. With a target size (and DEEPFAKE_FAST_DECODE
+    on), decode at reduced resolution and thumbnail to just cover size.
+    Returns: RGB PIL image
+    """
+    image = Image.open(handle)
+    if size is None or not DEEPFAKE_FAST_DECODE:
+        return image.convert("RGB")
+    if image.format == "JPEG":
+        # Picks the largest DCT scale that still yields at least the requested size
+        image.draft("RGB", size)
+    width, height = image.size
+    if width * height > DEEPFAKE_DECODE_MAX_PIXELS:
+        raise ImageTooLarge(f"Image is {width}x{height} pixels; the limit is {DEEPFAKE_DECODE_MAX_PIXELS}.")
+    reserved = width * height * max(3, len(image.getbands()))
+    decode_budget.acquire(reserved)
+    try:
+        image.load()
+        # convert() copies even when the mode is already RGB; skip that full-size copy
+        return fit_to_target(image if image.mode == "RGB" else image.convert("RGB"), size)
+    finally:
+        decode_budget.release(reserved)
+
+
+def _fast_preprocess_config(processor):
+    """The processor's plain resize/rescale/normalize settings, or None if it does more than that."""
+    if getattr(processor, "do_center_crop", False) or not hasattr(processor, "image_mean"):
+        return None
+    size = getattr(processor, "size", None)
+    if not (isinstance(size, dict) and "height" in size and "width" in size):
+        return None
+    return {
+        "size": (int(size["width"]), int(size["height"])),
+        "do_resize": getattr(processor, "do_resize", True),
+        "resample": int(getattr(processor, "resample", Image.BILINEAR)),
+        "rescale": getattr(processor, "rescale_factor", 1 / 255) if getattr(processor, "do_rescale", True) else None,
+        "mean": processor.image_mean if getattr(processor, "do_normalize", True) else None,
+        "std": processor.image_std if getattr(processor, "do_normalize", True) else None,
+    }
+
+
+def preprocess_batch(images, processor):
+    """
+    Turn a list of RGB PIL images into model inputs with one vectorized pass:
+    resize each to the model size, stack to (N, H, W, 3) uint8, then rescale and
+    normalize the whole batch at once. Falls back to the processor for configs it
+    does not cover (center crops, shortest-edge resizing).
+    Returns: dict with 'pixel_values' (float32 tensor, N x 3 x H x W)
+    """
+    config = _fast_preprocess_config(processor) if DEEPFAKE_FAST_DECODE else None
+    if config is None:
+        return processor(images=images, return_tensors="pt")
+    import numpy as np
+    import torch
+
+    width, height = config["size"]
+    with metrics.timed("preprocess_resize"):
+        batch = np.stack([
+            np.asarray(image.resize((width, height), config["resample"]) if config["do_resize"] and image.size != (width, height) else image, dtype=np.uint8)
+            for image in images
+        ])
+    pixels = batch.astype(np.float32)
+    if config["rescale"] is not None:
+        pixels *= np.float32(config["rescale"])
+    if config["mean"] is not None:
+        pixels -= np.asarray(config["mean"], dtype=np.float32)
+        pixels /= np.asarray(config["std"], dtype=np.float32)
+    return {"pixel_values": torch.from_numpy(np.ascontiguousarray(pixels.transpose(0, 3, 1, 2)))}
+
+
+def decode_stats():
+    return {"fast_decode": DEEPFAKE_FAST_DECODE, "max_pixels": DEEPFAKE_DECODE_MAX_PIXELS, "budget": decode_budget.stats()}
@@ -0,0 +1,147 @@
+# inference_batcher.py
+
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class MicroBatcher:
+    """
+    Groups concurrent single-item requests into one batched call.
+
+    Callers submit() one item and get a Future back. A background thread takes
+    the oldest waiting item, then keeps collecting until either max_batch_size
+    items are in hand or that oldest item has waited max_wait_ms, and hands the
+    whole batch to run_batch. run_batch(items) must return one result per item,
+    in the same order; each result is delivered to its own caller's Future.
+    """
+
+    def __init__(self, run_batch, max_batch_size=16, max_wait_ms=10.0, name="batcher"):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.run_batch = run_batch
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+        # --- Stats (guarded by _stats_lock) ---
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._batches = 0
+        self._items = 0
+        self._failed_batches = 0
+        self._queue_wait_ms = deque(maxlen=2048)  # Recent per-item queue waits
+        self._run_ms = deque(maxlen=512)          # Recent per-batch run times
+
+    def submit(self, item):
+        """Queue one item for batched processing. Returns a concurrent.futures.Future."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def _ensure_worker(self):
+        # Started lazily so the thread is created in the process that uses it
+        # (important when the app is imported before gunicorn forks workers).
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._loop, name=f"{self.name}-worker", daemon=True)
+                self._worker.start()
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = first[2] + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect_batch()
+            started = time.perf_counter()
+            items = [entry[0] for entry in batch]
+            waits = [(started - entry[2]) * 1000.0 for entry in batch]
+            try:
+                results = self.run_batch(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name}: run_batch returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                logger.error(f"Error in {self.name} batch of {len(items)}: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self._record(len(items), waits, started, failed=True)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            self._record(len(items), waits, started, failed=False)
+
+    def _record(self, size, waits, started, failed):
+        run_ms = (time.perf_counter() - started) * 1000.0
+        with self._stats_lock:
+            self._batches += 1
+            self._items += size
+            self._batch_sizes[size] += 1
+            self._queue_wait_ms.extend(waits)
+            self._run_ms.append(run_ms)
+            if failed:
+                self._failed_batches += 1
+
+    def stats(self):
+        """Snapshot of batching configuration and counters, suitable for JSON."""
+        with self._stats_lock:
+            waits = sorted(self._queue_wait_ms)
+            runs = sorted(self._run_ms)
+            return {
+                "name": self.name,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "items": self._items,
+                "failed_batches": self._failed_batches,
+                "mean_batch_size": round(self._items / self._batches, 2) if self._batches else 0,
+                "batch_size_histogram": {str(k): v for k, v in sorted(self._batch_sizes.items())},
+                "queue_wait_ms": _summarize(waits),
+                "batch_run_ms": _summarize(runs),
+            }
+
+
+def _summarize(sorted_values):
+    """p50/p95/p99/max over an already sorted list of floats."""
+    if not sorted_values:
+        return {"count": 0}
+
+    def pct(p):
+        index = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+        return round(sorted_values[index], 3)
+
+    return {
+        "count": len(sorted_values),
+        "p50": pct(50),
+        "p95": pct(95),
+        "p99": pct(99),
+        "max": round(sorted_values[-1], 3),
+    }
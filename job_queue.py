@@ -0,0 +1,349 @@
+# job_queue.py
+#
+# Durable background jobs in SQLite. A web request stores the upload and gets a
+# job id back at once; worker threads (in the web process, or in a separate
+# `python jobs.py` process) claim queued jobs, run the registered handler and
+# record progress, timings and the result. Several processes on one host can
+# share the database: claiming is a single BEGIN IMMEDIATE transaction, and jobs
+# whose worker stopped heartbeating are re-queued. A running job heartbeats from
+# its own ticker thread, independent of how often the handler reports progress,
+# and every later write is conditional on the (worker, attempts) lease it was
+# claimed with, so a run that lost its job to a re-queue can't overwrite the new
+# run's status or result. Finished jobs are deleted after the retention period.
+# Writes made in this process wake wait_for_update() at once, so status streams
+# need not poll the database for jobs run by this process's workers.
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+FINISHED_STATES = (SUCCEEDED, FAILED)
+
+
+class JobQueue:
+    """
+    SQLite-backed job store plus an optional pool of worker threads.
+    Handlers are registered per job kind: handler(payload bytes, params dict, progress)
+    returns a JSON-serializable result; progress(fraction, message, partial) reports
+    status, where partial is an optional JSON-serializable preview of the result.
+    """
+
+    def __init__(self, path, retention_seconds=24 * 3600, stale_seconds=300, max_attempts=2, poll_interval=0.5):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self.stale_seconds = stale_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.handlers = {}
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._threads_pid = None
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self._updated = threading.Condition()
+        self._version = 0 # Bumped by every job write in this process
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, params TEXT, "
+                "progress REAL NOT NULL DEFAULT 0, message TEXT, result TEXT, error TEXT, "
+                "attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, "
+                "created_at REAL NOT NULL, started_at REAL, heartbeat_at REAL, finished_at REAL)"
+            )
+            if "partial" not in {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute("ALTER TABLE jobs ADD COLUMN partial TEXT") # Databases created before partial results
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+            # Payloads live apart from job rows so polling never reads upload bytes
+            conn.execute("CREATE TABLE IF NOT EXISTS job_payloads (job_id TEXT PRIMARY KEY, data BLOB NOT NULL)")
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per call keeps this safe across threads and forks.
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    # --- Client side ---
+
+    def submit(self, kind, payload, params=None):
+        """Store a job and its payload bytes. Returns: job id (str)"""
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, params, message, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(params or {}), "Waiting for a worker", time.time()),
+            )
+            conn.execute("INSERT INTO job_payloads (job_id, data) VALUES (?, ?)", (job_id, sqlite3.Binary(payload)))
+            conn.execute("COMMIT")
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        """
+        Job status for clients, or None if unknown (or already purged).
+        Returns: dict with id, kind, status, progress, message, timings, the partial result
+                 while running (if the handler reports one), and result/error when finished.
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            position = None
+            if row is not None and row["status"] == QUEUED:
+                position = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?", (QUEUED, row["created_at"])
+                ).fetchone()[0]
+        if row is None:
+            return None
+        job = {
+            "id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "progress": round(row["progress"], 3),
+            "message": row["message"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "timings": _timings(row),
+        }
+        if position is not None:
+            job["queue_position"] = position
+        if row["partial"] is not None:
+            job["partial"] = json.loads(row["partial"])
+        if row["result"] is not None:
+            job["result"] = json.loads(row["result"])
+        if row["error"] is not None:
+            job["error"] = row["error"]
+        return job
+
+    def update_version(self):
+        """Returns: the current in-process update counter, to pass to wait_for_update"""
+        with self._updated:
+            return self._version
+
+    def wait_for_update(self, version, timeout):
+        """
+        Block until a job write in this process moves the counter past version, or
+        timeout seconds pass (writes by other processes are only seen by re-reading).
+        Returns: the current update counter
+        """
+        with self._updated:
+            self._updated.wait_for(lambda: self._version != version, timeout)
+            return self._version
+
+    def _notify(self):
+        with self._updated:
+            self._version += 1
+            self._updated.notify_all()
+
+    def stats(self):
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = conn.execute("SELECT MIN(created_at) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+        return {
+            "counts": {state: counts.get(state, 0) for state in (QUEUED, RUNNING, SUCCEEDED, FAILED)},
+            "oldest_queued_seconds": round(time.time() - oldest, 1) if oldest else 0.0,
+            "worker_threads": sum(1 for thread in self._threads if thread.is_alive()) if self._threads_pid == os.getpid() else 0,
+            "retention_seconds": self.retention_seconds,
+        }
+
+    # --- Worker side ---
+
+    def _claim(self, worker):
+        """
+        Atomically take the oldest queued job, re-queuing stale running ones first.
+        Returns: (job id, kind, params, payload bytes, lease) or None, where lease is (worker, attempts)
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, message = 'Re-queued after a worker stopped responding', partial = NULL "
+                    "WHERE status = ? AND heartbeat_at < ? AND attempts < ?",
+                    (QUEUED, RUNNING, now - self.stale_seconds, self.max_attempts),
+                )
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = 'Worker stopped responding', partial = NULL, finished_at = ? "
+                    "WHERE status = ? AND heartbeat_at < ?",
+                    (FAILED, now, RUNNING, now - self.stale_seconds),
+                )
+                row = conn.execute(
+                    "SELECT id, kind, params, attempts FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, started_at = ?, "
+                        "heartbeat_at = ?, message = 'Started' WHERE id = ?",
+                        (RUNNING, worker, now, now, row["id"]),
+                    )
+                    payload = conn.execute("SELECT data FROM job_payloads WHERE job_id = ?", (row["id"],)).fetchone()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        self._notify()
+        lease = (worker, row["attempts"] + 1)
+        return row["id"], row["kind"], json.loads(row["params"] or "{}"), bytes(payload["data"]) if payload else b"", lease
+
+    def _progress(self, job_id, lease, fraction, message=None, partial=None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET progress = ?, message = COALESCE(?, message), partial = COALESCE(?, partial), heartbeat_at = ? "
+                "WHERE id = ? AND status = ? AND worker = ? AND attempts = ?",
+                (max(0.0, min(1.0, fraction)), message, json.dumps(partial) if partial is not None else None, time.time(), job_id, RUNNING, *lease),
+            )
+        self._notify()
+
+    def _heartbeat(self, job_id, lease):
+        """Returns: False once the job no longer belongs to this run (re-queued or finished elsewhere)"""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ? AND worker = ? AND attempts = ?",
+                (time.time(), job_id, RUNNING, *lease),
+            ).rowcount > 0
+
+    def _heartbeat_loop(self, job_id, lease, done):
+        interval = max(1.0, self.stale_seconds / 3)
+        while not done.wait(interval):
+            try:
+                if not self._heartbeat(job_id, lease):
+                    logger.warning(f"Job {job_id} was taken over by another run; stopping its heartbeat")
+                    return
+            except Exception as e:
+                logger.error(f"Heartbeat for job {job_id} failed: {e}")
+
+    def _finish(self, job_id, lease, result=None, error=None):
+        """Record the outcome if this run still holds the job. Returns: True if it was recorded"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, progress = 1.0, message = ?, result = ?, error = ?, partial = NULL, finished_at = ? "
+                "WHERE id = ? AND status = ? AND worker = ? AND attempts = ?",
+                (
+                    FAILED if error else SUCCEEDED,
+                    "Failed" if error else "Done",
+                    json.dumps(result) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                    RUNNING,
+                    *lease,
+                ),
+            ).rowcount
+            if updated:
+                # A re-queued job still needs its payload for the run that holds it now
+                conn.execute("DELETE FROM job_payloads WHERE job_id = ?", (job_id,))
+            conn.execute("COMMIT")
+        self._notify()
+        if not updated:
+            logger.warning(f"Job {job_id} was re-queued while this run held it; discarding this run's outcome")
+        return bool(updated)
+
+    def purge(self):
+        """Delete finished jobs past the retention period. Returns: number removed"""
+        cutoff = time.time() - self.retention_seconds
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            removed = conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({','.join('?' * len(FINISHED_STATES))}) AND finished_at < ?",
+                (*FINISHED_STATES, cutoff),
+            ).rowcount
+            conn.execute("DELETE FROM job_payloads WHERE job_id NOT IN (SELECT id FROM jobs)")
+            conn.execute("COMMIT")
+        return removed
+
+    def run_one(self, worker="inline"):
+        """Claim and run one job. Returns: job id, or None if the queue was empty."""
+        claimed = self._claim(worker)
+        if claimed is None:
+            return None
+        job_id, kind, params, payload, lease = claimed
+        handler = self.handlers.get(kind)
+        done = threading.Event()
+        ticker = threading.Thread(target=self._heartbeat_loop, args=(job_id, lease, done), name=f"job-heartbeat-{job_id[:8]}", daemon=True)
+        ticker.start()
+        try:
+            if handler is None:
+                raise RuntimeError(f"No handler registered for job kind '{kind}'")
+            result = handler(payload, params, lambda fraction, message=None, partial=None: self._progress(job_id, lease, fraction, message, partial))
+        except Exception as e:
+            logger.exception(f"Job {job_id} ({kind}) failed: {e}")
+            outcome = {"error": str(e)}
+        else:
+            outcome = {"result": result}
+        finally:
+            done.set()
+            ticker.join()
+        self._finish(job_id, lease, **outcome)
+        return job_id
+
+    def _worker_loop(self, worker):
+        while not self._stop.is_set():
+            try:
+                if time.time() - self._last_purge > 300:
+                    self._last_purge = time.time()
+                    self.purge()
+                if self.run_one(worker) is not None:
+                    continue
+            except Exception as e:
+                logger.error(f"Job worker {worker} error: {e}")
+            # Woken at once by submit() in this process; other processes' jobs are seen on the next poll
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def start_workers(self, count):
+        """Start count daemon worker threads in this process (idempotent per process)."""
+        with self._lock:
+            if self._threads_pid == os.getpid() and self._threads:
+                return self._threads
+            self._stop.clear()
+            prefix = f"{socket.gethostname()}:{os.getpid()}"
+            self._threads = [
+                threading.Thread(target=self._worker_loop, args=(f"{prefix}:{i}",), name=f"job-worker-{i}", daemon=True)
+                for i in range(count)
+            ]
+            self._threads_pid = os.getpid()
+            for thread in self._threads:
+                thread.start()
+            return self._threads
+
+    def stop_workers(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+
+def _timings(row):
+    timings = {}
+    if row["started_at"]:
+        timings["queued_ms"] = round((row["started_at"] - row["created_at"]) * 1000, 1)
+    if row["finished_at"] and row["started_at"]:
+        timings["run_ms"] = round((row["finished_at"] - row["started_at"]) * 1000, 1)
+    if row["finished_at"]:
+        timings["total_ms"] = round((row["finished_at"] - row["created_at"]) * 1000, 1)
+    return timings
@@ -0,0 +1,144 @@
+# jobs.py
+#
+# Job mode for the long PDF routes: /jobs/evaluate and /jobs/verify-document store
+# the upload in the job queue and return a job id; workers run PDF extraction and
+# the Gemini analysis and record progress, including the score and the text
+# received so far, so clients can render the answer as it arrives. Workers run as JOB_WORKERS threads in
+# each web process by default; set JOB_WORKERS=0 there and run
+#
+#   python jobs.py [--workers 4]
+#
+# to keep all job work out of the web processes.
+
+import argparse
+import os
+import signal
+import threading
+import time
+
+from fact_verification import stream_evaluate_research_paper, stream_verify_document
+from job_queue import JobQueue
+from pdf_extraction import iter_pdf_pages, truncation_notice
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+JOB_DB = os.getenv("JOB_DB", os.path.join("cache", "jobs.db"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2")) # Worker threads per web process; 0 = separate worker process only
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(24 * 3600)))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "300"))
+JOB_PROGRESS_INTERVAL = 0.5 # Seconds between progress writes while the model streams
+
+job_queue = JobQueue(JOB_DB, retention_seconds=JOB_RETENTION_SECONDS, stale_seconds=JOB_STALE_SECONDS)
+
+# Share of a job's progress bar given to extraction; the analysis gets the rest
+EXTRACT_SHARE = 0.4
+
+
+class _Progress:
+    """Forward progress to the queue, dropping updates closer together than JOB_PROGRESS_INTERVAL."""
+
+    def __init__(self, report):
+        self.report = report
+        self.last = 0.0
+
+    def __call__(self, fraction, message=None, force=False, partial=None):
+        now = time.monotonic()
+        if force or now - self.last >= JOB_PROGRESS_INTERVAL:
+            self.last = now
+            self.report(fraction, message, partial)
+
+
+def _extract(payload, progress, info=None):
+    """Extract PDF pages with progress over the extraction share (info: see iter_pdf_pages). Returns: text"""
+    pages = []
+    progress(0.0, "Extracting text from the PDF...", force=True)
+    for page in iter_pdf_pages(payload, info=info):
+        pages.append(page)
+        # The page count is not known up front; approach EXTRACT_SHARE asymptotically
+        progress(EXTRACT_SHARE * len(pages) / (len(pages) + 10), f"Extracted {len(pages)} pages")
+    progress(EXTRACT_SHARE, f"Extracted {len(pages)} pages. Analyzing...", force=True)
+    return "".join(pages)
+
+
+def _analyze(events, progress, result_event_keys, partial=None):
+    """
+    Drain a stream_* generator into a result dict, turning its events into progress.
+    The partial result (score or status once parsed, and the text received so far)
+    goes out with each progress update, starting from the given partial dict.
+    Returns: dict
+    """
+    partial = dict(partial or {}, text="")
+    for event, data in events:
+        if event == "progress":
+            message = data.get("message") or "Combining section notes..."
+            if data.get("reused"):
+                message = f"Combining section notes ({data['reused']} of {data.get('chunks')} sections unchanged since an earlier revision)..."
+            progress(EXTRACT_SHARE + 0.1, message, force=True, partial=partial)
+        elif event in ("score", "status"):
+            partial.update(data)
+            progress(EXTRACT_SHARE + 0.2, "Receiving the analysis...", force=True, partial=partial)
+        elif event == "delta":
+            partial["text"] += data.get("text", "")
+            received = len(partial["text"])
+            # Typical answers are a few hundred characters
+            progress(min(0.95, EXTRACT_SHARE + 0.2 + 0.4 * received / (received + 600)), "Receiving the analysis...", partial=partial)
+        elif event == "done":
+            return {key: data.get(key) for key in result_event_keys + ("timings", "map_reduce", "truncated", "pages_extracted", "max_pages") if key in data}
+    raise RuntimeError("Analysis ended without a result.")
+
+
+def run_evaluation_job(payload, params, report):
+    progress = _Progress(report)
+    started = time.perf_counter()
+    extraction = {}
+    text = _extract(payload, progress, extraction)
+    preview = text[:500] + ('...' if len(text) > 500 else '')
+    if not text.strip():
+        return {"type": "evaluation", "preview": preview, "score_percent": "N/A", "justification": "No text could be extracted from the PDF."}
+    progress(EXTRACT_SHARE, None, force=True, partial={"preview": preview})
+    extract_ms = round((time.perf_counter() - started) * 1000, 1)
+    result = _analyze(stream_evaluate_research_paper(text), progress, ("score_percent", "justification"), {"preview": preview})
+    result.setdefault("timings", {})["extract_ms"] = extract_ms
+    return dict(result, type="evaluation", preview=preview, **truncation_notice(extraction))
+
+
+def run_document_job(payload, params, report):
+    progress = _Progress(report)
+    progress(0.0, "Extracting text from the document...", force=True)
+    # stream_verify_document extracts the text itself (served from the extraction cache if seen before)
+    result = _analyze(stream_verify_document(payload), progress, ("verification_status", "details"))
+    return dict(result, type="document_verification")
+
+
+job_queue.register("evaluate", run_evaluation_job)
+job_queue.register("verify-document", run_document_job)
+
+
+def start_job_workers(count=None):
+    """Start this process's job worker threads (JOB_WORKERS by default). No-op for 0."""
+    count = JOB_WORKERS if count is None else count
+    if count > 0:
+        job_queue.start_workers(count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background job workers for /jobs/evaluate and /jobs/verify-document.")
+    parser.add_argument("--workers", "-w", type=int, default=max(1, JOB_WORKERS))
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    job_queue.start_workers(args.workers)
+    logger.info(f"Job workers started: {args.workers} threads on {JOB_DB}")
+    try:
+        while not stop.wait(60):
+            logger.info("Job queue status", extra={"fields": job_queue.stats()["counts"]})
+    except KeyboardInterrupt:
+        pass
+    # Running jobs are abandoned; they are re-queued once JOB_STALE_SECONDS pass without a heartbeat
+    job_queue.stop_workers(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# llm_client.py
+#
+# Shared async path for Gemini calls. One event loop per process runs in a
+# background thread and owns a global semaphore, so every async caller (ASGI
+# handlers, batch jobs, sync code using run()) shares one concurrency budget.
+# The GenerativeModel's async client and its connection pool are created once
+# per process, bound to this loop, and reused across calls.
+
+import asyncio
+import os
+import threading
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "256"))
+
+_lock = threading.Lock()
+_loop = None
+_loop_pid = None
+_semaphore = None
+_in_flight = 0
+_completed = 0
+_failed = 0
+
+
+def _ensure_loop():
+    """Start the background event loop (again, after a fork) and return it."""
+    global _loop, _loop_pid, _semaphore
+    if _loop is not None and _loop_pid == os.getpid():
+        return _loop
+    with _lock:
+        if _loop is None or _loop_pid != os.getpid():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="llm-client-loop", daemon=True)
+            thread.start()
+            _semaphore = asyncio.run_coroutine_threadsafe(_make_semaphore(), loop).result()
+            _loop, _loop_pid = loop, os.getpid()
+    return _loop
+
+
+async def _make_semaphore():
+    return asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+
+async def _generate_on_loop(model, prompt, generation_config, **kwargs):
+    global _in_flight, _completed, _failed
+    async with _semaphore:
+        _in_flight += 1
+        try:
+            if hasattr(model, "generate_content_async"):
+                response = await model.generate_content_async(prompt, generation_config=generation_config, **kwargs)
+            else:
+                # Stand-ins without an async API run in the default thread pool
+                loop = asyncio.get_running_loop()
+                response = await loop.run_in_executor(
+                    None, lambda: model.generate_content(prompt, generation_config=generation_config, **kwargs)
+                )
+            _completed += 1
+            return response
+        except Exception:
+            _failed += 1
+            raise
+        finally:
+            _in_flight -= 1
+
+
+async def generate_async(model, prompt, generation_config=None, **kwargs):
+    """
+    Await model.generate_content_async on the shared loop, under the global semaphore.
+    Safe to call from any event loop; the call is hopped onto the client loop.
+    """
+    loop = _ensure_loop()
+    coro = _generate_on_loop(model, prompt, generation_config, **kwargs)
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+def submit(coro):
+    """Schedule a coroutine on the shared loop from sync code. Returns a concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(coro, _ensure_loop())
+
+
+def run(coro, timeout=None):
+    """Run a coroutine on the shared loop and block until it finishes."""
+    return submit(coro).result(timeout=timeout)
+
+
+def stats():
+    """Concurrency counters for the shared client, suitable for JSON."""
+    return {
+        "max_concurrency": LLM_MAX_CONCURRENCY,
+        "in_flight": _in_flight,
+        "completed": _completed,
+        "failed": _failed,
+    }
@@ -0,0 +1,530 @@
+# llm_scheduler.py
+#
+# Every Gemini call goes through one scheduler per process:
+#   - token buckets for requests/minute (LLM_RPM) and estimated tokens/minute (LLM_TPM),
+#     so bursts queue here instead of turning into quota errors upstream;
+#   - priority classes: interactive (/verify) is admitted ahead of standard (paper and
+#     document analysis) and bulk (map-stage chunks, batch claims). Waiting ages a
+#     request upward by one class every LLM_PRIORITY_AGING_SECONDS, so bulk work
+#     is delayed under load but never starved;
+#   - retries with full-jitter exponential backoff on 429 and 5xx errors (a 429 also
+#     drains the request bucket so every caller backs off, not just the one that failed);
+#   - single-flight: identical in-flight prompts (same model, prompt and config) share
+#     one upstream call;
+#   - deadlines: queueing, backoff and every call are bounded by the request deadline
+#     (see deadlines.py) and each call by LLM_CALL_TIMEOUT; running out of request time
+#     raises DeadlineExceeded, while a call that only hit LLM_CALL_TIMEOUT is retried;
+#   - hedging (LLM_HEDGE, off by default): a non-streaming call still running after the
+#     LLM_HEDGE_PERCENTILE latency of its priority class gets a duplicate request, the
+#     first answer wins and the other is cancelled. Hedges run on the shared async
+#     client loop (sync callers block on it), are capped at LLM_HEDGE_MAX_RATIO of
+#     calls and are never sent while other requests wait for rate-limit budget.
+# Limits are per process; divide your quota by the number of workers.
+
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import deadlines
+import llm_client
+import metrics
+from chunking import estimate_tokens
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+LLM_RPM = float(os.getenv("LLM_RPM", "1000")) # 0 = unlimited
+LLM_TPM = float(os.getenv("LLM_TPM", "4000000")) # 0 = unlimited
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+LLM_PRIORITY_AGING_SECONDS = float(os.getenv("LLM_PRIORITY_AGING_SECONDS", "30"))
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "512"))
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "1").lower() not in ("0", "false", "no")
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "120")) # Seconds per call even without a request deadline; 0 = none
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0").lower() not in ("0", "false", "no")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")) # Observed calls per priority class before hedging starts
+LLM_HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1")) # Hedged requests per admitted call, at most
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "500")) # Recent call latencies kept per priority class
+
+INTERACTIVE, STANDARD, BULK = "interactive", "standard", "bulk"
+PRIORITY_CLASSES = {INTERACTIVE: 0, STANDARD: 1, BULK: 2}
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+                   "BadGateway", "GatewayTimeout", "DeadlineExceeded", "TimeoutError"}
+_RETRY_DELAY_PATTERN = re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)")
+
+
+class TokenBucket:
+    """Continuous-refill bucket holding up to one minute of budget. rate_per_minute=0 disables it."""
+
+    def __init__(self, rate_per_minute):
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60.0
+        self.tokens = rate_per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount is available (0 if it is now)."""
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity) # A single request larger than the bucket must still pass eventually
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        if self.capacity:
+            self.tokens -= min(amount, self.capacity)
+
+    def drain(self):
+        if self.capacity:
+            self.tokens = min(self.tokens, 0.0)
+
+
+def is_retryable(error):
+    """True for rate-limit (429), server-side (5xx) and per-call timeout errors from the Gemini client."""
+    if isinstance(error, deadlines.DeadlineExceeded):
+        return False # The request is out of time; retrying cannot help
+    code = getattr(error, "code", None)
+    if callable(code):
+        try:
+            code = code()
+        except Exception:
+            code = None
+    for status in (code, getattr(error, "status_code", None)):
+        try:
+            if status is not None and int(status) in RETRYABLE_STATUS:
+                return True
+        except (TypeError, ValueError):
+            pass
+    return type(error).__name__ in RETRYABLE_NAMES
+
+
+def _is_rate_limit(error):
+    return type(error).__name__ in ("ResourceExhausted", "TooManyRequests") or str(getattr(error, "code", "")) == "429"
+
+
+def _server_retry_delay(error):
+    match = _RETRY_DELAY_PATTERN.search(str(error))
+    return float(match.group(1)) if match else 0.0
+
+
+class LLMScheduler:
+    def __init__(self, rpm=LLM_RPM, tpm=LLM_TPM, max_retries=LLM_MAX_RETRIES, backoff_base=LLM_BACKOFF_BASE,
+                 backoff_max=LLM_BACKOFF_MAX, aging_seconds=LLM_PRIORITY_AGING_SECONDS, single_flight=LLM_SINGLE_FLIGHT,
+                 call_timeout=LLM_CALL_TIMEOUT, hedge=LLM_HEDGE, hedge_percentile=LLM_HEDGE_PERCENTILE,
+                 hedge_min_samples=LLM_HEDGE_MIN_SAMPLES, hedge_max_ratio=LLM_HEDGE_MAX_RATIO):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.aging_seconds = aging_seconds
+        self.single_flight = single_flight
+        self.call_timeout = call_timeout
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_max_ratio = hedge_max_ratio
+        self._latencies = {name: deque(maxlen=LLM_HEDGE_WINDOW) for name in PRIORITY_CLASSES}
+        self._cond = threading.Condition()
+        self._waiters = [] # heap of (rank, seq)
+        self._seq = itertools.count()
+        self._inflight = {} # single-flight key -> Future
+        self._inflight_lock = threading.Lock()
+        self._stats = {"admitted": {name: 0 for name in PRIORITY_CLASSES}, "wait_seconds": {name: 0.0 for name in PRIORITY_CLASSES},
+                       "retries": 0, "rate_limited": 0, "gave_up": 0, "coalesced": 0,
+                       "deadline_exceeded": 0, "call_timeouts": 0, "hedges": 0, "hedge_wins": 0}
+
+    # --- Admission ---
+
+    def _enqueue(self, priority):
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown LLM priority '{priority}'. Choose one of: {', '.join(PRIORITY_CLASSES)}")
+        ticket = (time.monotonic() + PRIORITY_CLASSES[priority] * self.aging_seconds, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+        return ticket
+
+    def _try_admit(self, ticket, cost):
+        """Admit ticket if it is at the head of the queue and both buckets allow it. Returns: seconds to wait (0 = admitted)"""
+        with self._cond:
+            if self._waiters[0] != ticket:
+                return 0.05 # Someone ahead of us; notify_all() wakes sync waiters sooner
+            now = time.monotonic()
+            wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(cost, now))
+            if wait > 0:
+                return wait
+            self.requests.take(1)
+            self.tokens.take(cost)
+            heapq.heappop(self._waiters)
+            self._cond.notify_all()
+            return 0.0
+
+    def _record_admit(self, priority, started):
+        waited = time.monotonic() - started
+        with self._cond:
+            self._stats["admitted"][priority] += 1
+            self._stats["wait_seconds"][priority] += waited
+        metrics.observe_stage("llm_queue_wait", waited, priority=priority)
+
+    def acquire(self, priority=STANDARD, cost=1, deadline=None):
+        """Block until a call of estimated cost tokens may be sent. Raises DeadlineExceeded past deadline."""
+        started = time.monotonic()
+        ticket = self._enqueue(priority)
+        try:
+            while True:
+                wait = self._try_admit(ticket, cost)
+                if not wait:
+                    break
+                if deadline is not None:
+                    if time.monotonic() >= deadline:
+                        raise self._expired("Waiting for LLM rate-limit budget")
+                    wait = min(wait, deadline - time.monotonic())
+                with self._cond:
+                    self._cond.wait(min(wait, 1.0))
+        except BaseException:
+            self._abandon(ticket) # A ticket left at the head would block everyone behind it
+            raise
+        self._record_admit(priority, started)
+
+    async def acquire_async(self, priority=STANDARD, cost=1, deadline=None):
+        started = time.monotonic()
+        ticket = self._enqueue(priority)
+        try:
+            while True:
+                wait = self._try_admit(ticket, cost)
+                if not wait:
+                    break
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise self._expired("Waiting for LLM rate-limit budget")
+                await asyncio.sleep(min(wait, 0.05))
+        except (asyncio.CancelledError, deadlines.DeadlineExceeded):
+            self._abandon(ticket)
+            raise
+        self._record_admit(priority, started)
+
+    def _abandon(self, ticket):
+        with self._cond:
+            if ticket in self._waiters:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    # --- Retries ---
+
+    def _backoff(self, attempt, error):
+        with self._cond:
+            self._stats["retries"] += 1
+            if _is_rate_limit(error):
+                self._stats["rate_limited"] += 1
+                self.requests.drain()
+        metrics.count("llm_retry", reason=type(error).__name__)
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        return max(delay, _server_retry_delay(error))
+
+    def _expired(self, what):
+        with self._cond:
+            self._stats["deadline_exceeded"] += 1
+        metrics.count("llm_deadline_exceeded")
+        return deadlines.DeadlineExceeded(f"{what} ran past the request deadline.")
+
+    def _call_timeout(self, deadline):
+        """Seconds the next call may take: LLM_CALL_TIMEOUT, or less if the deadline is closer. None = unbounded."""
+        timeout = self.call_timeout or None
+        if deadline is not None:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise self._expired("The LLM call")
+            timeout = left if timeout is None else min(timeout, left)
+        return timeout
+
+    def _retry_or_raise(self, attempt, error, deadline):
+        """After a failed call: re-raise, or return the backoff delay before the next attempt."""
+        if deadline is not None and time.monotonic() >= deadline:
+            raise self._expired("The LLM call") from error
+        if isinstance(error, TimeoutError) and not isinstance(error, deadlines.DeadlineExceeded):
+            with self._cond:
+                self._stats["call_timeouts"] += 1
+        if not is_retryable(error) or attempt == self.max_retries:
+            if is_retryable(error):
+                self._give_up(error)
+            raise error
+        delay = self._backoff(attempt, error)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            raise self._expired("Retrying the LLM call") from error
+        logger.warning(f"Retryable LLM error ({type(error).__name__}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+        return delay
+
+    # --- Hedging ---
+
+    def _observe(self, priority, seconds):
+        with self._cond:
+            self._latencies[priority].append(seconds)
+
+    def _hedge_delay(self, priority):
+        """The LLM_HEDGE_PERCENTILE latency of recent calls in this class, or None until there are enough."""
+        with self._cond:
+            samples = sorted(self._latencies[priority])
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100))]
+
+    def _admit_hedge(self, cost):
+        """Take budget for a hedged request if the ratio cap allows and nobody is queued. Returns: bool"""
+        with self._cond:
+            admitted = sum(self._stats["admitted"].values())
+            if self._waiters or self._stats["hedges"] + 1 > self.hedge_max_ratio * admitted:
+                return False
+            now = time.monotonic()
+            if self.requests.wait_time(1, now) or self.tokens.wait_time(cost, now):
+                return False
+            self.requests.take(1)
+            self.tokens.take(cost)
+            self._stats["hedges"] += 1
+        return True
+
+    async def _timed_call_async(self, model, prompt, generation_config, priority, kwargs, timeout):
+        started = time.monotonic()
+        call = llm_client.generate_async(model, prompt, generation_config, **kwargs)
+        response = await (asyncio.wait_for(call, timeout) if timeout else call)
+        self._observe(priority, time.monotonic() - started)
+        return response
+
+    async def _hedged_call(self, model, prompt, generation_config, priority, cost, kwargs, timeout):
+        """One attempt, duplicated once it runs past the hedge delay; the first success wins."""
+        delay = self._hedge_delay(priority)
+        primary = asyncio.ensure_future(self._timed_call_async(model, prompt, generation_config, priority, kwargs, timeout))
+        tasks = [primary]
+        try:
+            if delay is None or (timeout is not None and delay >= timeout):
+                return await primary
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self._admit_hedge(cost):
+                return await primary
+            metrics.count("llm_hedge", priority=priority)
+            hedge_timeout = None if timeout is None else max(0.001, timeout - delay)
+            hedge = asyncio.ensure_future(self._timed_call_async(model, prompt, generation_config, priority, kwargs, hedge_timeout))
+            tasks.append(hedge)
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            with self._cond:
+                                self._stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel() # The losing request (or both, if our caller gave up)
+
+    def _give_up(self, error):
+        with self._cond:
+            self._stats["gave_up"] += 1
+        logger.error(f"LLM call failed after {self.max_retries} retries: {error}")
+
+    # --- Calls ---
+
+    @staticmethod
+    def _cost(prompt, generation_config):
+        expected = LLM_EXPECTED_OUTPUT_TOKENS
+        if isinstance(generation_config, dict):
+            expected = generation_config.get("max_output_tokens", expected)
+        return estimate_tokens(prompt if isinstance(prompt, str) else str(prompt)) + expected
+
+    @staticmethod
+    def _flight_key(model, prompt, generation_config, kwargs):
+        identity = getattr(model, "model_name", None) or f"{type(model).__name__}:{id(model)}"
+        blob = json.dumps([identity, str(prompt), generation_config, sorted(kwargs.items())], sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _join_or_lead(self, key):
+        """Returns: (future, is_leader)"""
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats["coalesced"] += 1
+                metrics.count("llm_coalesced")
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def _settle(self, key, future, result=None, error=None):
+        with self._inflight_lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    @staticmethod
+    def _with_timeout(kwargs, timeout):
+        """kwargs with the per-call timeout passed to the Gemini client as request_options."""
+        if timeout is None:
+            return kwargs
+        options = dict(kwargs.get("request_options") or {})
+        options.setdefault("timeout", timeout)
+        return dict(kwargs, request_options=options)
+
+    def _call_with_retries(self, model, prompt, generation_config, priority, kwargs, deadline=None):
+        if self.hedge and not kwargs.get("stream"):
+            # On the client loop the losing request can actually be cancelled
+            return llm_client.run(self._call_with_retries_async(model, prompt, generation_config, priority, kwargs, deadline))
+        cost = self._cost(prompt, generation_config)
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority, cost, deadline)
+            timeout = self._call_timeout(deadline)
+            started = time.monotonic()
+            try:
+                response = model.generate_content(prompt, generation_config=generation_config, **self._with_timeout(kwargs, timeout))
+            except Exception as e:
+                time.sleep(self._retry_or_raise(attempt, e, deadline))
+                continue
+            if not kwargs.get("stream"):
+                self._observe(priority, time.monotonic() - started)
+            return response
+
+    async def _call_with_retries_async(self, model, prompt, generation_config, priority, kwargs, deadline=None):
+        cost = self._cost(prompt, generation_config)
+        for attempt in range(self.max_retries + 1):
+            await self.acquire_async(priority, cost, deadline)
+            timeout = self._call_timeout(deadline)
+            try:
+                if self.hedge:
+                    return await self._hedged_call(model, prompt, generation_config, priority, cost, kwargs, timeout)
+                return await self._timed_call_async(model, prompt, generation_config, priority, kwargs, timeout)
+            except Exception as e:
+                await asyncio.sleep(self._retry_or_raise(attempt, e, deadline))
+
+    def _check_deadline(self, deadline):
+        if deadline is not None and time.monotonic() >= deadline:
+            raise self._expired("The LLM call")
+
+    def generate(self, model, prompt, generation_config=None, priority=STANDARD, stream=False, **kwargs):
+        """
+        Scheduled model.generate_content, bounded by the current request deadline.
+        Streaming calls are rate limited and retried until the stream opens, but never
+        coalesced or hedged.
+        """
+        deadline = deadlines.current()
+        self._check_deadline(deadline)
+        if stream:
+            return self._call_with_retries(model, prompt, generation_config, priority, dict(kwargs, stream=True), deadline)
+        if not self.single_flight:
+            return self._call_with_retries(model, prompt, generation_config, priority, kwargs, deadline)
+        key = self._flight_key(model, prompt, generation_config, kwargs)
+        future, leader = self._join_or_lead(key)
+        if not leader:
+            try:
+                return future.result(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                raise self._expired("Waiting for a shared LLM call")
+            except deadlines.DeadlineExceeded:
+                # The leader's deadline was shorter than ours; try on our own time
+                return self._call_with_retries(model, prompt, generation_config, priority, kwargs, deadline)
+        try:
+            result = self._call_with_retries(model, prompt, generation_config, priority, kwargs, deadline)
+        except Exception as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result=result)
+        return result
+
+    async def generate_async(self, model, prompt, generation_config=None, priority=STANDARD, **kwargs):
+        """Async scheduled call through the shared llm_client loop; coalesces with sync callers too."""
+        deadline = deadlines.current()
+        self._check_deadline(deadline)
+        if not self.single_flight:
+            return await self._call_with_retries_async(model, prompt, generation_config, priority, kwargs, deadline)
+        key = self._flight_key(model, prompt, generation_config, kwargs)
+        future, leader = self._join_or_lead(key)
+        if not leader:
+            # shield(): giving up must not cancel the call other waiters share
+            shared = asyncio.shield(asyncio.wrap_future(future))
+            try:
+                if deadline is None:
+                    return await shared
+                return await asyncio.wait_for(shared, max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise self._expired("Waiting for a shared LLM call")
+            except deadlines.DeadlineExceeded:
+                return await self._call_with_retries_async(model, prompt, generation_config, priority, kwargs, deadline)
+        try:
+            result = await self._call_with_retries_async(model, prompt, generation_config, priority, kwargs, deadline)
+        except BaseException as e:
+            self._settle(key, future, error=e if isinstance(e, Exception) else RuntimeError("LLM call was cancelled"))
+            raise
+        self._settle(key, future, result=result)
+        return result
+
+    def stats(self):
+        with self._cond:
+            admitted = dict(self._stats["admitted"])
+            average_wait = {
+                name: round(self._stats["wait_seconds"][name] / admitted[name] * 1000, 1) if admitted[name] else 0.0
+                for name in PRIORITY_CLASSES
+            }
+            stats = {
+                "rpm_limit": self.requests.capacity,
+                "tpm_limit": self.tokens.capacity,
+                "waiting": len(self._waiters),
+                "admitted": admitted,
+                "average_wait_ms": average_wait,
+                "retries": self._stats["retries"],
+                "rate_limited": self._stats["rate_limited"],
+                "gave_up": self._stats["gave_up"],
+                "coalesced": self._stats["coalesced"],
+                "deadline_exceeded": self._stats["deadline_exceeded"],
+                "call_timeouts": self._stats["call_timeouts"],
+                "call_timeout_s": self.call_timeout,
+            }
+            calls = sum(admitted.values())
+            stats["hedging"] = {
+                "enabled": self.hedge,
+                "percentile": self.hedge_percentile,
+                "max_ratio": self.hedge_max_ratio,
+                "hedges": self._stats["hedges"],
+                "hedge_wins": self._stats["hedge_wins"],
+                "hedge_rate": round(self._stats["hedges"] / calls, 4) if calls else 0.0,
+            }
+        stats["hedging"]["delay_ms"] = {
+            name: round(delay * 1000, 1) if delay is not None else None
+            for name, delay in ((name, self._hedge_delay(name)) for name in PRIORITY_CLASSES)
+        }
+        with self._inflight_lock:
+            stats["in_flight_unique"] = len(self._inflight)
+        return stats
+
+
+scheduler = LLMScheduler()
+
+
+def generate(model, prompt, generation_config=None, priority=STANDARD, **kwargs):
+    return scheduler.generate(model, prompt, generation_config, priority=priority, **kwargs)
+
+
+async def generate_async(model, prompt, generation_config=None, priority=STANDARD, **kwargs):
+    return await scheduler.generate_async(model, prompt, generation_config, priority=priority, **kwargs)
+
+
+def stats():
+    return scheduler.stats()
@@ -1,13 +1,124 @@
-from fact_verification import verify_fact
+import argparse
+import json
+import os
+import sys
+import time
 
-# Take user input
-claim = input("Enter a claim to verify: ")
+from fact_verification import verify_fact, verify_claims, normalize_claim
 
-# Call the verification function
-truth_score, explanation, sources = verify_fact(claim)
 
-# Print the result
-print("\nVerification Result:")
-print("Truth Score:", truth_score)
-print("Explanation:", explanation)
-print("Sources Used:", ", ".join(sources) if sources else "No sources found.")
\ No newline at end of file
+def read_claims(stream):
+    """One claim per line; JSON lines with a "claim" field are also accepted. Blank lines are skipped."""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                claim = json.loads(line).get("claim")
+            except ValueError:
+                claim = line
+            if isinstance(claim, str) and claim.strip():
+                yield claim.strip()
+            continue
+        yield line
+
+
+def finished_claims(output_path):
+    """Normalized claims already written to an earlier run's output. Error results are retried."""
+    done = set()
+    try:
+        with open(output_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue # A crash can leave a partial last line
+                if record.get("truth_score") != "Error" and isinstance(record.get("claim"), str):
+                    done.add(normalize_claim(record["claim"]))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def drop_torn_line(output_path):
+    """Cut a partial last line (left by a crash mid-write) so appended results start on a line of their own."""
+    try:
+        f = open(output_path, "r+b")
+    except FileNotFoundError:
+        return
+    with f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            step = min(65536, position)
+            f.seek(position - step)
+            block = f.read(step)
+            newline = block.rfind(b"\n")
+            if newline != -1:
+                position = position - step + newline + 1
+                break
+            position -= step
+        if position < end:
+            f.truncate(position)
+
+
+def run_batch(args):
+    source = sys.stdin if args.input == "-" else open(args.input)
+    with source:
+        claims = list(read_claims(source))
+
+    skipped = 0
+    if args.output:
+        done = finished_claims(args.output)
+        remaining = [claim for claim in claims if normalize_claim(claim) not in done]
+        skipped = len(claims) - len(remaining)
+        claims = remaining
+        drop_torn_line(args.output)
+        out = open(args.output, "a")
+    else:
+        out = sys.stdout
+
+    print(f"Verifying {len(claims)} claims ({skipped} already finished).", file=sys.stderr)
+    started = time.perf_counter()
+    written = 0
+    try:
+        for result in verify_claims(claims, max_workers=args.workers, packed=False if args.no_pack else None):
+            result.pop("indexes", None)
+            out.write(json.dumps(result) + "\n")
+            out.flush() # Every finished claim is on disk before the next one, so a crash loses nothing
+            written += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - started
+    rate = written / elapsed if elapsed > 0 else 0.0
+    print(f"Done: {written} results in {elapsed:.1f}s ({rate:.1f} claims/s).", file=sys.stderr)
+
+
+def run_interactive():
+    # Take user input
+    claim = input("Enter a claim to verify: ")
+
+    # Call the verification function
+    truth_score, explanation, sources = verify_fact(claim)
+
+    # Print the result
+    print("\nVerification Result:")
+    print("Truth Score:", truth_score)
+    print("Explanation:", explanation)
+    print("Sources Used:", ", ".join(sources) if sources else "No sources found.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify a claim interactively, or many claims from a file.")
+    parser.add_argument("--input", "-i", help="File with one claim per line (or JSON lines with a 'claim' field); '-' for stdin")
+    parser.add_argument("--output", "-o", help="JSONL output file. Re-running with the same file resumes where it stopped. Defaults to stdout.")
+    parser.add_argument("--workers", "-w", type=int, default=None, help="Concurrent verifications (default BATCH_VERIFY_MAX_WORKERS)")
+    parser.add_argument("--no-pack", action="store_true", help="One Gemini call per claim instead of packing several claims per call")
+    args = parser.parse_args()
+
+    if args.input:
+        run_batch(args)
+    else:
+        run_interactive()
@@ -0,0 +1,95 @@
+# memory_stats.py
+#
+# Per-process memory accounting from /proc (Linux only), used to check how much
+# of each gunicorn worker's RSS is really its own versus shared with the master.
+#
+#   python memory_stats.py <gunicorn master pid>
+
+import os
+import sys
+
+_ROLLUP_FIELDS = {
+    "Rss": "rss_kb",
+    "Pss": "pss_kb",
+    "Shared_Clean": "shared_clean_kb",
+    "Shared_Dirty": "shared_dirty_kb",
+    "Private_Clean": "private_clean_kb",
+    "Private_Dirty": "private_dirty_kb",
+    "Swap": "swap_kb",
+}
+
+
+def process_memory(pid=None):
+    """
+    Memory breakdown for one process.
+    uss_mb (unique set size) is the memory that would be freed if the process exited;
+    pss_mb splits shared pages evenly between the processes that map them.
+    Returns: dict, or {'pid', 'error'} when /proc is unavailable.
+    """
+    pid = os.getpid() if pid is None else pid
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                key = parts[0].rstrip(":")
+                if key in _ROLLUP_FIELDS and len(parts) >= 2:
+                    values[_ROLLUP_FIELDS[key]] = int(parts[1])
+    except OSError as e:
+        return {"pid": pid, "error": str(e)}
+
+    uss_kb = values.get("private_clean_kb", 0) + values.get("private_dirty_kb", 0)
+    shared_kb = values.get("shared_clean_kb", 0) + values.get("shared_dirty_kb", 0)
+    return {
+        "pid": pid,
+        "rss_mb": round(values.get("rss_kb", 0) / 1024, 1),
+        "pss_mb": round(values.get("pss_kb", 0) / 1024, 1),
+        "uss_mb": round(uss_kb / 1024, 1),
+        "shared_mb": round(shared_kb / 1024, 1),
+    }
+
+
+def child_pids(pid):
+    """Direct children of a process (e.g. the workers of a gunicorn master)."""
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return sorted(set(children))
+
+
+def worker_memory_report(master_pid=None):
+    """
+    Memory for a gunicorn master and all its workers, plus totals.
+    Defaults to this process's parent, which is the master when called from a worker.
+    Returns: dict (JSON serializable)
+    """
+    master_pid = os.getppid() if master_pid is None else master_pid
+    workers = [process_memory(pid) for pid in child_pids(master_pid)]
+    measured = [w for w in workers if "error" not in w]
+    return {
+        "master": process_memory(master_pid),
+        "workers": workers,
+        "worker_count": len(workers),
+        "total_worker_uss_mb": round(sum(w["uss_mb"] for w in measured), 1),
+        "total_worker_rss_mb": round(sum(w["rss_mb"] for w in measured), 1),
+        "total_worker_pss_mb": round(sum(w["pss_mb"] for w in measured), 1),
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python memory_stats.py <gunicorn master pid>")
+        sys.exit(1)
+    report = worker_memory_report(int(sys.argv[1]))
+    print(f"{'pid':>8} {'rss_mb':>9} {'pss_mb':>9} {'uss_mb':>9} {'shared_mb':>10}")
+    for row in [report["master"]] + report["workers"]:
+        if "error" in row:
+            print(f"{row['pid']:>8} error: {row['error']}")
+        else:
+            print(f"{row['pid']:>8} {row['rss_mb']:>9} {row['pss_mb']:>9} {row['uss_mb']:>9} {row['shared_mb']:>10}")
+    print(f"Workers: {report['worker_count']}, total USS {report['total_worker_uss_mb']} MB, "
+          f"total PSS {report['total_worker_pss_mb']} MB, total RSS {report['total_worker_rss_mb']} MB")
@@ -0,0 +1,149 @@
+# metrics.py
+#
+# Per-stage latency histograms and counters, rendered in the Prometheus text
+# exposition format for the /metrics endpoint. Observing a value is a
+# perf_counter() pair, a bisect and a short lock, so instrumentation stays on in
+# production; METRICS_ENABLED=0 turns timed() into a no-op.
+# Metrics are per process: under gunicorn each scrape reports the worker that
+# served it (scrape workers individually or aggregate by instance).
+
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+# Seconds; spans sub-millisecond parsing up to multi-minute map-reduce evaluations
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in items)
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {} # label key -> [bucket counts..., +Inf count], sum
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("app_stage_duration_seconds", "Time spent in each processing stage.")
+STAGE_ERRORS = Counter("app_stage_errors_total", "Processing stages that raised an exception.")
+HTTP_REQUEST_SECONDS = Histogram("app_http_request_duration_seconds", "HTTP request latency until the response is returned.")
+HTTP_REQUESTS = Counter("app_http_requests_total", "HTTP requests by endpoint, method and status.")
+EVENTS = Counter("app_events_total", "Notable events (cache hits, fallbacks, blocked prompts).")
+
+_metrics = [STAGE_SECONDS, STAGE_ERRORS, HTTP_REQUEST_SECONDS, HTTP_REQUESTS, EVENTS]
+_collectors = []
+
+
+def observe_stage(stage, seconds, **labels):
+    if METRICS_ENABLED:
+        STAGE_SECONDS.observe(seconds, stage=stage, **labels)
+
+
+@contextmanager
+def timed(stage, **labels):
+    """
+    Time the enclosed block into app_stage_duration_seconds{stage=...}.
+    Exceptions are counted in app_stage_errors_total and re-raised.
+    """
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage, **labels)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage, **labels)
+
+
+def count(event, amount=1, **labels):
+    if METRICS_ENABLED:
+        EVENTS.inc(amount, event=event, **labels)
+
+
+def register_collector(collect):
+    """
+    Add a callback rendered on every scrape, for values owned elsewhere (cache stats, queue sizes).
+    collect() returns a list of (name, type, help, [(labels dict, value), ...]).
+    """
+    _collectors.append(collect)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        try:
+            families = collect()
+        except Exception:
+            continue # A broken collector must not take the whole scrape down
+        for name, kind, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{_format_labels(tuple(sorted(labels.items())))} {_format_value(value)}" for labels, value in samples)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,127 @@
+# model_registry.py
+
+import threading
+import time
+
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+NOT_LOADED = "not_loaded"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class _Entry:
+    def __init__(self, name, loader, required=True):
+        self.name = name
+        self.loader = loader
+        self.required = required
+        self.lock = threading.Lock()
+        self.state = NOT_LOADED
+        self.value = None
+        self.error = None
+        self.load_seconds = None
+        self.loaded_at = None
+        self.failed_at = None
+
+
+class ModelRegistry:
+    """
+    Defers loading of heavy models until they are first needed (or warmed up).
+
+    Each model is registered with a zero-argument loader that does its own imports.
+    get() runs the loader once, under a per-model lock, and records load state and
+    load time. A failed load returns None and is retried after retry_seconds.
+    Models registered with required=False (optional accelerations) are reported
+    but do not gate readiness.
+    """
+
+    def __init__(self, retry_seconds=60):
+        self.retry_seconds = retry_seconds
+        self._entries = {}
+
+    def register(self, name, loader, required=True):
+        self._entries[name] = _Entry(name, loader, required)
+
+    def names(self):
+        return list(self._entries)
+
+    def get(self, name):
+        """Return the loaded model object, loading it on first use. None if loading failed."""
+        entry = self._entries[name]
+        if entry.state == READY:
+            return entry.value
+        with entry.lock:
+            if entry.state == READY:
+                return entry.value
+            if entry.state == FAILED and time.time() - entry.failed_at < self.retry_seconds:
+                return None
+            entry.state = LOADING
+            started = time.perf_counter()
+            try:
+                value = entry.loader()
+            except Exception as e:
+                entry.state = FAILED
+                entry.error = str(e)
+                entry.failed_at = time.time()
+                entry.load_seconds = round(time.perf_counter() - started, 3)
+                logger.warning(f"Could not load model '{name}'. Error: {e}")
+                return None
+            entry.value = value
+            entry.state = READY
+            entry.error = None
+            entry.load_seconds = round(time.perf_counter() - started, 3)
+            entry.loaded_at = time.time()
+            logger.info(f"Model '{name}' loaded in {entry.load_seconds:.2f}s.")
+            return value
+
+    def set(self, name, value):
+        """Install an already-built object (e.g. a test stand-in) as a ready model."""
+        entry = self._entries.get(name)
+        if entry is None:
+            entry = _Entry(name, lambda: value)
+            self._entries[name] = entry
+        with entry.lock:
+            entry.value = value
+            entry.state = READY
+            entry.error = None
+            entry.load_seconds = 0.0
+            entry.loaded_at = time.time()
+
+    def reset(self, name):
+        """Forget a loaded or failed model so the next get() loads it again."""
+        entry = self._entries[name]
+        with entry.lock:
+            entry.value = None
+            entry.state = NOT_LOADED
+            entry.error = None
+            entry.load_seconds = None
+            entry.loaded_at = None
+            entry.failed_at = None
+
+    def is_ready(self, name):
+        return self._entries[name].state == READY
+
+    def warmup(self, names=None):
+        """Load the given models (default: all) now. Returns {name: bool loaded}."""
+        return {name: self.get(name) is not None for name in (names or self.names())}
+
+    def warmup_in_background(self, names=None):
+        thread = threading.Thread(target=self.warmup, args=(names,), name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self):
+        """Per-model load state and timing, suitable for JSON."""
+        return {
+            entry.name: {
+                "state": entry.state,
+                "required": entry.required,
+                "load_seconds": entry.load_seconds,
+                "loaded_at": entry.loaded_at,
+                "error": entry.error,
+            }
+            for entry in self._entries.values()
+        }
@@ -0,0 +1,445 @@
+# pdf_extraction.py
+#
+# One PDF text extraction service for every route. pdfminer runs in a process pool
+# (so a 200-page PDF does not pin a web worker's interpreter), in page-range jobs
+# with a per-job timeout and a page limit, and pages are yielded in order as soon
+# as their job finishes. Extracted text is cached by the file's SHA-256, so
+# /evaluate and /verify-document never extract the same upload twice.
+# Jobs read the PDF from a temp file rather than each getting a pickled copy of it.
+# A job's timeout runs from when a pool process picks it up, not from when it was
+# queued; a job that overruns it is killed and the pool replaced (jobs of other
+# requests lost with it are resubmitted once). A request deadline that passes
+# first only abandons the job. Documents longer than PDF_MAX_PAGES are cut there,
+# and callers can ask (info=) whether that happened.
+# A revised upload (new SHA-256) only pays for the pages that changed: each page
+# is fingerprinted from its content streams, fonts and form XObjects (cheap next
+# to layout analysis), and pages whose fingerprint was extracted before are served
+# from the page text cache.
+
+import hashlib
+import io
+import itertools
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import deadlines
+import metrics
+from result_cache import TieredCache
+from uploads import BufferedUpload, open_source
+
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1)))) # 0 = extract in-thread
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "300"))
+PDF_PAGES_PER_JOB = int(os.getenv("PDF_PAGES_PER_JOB", "16"))
+PDF_JOB_TIMEOUT = float(os.getenv("PDF_JOB_TIMEOUT", "60"))
+# Job start times are tracked in this many shared slots (reused round-robin)
+JOB_SLOTS = 4096
+JOB_START_POLL = 0.05 # Seconds between checks whether a queued job has started
+
+
+class PDFExtractionTimeout(Exception):
+    """A page-range extraction job did not finish within PDF_JOB_TIMEOUT."""
+
+
+pdf_text_cache = TieredCache(
+    "pdf_text",
+    max_entries=int(os.getenv("PDF_TEXT_CACHE_MAX_ENTRIES", "128")),
+    ttl=int(os.getenv("PDF_TEXT_CACHE_TTL", str(24 * 3600))),
+    db_path=os.getenv("PDF_TEXT_CACHE_DB") or None
+)
+PDF_PAGE_CACHE_ENABLED = os.getenv("PDF_PAGE_CACHE", "1").lower() not in ("0", "false", "no")
+pdf_page_cache = None
+if PDF_PAGE_CACHE_ENABLED:
+    pdf_page_cache = TieredCache(
+        "pdf_pages",
+        max_entries=int(os.getenv("PDF_PAGE_CACHE_MAX_ENTRIES", "20000")),
+        ttl=int(os.getenv("PDF_PAGE_CACHE_TTL", str(7 * 24 * 3600))),
+        db_path=os.getenv("PDF_PAGE_CACHE_DB", os.path.join("cache", "pdf_pages.db")) or None
+    )
+
+_pool = None # (ProcessPoolExecutor, job start times, job pids) of this process
+_pool_pid = None
+_pool_lock = threading.Lock()
+_slots = itertools.count()
+_stats_lock = threading.Lock()
+_stats = {"documents": 0, "pages": 0, "pages_reused": 0, "truncated": 0, "jobs": 0, "timeouts": 0, "recycles": 0,
+          "failures": 0, "extract_seconds": 0.0}
+
+
+# --- Worker-side functions (run in the pool processes) ---
+
+_worker_starts = None
+_worker_pids = None
+
+
+def _init_worker(starts, pids):
+    global _worker_starts, _worker_pids
+    _worker_starts, _worker_pids = starts, pids
+
+
+def _run_job(slot, fn, *args):
+    """Record when and where the job started, for the caller's timeout, then run it."""
+    _worker_pids[slot] = os.getpid()
+    _worker_starts[slot] = time.time()
+    return fn(*args)
+
+
+def _open_pdf(source):
+    """source is the PDF's bytes (in-thread extraction) or the path of its temp file."""
+    return io.BytesIO(source) if isinstance(source, bytes) else open(source, "rb")
+
+
+def _count_pages(source):
+    from pdfminer.pdfpage import PDFPage
+    with _open_pdf(source) as handle:
+        return sum(1 for _ in PDFPage.get_pages(handle))
+
+
+def _stable_digest(obj, digest, memo, depth=0):
+    """
+    Feed a PDF object into digest independently of object numbers (which change
+    between revisions of the same document). Streams contribute their decoded data;
+    images and /Parent links are skipped since they cannot change the extracted text.
+    """
+    from pdfminer.pdftypes import PDFObjRef, PDFStream
+    from pdfminer.psparser import PSLiteral
+
+    if depth > 12:
+        return
+    if isinstance(obj, PDFObjRef):
+        if obj.objid in memo:
+            digest.update(memo[obj.objid])
+            return
+        sub = hashlib.sha256()
+        memo[obj.objid] = b"" # Breaks reference cycles
+        _stable_digest(obj.resolve(), sub, memo, depth + 1)
+        memo[obj.objid] = sub.digest()
+        digest.update(memo[obj.objid])
+    elif isinstance(obj, PDFStream):
+        subtype = obj.get("Subtype")
+        if isinstance(subtype, PSLiteral) and subtype.name == "Image":
+            digest.update(b"image")
+            return
+        _stable_digest(obj.attrs, digest, memo, depth + 1)
+        digest.update(obj.get_data())
+    elif isinstance(obj, dict):
+        for key in sorted(obj, key=str):
+            if key in ("Parent", "Length", "Filter", "DecodeParms"):
+                continue
+            digest.update(f"/{key}".encode())
+            _stable_digest(obj[key], digest, memo, depth + 1)
+    elif isinstance(obj, (list, tuple)):
+        digest.update(b"[")
+        for item in obj:
+            _stable_digest(item, digest, memo, depth + 1)
+        digest.update(b"]")
+    elif isinstance(obj, PSLiteral):
+        digest.update(f"/{obj.name}".encode())
+    elif isinstance(obj, bytes):
+        digest.update(obj)
+    else:
+        digest.update(repr(obj).encode())
+
+
+def _page_fingerprints(source, max_pages):
+    """
+    One fingerprint per page (up to max_pages) covering everything that determines its
+    text: page box, content streams and resources. None for a page that could not be
+    fingerprinted (it is always extracted).
+    Returns: (list of str or None, True if the document has more than max_pages pages)
+    """
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdftypes import resolve1
+
+    memo = {}
+    fingerprints = []
+    with _open_pdf(source) as handle:
+        for page in PDFPage.get_pages(handle, maxpages=max_pages + 1):
+            if len(fingerprints) == max_pages:
+                return fingerprints, True
+            try:
+                digest = hashlib.sha256(repr((page.mediabox, page.cropbox, page.rotate)).encode())
+                for stream in page.contents:
+                    digest.update(resolve1(stream).get_data())
+                _stable_digest(page.resources, digest, memo)
+                fingerprints.append(digest.hexdigest())
+            except Exception:
+                fingerprints.append(None)
+    return fingerprints, False
+
+
+def _extract_pages(source, indexes):
+    """Text of the given (sorted) page indexes; TextConverter ends each page with a form feed, as extract_text does."""
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    resources = PDFResourceManager()
+    laparams = LAParams()
+    wanted = set(indexes)
+    pages = []
+    with _open_pdf(source) as handle:
+        for page_number, page in enumerate(PDFPage.get_pages(handle, maxpages=max(indexes) + 1)):
+            if page_number not in wanted:
+                continue
+            output = io.StringIO()
+            device = TextConverter(resources, output, laparams=laparams)
+            PDFPageInterpreter(resources, device).process_page(page)
+            device.close()
+            pages.append(output.getvalue())
+    return pages
+
+
+# --- Caller side ---
+
+def _get_pool():
+    """Returns: (ProcessPoolExecutor, shared job start times, shared job pids)"""
+    global _pool, _pool_pid
+    pool = _pool
+    if pool is not None and _pool_pid == os.getpid():
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # spawn: the pool must not inherit locks or threads from a forked web worker
+            context = multiprocessing.get_context("spawn")
+            starts, pids = context.RawArray("d", JOB_SLOTS), context.RawArray("q", JOB_SLOTS)
+            executor = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS, mp_context=context,
+                                           initializer=_init_worker, initargs=(starts, pids))
+            _pool = (executor, starts, pids)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _retire_pool(pool):
+    """Stop sending jobs to pool (if it is still the current one); the next job starts a fresh pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool[0].shutdown(wait=False)
+
+
+def _job_timed_out(by_deadline):
+    with _stats_lock:
+        _stats["timeouts"] += 1
+    if by_deadline:
+        return deadlines.DeadlineExceeded("PDF extraction ran past the request deadline.")
+    return PDFExtractionTimeout(f"PDF extraction job exceeded {PDF_JOB_TIMEOUT:.0f}s")
+
+
+class _Job:
+    """
+    fn(*args) running in the pool. Its PDF_JOB_TIMEOUT counts from when a pool process
+    picks it up; the request deadline counts from the start. A job that overruns
+    PDF_JOB_TIMEOUT is killed along with its pool, and a job lost to a broken or
+    recycled pool is resubmitted once.
+    """
+
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+        self.resubmitted = False
+        with _stats_lock:
+            _stats["jobs"] += 1
+        self._submit()
+
+    def _submit(self):
+        self.pool = _get_pool()
+        executor, starts, _ = self.pool
+        self.slot = next(_slots) % JOB_SLOTS
+        starts[self.slot] = 0.0
+        self.future = executor.submit(_run_job, self.slot, self.fn, *self.args)
+
+    def cancel(self):
+        self.future.cancel()
+
+    def result(self):
+        while True:
+            try:
+                return self._wait()
+            except BrokenProcessPool:
+                _retire_pool(self.pool)
+                if self.resubmitted:
+                    raise
+                self.resubmitted = True
+                self._submit()
+
+    def _wait(self):
+        _, starts, pids = self.pool
+        while True:
+            started = starts[self.slot]
+            job_left = PDF_JOB_TIMEOUT - (time.time() - started) if started else None
+            request_left = deadlines.remaining()
+            if request_left is not None and request_left <= 0 and (job_left is None or request_left < job_left):
+                self.future.cancel()
+                raise _job_timed_out(True)
+            if job_left is not None and job_left <= 0:
+                self._recycle(pids[self.slot])
+                raise _job_timed_out(False)
+            waits = [left for left in (job_left, request_left) if left is not None]
+            if not started:
+                waits.append(JOB_START_POLL)
+            try:
+                return self.future.result(timeout=min(waits) if waits else None)
+            except FutureTimeoutError:
+                continue
+
+    def _recycle(self, pid):
+        """Kill the process stuck on this job and replace the pool."""
+        _retire_pool(self.pool)
+        with _stats_lock:
+            _stats["recycles"] += 1
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except (OSError, ValueError):
+            pass
+
+
+def _run(fn, *args):
+    """Run fn in the pool (or inline when PDF_EXTRACT_WORKERS=0) with the per-job timeout."""
+    if PDF_EXTRACT_WORKERS <= 0:
+        with _stats_lock:
+            _stats["jobs"] += 1
+        return fn(*args)
+    return _Job(fn, *args).result()
+
+
+def _read_source(source):
+    """Returns: (bytes, sha256 hex)"""
+    if isinstance(source, BufferedUpload):
+        return source.read_bytes(), source.sha256
+    with open_source(source) as handle:
+        data = handle.read()
+    return data, hashlib.sha256(data).hexdigest()
+
+
+def _spill(data):
+    """Write the PDF to a temp file for the pool's jobs to read. Returns: path"""
+    handle, path = tempfile.mkstemp(prefix="pdf-extract-", suffix=".pdf")
+    with os.fdopen(handle, "wb") as f:
+        f.write(data)
+    return path
+
+
+def truncation_notice(info):
+    """
+    Response fields for an extraction cut off at the page limit (see iter_pdf_pages' info).
+    Returns: dict ({} when the whole document was extracted)
+    """
+    if not info.get("truncated"):
+        return {}
+    return {"truncated": True, "pages_extracted": info["pages"], "max_pages": info["max_pages"]}
+
+
+def iter_pdf_pages(source, max_pages=None, info=None):
+    """
+    Yield the text of each page of a PDF (path, bytes, BufferedUpload or binary file),
+    in order, as soon as the page-range job containing it finishes.
+    At most max_pages (default PDF_MAX_PAGES) pages are extracted. Once the pages are
+    exhausted, info (a dict, if given) holds 'pages' (extracted), 'max_pages' and
+    'truncated' (True if the document had more pages than that).
+    Raises PDFExtractionTimeout if a job takes longer than PDF_JOB_TIMEOUT, or
+    deadlines.DeadlineExceeded if the request deadline passes first.
+    """
+    max_pages = PDF_MAX_PAGES if max_pages is None else max_pages
+    info = {} if info is None else info
+    data, sha256 = _read_source(source)
+    cache_key = f"{sha256}:{max_pages}"
+    cached = pdf_text_cache.get(cache_key)
+    if isinstance(cached, dict): # Entries from before the truncation flag are lists; extract those again
+        yield from cached["pages"]
+        info.update(pages=len(cached["pages"]), max_pages=max_pages, truncated=cached["truncated"])
+        return
+
+    started = time.perf_counter()
+    pooled = PDF_EXTRACT_WORKERS > 0
+    pdf = _spill(data) if pooled else data
+    try:
+        if PDF_PAGE_CACHE_ENABLED:
+            fingerprints, truncated = _run(_page_fingerprints, pdf, max_pages)
+        else:
+            total = _run(_count_pages, pdf)
+            fingerprints, truncated = [None] * min(total, max_pages), total > max_pages
+        page_count = len(fingerprints)
+        known = {}
+        for index, fingerprint in enumerate(fingerprints):
+            text = pdf_page_cache.get(fingerprint) if fingerprint else None
+            if text is not None:
+                known[index] = text
+        missing = [index for index in range(page_count) if index not in known]
+        # Jobs take the missing pages PDF_PAGES_PER_JOB at a time, in page order
+        groups = [missing[i:i + PDF_PAGES_PER_JOB] for i in range(0, len(missing), PDF_PAGES_PER_JOB)]
+        job_of = {index: number for number, group in enumerate(groups) for index in group}
+
+        pages = []
+        jobs = [_Job(_extract_pages, pdf, group) for group in groups] if pooled else []
+        try:
+            results = {}
+            for index in range(page_count):
+                if index in known:
+                    page = known[index]
+                else:
+                    number = job_of[index]
+                    if number not in results:
+                        results[number] = jobs[number].result() if jobs else _run(_extract_pages, pdf, groups[number])
+                        for page_index, text in zip(groups[number], results[number]):
+                            if fingerprints[page_index]:
+                                pdf_page_cache.set(fingerprints[page_index], text)
+                    page = results[number][groups[number].index(index)]
+                pages.append(page)
+                yield page
+        finally:
+            for job in jobs:
+                job.cancel()
+    except Exception:
+        with _stats_lock:
+            _stats["failures"] += 1
+        raise
+    finally:
+        if pooled:
+            try:
+                os.remove(pdf)
+            except OSError:
+                pass
+
+    pdf_text_cache.set(cache_key, {"pages": pages, "truncated": truncated})
+    info.update(pages=len(pages), max_pages=max_pages, truncated=truncated)
+    elapsed = time.perf_counter() - started
+    metrics.observe_stage("pdf_extract", elapsed)
+    with _stats_lock:
+        _stats["documents"] += 1
+        _stats["pages"] += len(pages)
+        _stats["pages_reused"] += len(known)
+        _stats["truncated"] += int(truncated)
+        _stats["extract_seconds"] += elapsed
+
+
+def extract_pdf_text(source, max_pages=None, info=None):
+    """
+    Full text of a PDF through the shared extraction service (pages separated by form feeds).
+    info: see iter_pdf_pages.
+    Returns: str
+    """
+    return "".join(iter_pdf_pages(source, max_pages=max_pages, info=info))
+
+
+def extraction_stats():
+    """Extraction counters plus text cache stats, suitable for JSON."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["extract_seconds"] = round(stats["extract_seconds"], 3)
+    stats.update({
+        "workers": PDF_EXTRACT_WORKERS,
+        "max_pages": PDF_MAX_PAGES,
+        "pages_per_job": PDF_PAGES_PER_JOB,
+        "job_timeout_seconds": PDF_JOB_TIMEOUT,
+        "cache": pdf_text_cache.stats(),
+        "page_cache": pdf_page_cache.stats() if pdf_page_cache is not None else {"enabled": False},
+    })
+    return stats
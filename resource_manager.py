@@ -0,0 +1,208 @@
+# resource_manager.py
+#
+# CPU budgeting and admission control for deepfake inference.
+#   - Thread budget: each gunicorn worker gets its share of the cores for PyTorch's
+#     intra-op pool (cores // WEB_CONCURRENCY unless TORCH_INTRA_OP_THREADS is set)
+#     and a single inter-op thread, instead of every worker sizing its pools to the
+#     whole machine and oversubscribing it when they all run a forward pass at once.
+#     Applied in each worker after the fork (gunicorn.conf.py) or at app import.
+#   - Admission control: /detect classifier work is admitted against an estimate of
+#     how long it would wait. Cache hits never reach the controller; a request is
+#     admitted after its cache lookup misses, and a clip per frame batch, charged the
+#     frames actually scored. The controller counts images admitted but not finished
+#     (the inference queue depth) and measures throughput as images finished per
+#     second of busy time, so the estimate (depth + cost) / throughput covers
+#     batching and forward passes and adapts to the active backend. A request whose
+#     estimate exceeds INFERENCE_SLO_TARGET of INFERENCE_SLO_MS is shed with a fast 503 and a Retry-After
+#     for the time the current queue needs to drain, instead of queueing behind it.
+#     Only requests running on a server thread are counted, so the server needs
+#     more threads than the queue the SLO allows (see gunicorn.conf.py).
+# Like the LLM limits, everything here is per process.
+
+import math
+import os
+import threading
+import time
+
+import metrics
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+TORCH_INTRA_OP_THREADS = int(os.getenv("TORCH_INTRA_OP_THREADS", "0")) # 0 = cores // workers
+TORCH_INTER_OP_THREADS = int(os.getenv("TORCH_INTER_OP_THREADS", "1"))
+LOAD_SHEDDING = os.getenv("LOAD_SHEDDING", "1").lower() not in ("0", "false", "no")
+INFERENCE_SLO_MS = float(os.getenv("INFERENCE_SLO_MS", "2000"))
+# Admit while the estimate stays under this share of the SLO; the rest absorbs estimate error and variance
+INFERENCE_SLO_TARGET = float(os.getenv("INFERENCE_SLO_TARGET", "0.8"))
+INFERENCE_MAX_QUEUE = int(os.getenv("INFERENCE_MAX_QUEUE", "0")) # Hard cap on queued images; 0 = only the SLO applies
+SHED_MIN_SAMPLES = int(os.getenv("SHED_MIN_SAMPLES", "10")) # Finished images before the throughput estimate is trusted
+THROUGHPUT_HALF_LIFE = float(os.getenv("THROUGHPUT_HALF_LIFE", "5")) # Seconds of busy time
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def _available_cores():
+    try:
+        return len(os.sched_getaffinity(0)) # Honors taskset / container CPU sets
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+def thread_budget(workers=None):
+    """
+    Threads this worker process may use for inference. workers defaults to WEB_CONCURRENCY.
+    Returns: dict with 'intra_op', 'inter_op', 'cores', 'workers' and 'applied'
+    """
+    if _budget is not None and _budget["pid"] == os.getpid():
+        return {key: value for key, value in _budget.items() if key != "pid"}
+    cores = _available_cores()
+    workers = max(1, workers or int(os.getenv("WEB_CONCURRENCY", "1")))
+    intra = TORCH_INTRA_OP_THREADS or max(1, cores // workers)
+    return {"intra_op": intra, "inter_op": max(1, TORCH_INTER_OP_THREADS), "cores": cores, "workers": workers, "applied": False}
+
+
+def apply_thread_budget(workers=None):
+    """
+    Size this process's PyTorch thread pools to its budget. Call once per worker,
+    after the fork and before the first forward pass. Without torch it only records the budget.
+    Returns: dict (see thread_budget)
+    """
+    global _budget
+    with _budget_lock:
+        if _budget is not None and _budget["pid"] == os.getpid():
+            return thread_budget()
+        budget = dict(thread_budget(workers), applied=False, pid=os.getpid())
+        try:
+            import torch
+        except ImportError:
+            _budget = budget
+            return thread_budget()
+        torch.set_num_threads(budget["intra_op"])
+        try:
+            torch.set_num_interop_threads(budget["inter_op"])
+        except RuntimeError:
+            # Only settable before the inter-op pool starts (e.g. a forward pass ran in the preloading master)
+            logger.warning("PyTorch inter-op threads were already started; keeping their count.")
+            budget["inter_op"] = torch.get_num_interop_threads()
+        budget["applied"] = True
+        _budget = budget
+    logger.info(f"Inference thread budget: {budget['intra_op']} intra-op / {budget['inter_op']} inter-op "
+                f"threads ({budget['cores']} cores, {budget['workers']} workers)")
+    return thread_budget()
+
+
+class Overloaded(Exception):
+    """The request would miss the latency SLO; retry_after is in whole seconds."""
+
+    def __init__(self, estimated_ms, slo_ms, retry_after):
+        super().__init__(f"Estimated wait {estimated_ms:.0f} ms exceeds the {slo_ms:.0f} ms SLO")
+        self.estimated_ms = estimated_ms
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, slo_ms=INFERENCE_SLO_MS, target=INFERENCE_SLO_TARGET, max_queue=INFERENCE_MAX_QUEUE,
+                 enabled=LOAD_SHEDDING, min_samples=SHED_MIN_SAMPLES, half_life=THROUGHPUT_HALF_LIFE):
+        self.slo_ms = slo_ms
+        self.target = target
+        self.max_queue = max_queue
+        self.enabled = enabled
+        self.min_samples = min_samples
+        self.half_life = half_life
+        self._lock = threading.Lock()
+        self._depth = 0
+        self._changed = time.monotonic()
+        # Exponentially decayed over busy time, so the rate follows the current load and backend
+        self._busy_seconds = 0.0
+        self._finished = 0.0
+        self._samples = 0
+        self._stats = {"admitted": 0, "shed": 0, "completed": 0}
+
+    def _advance(self, now):
+        """Account busy time since the last change (caller holds the lock)."""
+        elapsed = now - self._changed
+        self._changed = now
+        if self._depth and elapsed > 0:
+            decay = 0.5 ** (elapsed / self.half_life)
+            self._busy_seconds = self._busy_seconds * decay + elapsed
+            self._finished *= decay
+
+    def _throughput(self):
+        """Images finished per busy second, or None until there are enough samples."""
+        if self._samples < self.min_samples or self._busy_seconds <= 0:
+            return None
+        return self._finished / self._busy_seconds
+
+    def admit(self, cost=1, force=False):
+        """
+        Admit a request of cost images, or raise Overloaded. Pair with release(cost).
+        force=True admits without the SLO check, for the rest of work already admitted
+        (the later frame batches of a clip), which shedding halfway would only waste.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._advance(now)
+            throughput = self._throughput()
+            if self.enabled and self._depth and not force:
+                # An idle worker always admits, so the estimate can never lock it out
+                estimated = (self._depth + cost) / throughput * 1000 if throughput else 0.0
+                if estimated > self.slo_ms * self.target or (self.max_queue and self._depth + cost > self.max_queue):
+                    self._stats["shed"] += 1
+                    drain_ms = self._depth / throughput * 1000 if throughput else self.slo_ms
+                    metrics.count("load_shed")
+                    raise Overloaded(estimated, self.slo_ms, max(1, math.ceil(drain_ms / 1000)))
+            self._depth += cost
+            self._stats["admitted"] += 1
+
+    def release(self, cost=1):
+        with self._lock:
+            self._advance(time.monotonic())
+            self._depth -= cost
+            self._finished += cost
+            self._samples += cost
+            self._stats["completed"] += 1
+
+    def slot(self, cost=1, force=False):
+        """Context manager around admit/release."""
+        return _Slot(self, cost, force)
+
+    def stats(self):
+        with self._lock:
+            self._advance(time.monotonic())
+            throughput = self._throughput()
+            return dict(
+                self._stats,
+                enabled=self.enabled,
+                slo_ms=self.slo_ms,
+                slo_target=self.target,
+                max_queue=self.max_queue,
+                queue_depth=self._depth,
+                throughput_per_second=round(throughput, 2) if throughput else None,
+                estimated_wait_ms=round(self._depth / throughput * 1000, 1) if throughput else None,
+                thread_budget=thread_budget(),
+            )
+
+
+class _Slot:
+    def __init__(self, controller, cost, force=False):
+        self.controller = controller
+        self.cost = cost
+        self.force = force
+
+    def __enter__(self):
+        self.controller.admit(self.cost, self.force)
+        return self
+
+    def __exit__(self, *exc):
+        self.controller.release(self.cost)
+        return False
+
+
+inference_admission = AdmissionController()
+
+
+def admission_stats():
+    """Returns: dict (JSON serializable)"""
+    return inference_admission.stats()
@@ -0,0 +1,239 @@
+# result_cache.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+
+class MemoryLRU:
+    """
+    In-process LRU cache with an entry limit and per-entry expiry.
+    Values are stored as-is; callers should treat them as read-only.
+    """
+
+    def __init__(self, max_entries=1024, default_ttl=3600):
+        self.max_entries = max(1, int(max_entries))
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()  # key -> (expires_at or None, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SqliteTier:
+    """
+    On-disk cache tier backed by a single SQLite table.
+    Survives restarts and can be shared by several worker processes on one host.
+    Values must be JSON serializable.
+    """
+
+    def __init__(self, path, table="cache"):
+        self.path = path
+        self.table = table
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, created_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per call keeps this safe across threads and forks.
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= time.time():
+                conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, created_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, now),
+            )
+
+    def delete(self, key):
+        with self._connect() as conn:
+            return conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,)).rowcount > 0
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.table}")
+
+    def purge_expired(self):
+        with self._connect() as conn:
+            return conn.execute(
+                f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            ).rowcount
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class TieredCache:
+    """
+    Memory LRU in front of an optional SqliteTier.
+    Disk hits are promoted into memory. Failures in the disk tier are logged and
+    treated as misses so a broken cache never breaks a request.
+    """
+
+    def __init__(self, name, max_entries=1024, ttl=3600, db_path=None, table=None):
+        self.name = name
+        self.ttl = ttl
+        self.memory = MemoryLRU(max_entries=max_entries, default_ttl=ttl)
+        self.disk = None
+        if db_path:
+            try:
+                self.disk = SqliteTier(db_path, table=table or name)
+            except Exception as e:
+                logger.warning(f"Could not open {name} cache database '{db_path}'. Using memory only. Error: {e}")
+        self._lock = threading.Lock()
+        self._hits = {"memory": 0, "disk": 0}
+        self._misses = 0
+        self._sets = 0
+
+    def get(self, key, count_miss=True):
+        """count_miss=False leaves a miss uncounted, for a probe that a later lookup will count."""
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory")
+            return value
+        if self.disk is not None:
+            try:
+                value = self.disk.get(key)
+            except Exception as e:
+                logger.warning(f"{self.name} cache disk read failed: {e}")
+                value = None
+            if value is not None:
+                self.memory.set(key, value)
+                self._count("disk")
+                return value
+        if count_miss:
+            self._count(None)
+        return None
+
+    def get_any(self, keys):
+        """
+        First hit among several keys for the same item, counted as a single lookup.
+        Returns: (key, value) or (None, None)
+        """
+        for key in keys:
+            value = self.get(key, count_miss=False)
+            if value is not None:
+                return key, value
+        self._count(None)
+        return None, None
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.memory.set(key, value, ttl=ttl)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value, ttl=ttl)
+            except Exception as e:
+                logger.warning(f"{self.name} cache disk write failed: {e}")
+        with self._lock:
+            self._sets += 1
+
+    def delete(self, key):
+        removed = self.memory.delete(key)
+        if self.disk is not None:
+            try:
+                removed = self.disk.delete(key) or removed
+            except Exception as e:
+                logger.warning(f"{self.name} cache disk delete failed: {e}")
+        return removed
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            try:
+                self.disk.clear()
+            except Exception as e:
+                logger.warning(f"{self.name} cache disk clear failed: {e}")
+
+    def _count(self, tier):
+        with self._lock:
+            if tier is None:
+                self._misses += 1
+            else:
+                self._hits[tier] += 1
+
+    def stats(self):
+        with self._lock:
+            hits = self._hits["memory"] + self._hits["disk"]
+            lookups = hits + self._misses
+            stats = {
+                "name": self.name,
+                "memory_entries": len(self.memory),
+                "memory_max_entries": self.memory.max_entries,
+                "ttl_seconds": self.ttl,
+                "disk_enabled": self.disk is not None,
+                "hits_memory": self._hits["memory"],
+                "hits_disk": self._hits["disk"],
+                "misses": self._misses,
+                "sets": self._sets,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+        if self.disk is not None:
+            try:
+                stats["disk_entries"] = len(self.disk)
+            except Exception:
+                stats["disk_entries"] = None
+        return stats
@@ -0,0 +1,85 @@
+# structured_logging.py
+#
+# One JSON object per log line, tagged with the id of the HTTP request being
+# served. The id comes from the X-Request-ID header (or is generated) and lives
+# in a contextvar, so it follows the request through helpers and, when work is
+# submitted with contextvars.copy_context(), into pool threads.
+# LOG_FORMAT=text gives plain human-readable lines instead; LOG_LEVEL sets the level.
+
+import contextvars
+import json
+import logging
+import os
+import time
+import uuid
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+_configured = False
+
+
+def new_request_id(incoming=None):
+    """Use a sane incoming X-Request-ID, or generate one. Sets it for the current context."""
+    request_id = incoming if incoming and len(incoming) <= 128 and incoming.isprintable() else uuid.uuid4().hex
+    request_id_var.set(request_id)
+    return request_id
+
+
+def current_request_id():
+    return request_id_var.get()
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Fields passed as extra={"fields": {...}} are merged into the JSON object."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        request = f" [{record.request_id}]" if getattr(record, "request_id", None) else ""
+        fields = getattr(record, "fields", None)
+        extra = " " + " ".join(f"{key}={value}" for key, value in fields.items()) if fields else ""
+        line = f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created))} {record.levelname} {record.name}{request}: {record.getMessage()}{extra}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def configure_logging():
+    """Install the structured handler on the root logger once (idempotent)."""
+    global _configured
+    if _configured:
+        return
+    # Read here rather than at import so a .env loaded by the caller is honoured
+    handler = logging.StreamHandler()
+    handler.addFilter(_RequestIdFilter())
+    handler.setFormatter(TextFormatter() if os.getenv("LOG_FORMAT", "json").lower() == "text" else JsonFormatter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    _configured = True
+
+
+def get_logger(name):
+    configure_logging()
+    return logging.getLogger(name)
@@ -0,0 +1,109 @@
+# uploads.py
+
+import hashlib
+import io
+import os
+import tempfile
+from contextlib import contextmanager
+
+import metrics
+
+# Uploads up to this size stay in memory; larger ones spill to an anonymous temp file
+UPLOAD_SPOOL_THRESHOLD = int(os.getenv("UPLOAD_SPOOL_THRESHOLD", str(2 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class BufferedUpload:
+    """
+    An uploaded file held in memory (or a spooled temp file once it grows past the
+    threshold), plus the SHA-256 and size computed while it streamed in.
+    """
+
+    def __init__(self, stream, sha256, size, filename=None):
+        self.stream = stream
+        self.sha256 = sha256
+        self.size = size
+        self.filename = filename
+
+    def open(self):
+        """Rewind and return the underlying binary stream."""
+        self.stream.seek(0)
+        return self.stream
+
+    def read_bytes(self):
+        return self.open().read()
+
+    def close(self):
+        with metrics.timed("cleanup"):
+            try:
+                self.stream.close()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def buffer_upload(file_storage, spool_threshold=None):
+    """
+    Copy a werkzeug FileStorage (or any object with a binary .stream/.read) into a
+    SpooledTemporaryFile without touching the uploads folder, hashing as it goes.
+    Returns: BufferedUpload
+    """
+    threshold = UPLOAD_SPOOL_THRESHOLD if spool_threshold is None else spool_threshold
+    source = getattr(file_storage, "stream", file_storage)
+    spooled = tempfile.SpooledTemporaryFile(max_size=threshold, mode="w+b")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with metrics.timed("upload_buffer"):
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                spooled.write(chunk)
+                size += len(chunk)
+    except Exception:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return BufferedUpload(spooled, digest.hexdigest(), size, getattr(file_storage, "filename", None))
+
+
+def is_path(source):
+    return isinstance(source, (str, os.PathLike))
+
+
+def describe_source(source):
+    """Short label for log messages: the path, or the kind of in-memory object."""
+    if is_path(source):
+        return str(source)
+    if isinstance(source, BufferedUpload):
+        return source.filename or f"upload sha256={source.sha256[:12]}"
+    return f"<{type(source).__name__}>"
+
+
+@contextmanager
+def open_source(source):
+    """
+    Yield a readable binary file object for a path, bytes-like object, BufferedUpload
+    or already-open binary file. Only files opened here are closed on exit.
+    """
+    if is_path(source):
+        with open(source, "rb") as handle:
+            yield handle
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        yield io.BytesIO(bytes(source))
+    elif isinstance(source, BufferedUpload):
+        yield source.open()
+    else:
+        if hasattr(source, "seek"):
+            try:
+                source.seek(0)
+            except Exception:
+                pass
+        yield source